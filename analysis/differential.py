@@ -0,0 +1,223 @@
+'''
+Precomputed differential expression over the strain tables.
+
+For every strain, one vectorized pass over its snapshot computes per-gene log2 fold changes for
+each CONTRASTS entry (flight vs ground control vs vivarium at 25 and 75 days). For the genes shared
+by two strains, the cross-strain deltas are the difference of their fold changes (first strain
+minus second). Every contrast also gets a full descending rank order, so "top N up/down-regulated
+genes" is a slice of a precomputed index array instead of a sort per request.
+
+The results are saved to ANALYSIS_DIR/differential.npz together with the snapshot states they were
+computed from. ensure_results() recomputes only when one of those snapshots changed. The webapp
+refreshes them in the background; build them ahead of a deploy with
+
+    python -m analysis.differential
+'''
+import argparse
+import json
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from database.snapshot import ensure_snapshot
+from database.strains import STRAINS
+
+ANALYSIS_DIR = os.getenv("ANALYSIS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'analysis'))
+RESULTS_FILE = 'differential.npz'
+
+# Added before taking log2 so genes with near-zero expression do not dominate the rankings
+PSEUDOCOUNT = 1.0
+
+# Contrast name -> (numerator column, denominator column)
+CONTRASTS = {}
+for _days in ('25days', '75days'):
+    CONTRASTS[f"flt_vs_gc_{_days}"] = (f"flt_{_days}_avg", f"gc_{_days}_avg")
+    CONTRASTS[f"flt_vs_viv_{_days}"] = (f"flt_{_days}_avg", f"viv_{_days}_avg")
+    CONTRASTS[f"gc_vs_viv_{_days}"] = (f"gc_{_days}_avg", f"viv_{_days}_avg")
+
+DIRECTIONS = ('up', 'down')
+
+
+def log2_fold_changes(values, columns):
+    """(n_genes, n_contrasts) matrix of log2 fold changes for every CONTRASTS entry."""
+    logs = np.log2(np.asarray(values, dtype=np.float64) + PSEUDOCOUNT)
+    numerators = [columns.index(a) for a, _ in CONTRASTS.values()]
+    denominators = [columns.index(b) for _, b in CONTRASTS.values()]
+    return logs[:, numerators] - logs[:, denominators]
+
+
+def rank_order(scores):
+    """(n_contrasts, n_genes) int32 row indexes sorted by descending score, NaNs last, plus valid counts."""
+    keyed = np.where(np.isnan(scores), np.inf, -scores)
+    order = np.argsort(keyed, axis=0, kind='stable').T.astype(np.int32)
+    return np.ascontiguousarray(order), (~np.isnan(scores)).sum(axis=0)
+
+
+def compute_group(ids, lfc, mean_log2):
+    order, valid = rank_order(lfc)
+    return {'ids': ids, 'lfc': lfc, 'mean_log2': mean_log2, 'order': order, 'valid': valid}
+
+
+def compute_results(snapshots):
+    """Compute every strain group and cross-strain group from {strain: Snapshot}."""
+    groups = {}
+    for strain, snapshot in snapshots.items():
+        logs = np.log2(np.asarray(snapshot.values) + PSEUDOCOUNT)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # genes without any measurement
+            mean_log2 = np.nanmean(logs, axis=1)
+        groups[strain] = compute_group(np.asarray(snapshot.ids), log2_fold_changes(snapshot.values, snapshot.columns),
+                                       mean_log2)
+
+    strains = list(snapshots)
+    for i, first in enumerate(strains):
+        for second in strains[i + 1:]:
+            a, b = groups[first], groups[second]
+            ids, ia, ib = np.intersect1d(a['ids'], b['ids'], assume_unique=True, return_indices=True)
+            groups[f"{first}_vs_{second}"] = compute_group(
+                ids, a['lfc'][ia] - b['lfc'][ib], (a['mean_log2'][ia] + b['mean_log2'][ib]) / 2)
+    return groups
+
+
+class DifferentialResults:
+    """Loaded results with millisecond top-k queries."""
+
+    def __init__(self, groups, source):
+        self.groups = groups
+        self.source = source
+        self.contrasts = list(CONTRASTS)
+
+    def top(self, group, contrast, n=20, direction='up'):
+        """The n most up- or down-regulated genes of a group for a contrast, as dicts."""
+        data = self.groups[group]
+        column = self.contrasts.index(contrast)
+        valid = int(data['valid'][column])
+        ranked = data['order'][column, :valid]
+        rows = ranked[:n] if direction == 'up' else ranked[::-1][:n]
+        return [{
+            'ensembl_id': str(data['ids'][row]),
+            'log2_fold_change': float(data['lfc'][row, column]),
+            'mean_log2_expression': float(data['mean_log2'][row]),
+            'rank': i + 1 if direction == 'up' else valid - i,  # 1 = most up-regulated
+        } for i, row in enumerate(rows.tolist())]
+
+    def save(self, path):
+        arrays = {'source': np.array(json.dumps(self.source, sort_keys=True))}
+        for group, data in self.groups.items():
+            for name, array in data.items():
+                arrays[f"{group}/{name}"] = array
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as archive:
+            source = json.loads(str(archive['source']))
+            groups = {}
+            for key in archive.files:
+                if key != 'source':
+                    group, name = key.split('/')
+                    groups.setdefault(group, {})[name] = archive[key]
+        return cls(groups, source)
+
+
+def results_path():
+    return os.path.join(ANALYSIS_DIR, RESULTS_FILE)
+
+
+def ensure_results(force=False):
+    """Return current results, recomputing them only if a strain snapshot changed."""
+    snapshots = {strain: ensure_snapshot(config['table']) for strain, config in STRAINS.items()}
+    source = {strain: snapshot.meta.get('state') for strain, snapshot in snapshots.items()}
+    path = results_path()
+    if not force and os.path.exists(path):
+        results = DifferentialResults.load(path)
+        if results.source == json.loads(json.dumps(source, sort_keys=True)):
+            return results
+    results = DifferentialResults(compute_results(snapshots), source)
+    os.makedirs(ANALYSIS_DIR, exist_ok=True)
+    results.save(path)
+    return results
+
+
+def load_saved_results():
+    """The results saved in ANALYSIS_DIR, without checking them against the database, or None."""
+    path = results_path()
+    return DifferentialResults.load(path) if os.path.exists(path) else None
+
+
+_results = None
+_checked_at = 0.0
+_results_lock = threading.Lock()
+# Held while the first results of the process are loaded or built, so only one thread does it
+_build_lock = threading.Lock()
+
+
+def _refresh():
+    global _results
+    try:
+        results = ensure_results()
+    except Exception as e:
+        print(f"Could not refresh the analysis results, serving the previous ones: {e}")
+        return
+    with _results_lock:
+        _results = results
+
+
+def get_results(max_age=60):
+    """Process-wide results, re-checked against the snapshots at most every max_age seconds.
+
+    Checking the snapshots can mean database queries and a full export, so it never runs under
+    _results_lock or in the request that finds the results stale: that request is answered from
+    the previous results while a background thread refreshes them. Only the first call of a process
+    waits, and it starts from the results saved on disk (`python -m analysis.differential` builds
+    them offline) when there are any.
+    """
+    global _results, _checked_at
+    with _results_lock:
+        results = _results
+        stale = results is not None and time.monotonic() - _checked_at > max_age
+        if stale:
+            # Claim the refresh so concurrent requests do not start one each
+            _checked_at = time.monotonic()
+    if stale:
+        threading.Thread(target=_refresh, name='analysis-refresh', daemon=True).start()
+    if results is not None:
+        return results
+
+    with _build_lock:
+        with _results_lock:
+            if _results is not None:
+                return _results
+        results = load_saved_results()
+        checked_at = 0.0  # saved results are checked against the snapshots on the next call
+        if results is None:
+            results = ensure_results()
+            checked_at = time.monotonic()
+        with _results_lock:
+            _results, _checked_at = results, checked_at
+        return results
+
+
+def invalidate_results(tables=None):
+    """Force the next get_results() call to check the snapshots again."""
+    global _checked_at
+    with _results_lock:
+        _checked_at = 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the differential expression results.")
+    parser.add_argument('--force', action='store_true', help="recompute even if the snapshots did not change")
+    args = parser.parse_args(argv)
+
+    results = ensure_results(force=args.force)
+    print(f"Differential expression of {len(results.groups)} groups saved to {results_path()}")
+
+
+if __name__ == '__main__':
+    main()
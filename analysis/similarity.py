@@ -0,0 +1,198 @@
+'''
+Expression-profile similarity search: "genes that respond like this one".
+
+Every gene of a strain has a 7-value profile (bsl_0days_avg ... viv_75days_avg). The profiles are
+log2 transformed and normalized once per snapshot into a contiguous float32 matrix:
+- pearson: each profile is centred and scaled to unit length, so a dot product is the Pearson
+  correlation of the two genes across the conditions
+- cosine: each log profile is scaled to unit length, so a dot product is the cosine similarity
+
+A query is then one BLAS matrix-vector product over every gene plus an argpartition for the top k,
+a few milliseconds for the full genome. Genes with missing values or a flat profile have no
+meaningful correlation and are left out of the results.
+
+The matrix is saved next to the snapshot it was built from (SNAPSHOT_DIR/<table>/) with that
+snapshot's state. Loading memory-maps it, and ensure_index() only rebuilds it when the snapshot was
+re-exported. get_index() never does that on the caller's thread: it serves the last index it has
+and checks the snapshot in the background, and returns None until the first index is available.
+'''
+import json
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from analysis.differential import PSEUDOCOUNT
+from database.snapshot import ensure_snapshot, has_snapshot, load_snapshot, snapshot_path
+from database.strains import STRAINS
+
+SIMILARITY_METRICS = ('pearson', 'cosine')
+
+
+def index_files(table_name, metric):
+    """Paths of the (vectors, metadata) files of a table's index for metric."""
+    stem = os.path.join(snapshot_path(table_name), f"similarity_{metric}")
+    return stem + '.npy', stem + '.json'
+
+
+def normalize_profiles(values, metric='pearson'):
+    """(n, m) float32 matrix of unit-length rows; rows that cannot be compared are all zeros."""
+    if metric not in SIMILARITY_METRICS:
+        raise ValueError(f"Unknown metric: {metric}. Expected one of {SIMILARITY_METRICS}")
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # negative values and missing measurements
+        logs = np.log2(np.asarray(values, dtype=np.float64) + PSEUDOCOUNT)
+    if metric == 'pearson':
+        logs = logs - logs.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(logs, axis=1, keepdims=True)
+    usable = np.isfinite(norms) & (norms > 1e-12)
+    vectors = np.where(usable, logs / np.where(usable, norms, 1.0), 0.0)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+class SimilarityIndex:
+    """Normalized profiles of one table, aligned with the rows of its snapshot."""
+
+    def __init__(self, ids, vectors, metric, state):
+        self.ids = ids
+        self.vectors = vectors
+        self.metric = metric
+        self.state = state
+        self.valid = np.any(vectors != 0, axis=1)
+
+    @classmethod
+    def build(cls, snapshot, metric='pearson'):
+        return cls(snapshot.ids, normalize_profiles(snapshot.values, metric), metric, snapshot.meta.get('state'))
+
+    def save(self, table_name):
+        vectors_path, meta_path = index_files(table_name, self.metric)
+        tmp_path = f"{vectors_path}.tmp-{os.getpid()}.npy"
+        np.save(tmp_path, self.vectors)
+        os.replace(tmp_path, vectors_path)
+        with open(meta_path, 'w') as file:
+            json.dump({'table': table_name, 'metric': self.metric, 'rows': len(self.vectors),
+                       'state': self.state}, file, indent=2)
+
+    @classmethod
+    def load(cls, snapshot, metric='pearson', mmap=True):
+        """The saved index of snapshot's table, or None if it is missing or built from older data."""
+        vectors_path, meta_path = index_files(snapshot.table, metric)
+        if not os.path.exists(meta_path) or not os.path.exists(vectors_path):
+            return None
+        with open(meta_path) as file:
+            meta = json.load(file)
+        if meta.get('state') != snapshot.meta.get('state') or meta.get('rows') != len(snapshot):
+            return None
+        vectors = np.load(vectors_path, mmap_mode='r' if mmap else None)
+        return cls(snapshot.ids, vectors, metric, meta['state'])
+
+    def __contains__(self, ensembl_id):
+        return self.row(ensembl_id) >= 0
+
+    def row(self, ensembl_id):
+        """Row of ensembl_id, or -1 if it is absent or has no usable profile."""
+        if len(self.ids) == 0:
+            return -1
+        position = min(int(np.searchsorted(self.ids, ensembl_id)), len(self.ids) - 1)
+        if self.ids[position] != ensembl_id or not self.valid[position]:
+            return -1
+        return position
+
+    def similar(self, ensembl_id, k=10):
+        """The k genes whose profiles are most similar to ensembl_id's, best first, as dicts.
+
+        Raises KeyError if the gene is absent or has no usable profile.
+        """
+        row = self.row(ensembl_id)
+        if row < 0:
+            raise KeyError(ensembl_id)
+        scores = self.vectors @ self.vectors[row]
+        scores[~self.valid] = -np.inf
+        scores[row] = -np.inf
+        k = max(0, min(k, int(self.valid.sum()) - 1))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [{'ensembl_id': str(self.ids[i]), 'score': float(scores[i])} for i in top.tolist()]
+
+
+def ensure_index(table_name, metric='pearson'):
+    """Return a current index of table_name, rebuilding it only if its snapshot changed."""
+    snapshot = ensure_snapshot(table_name)
+    index = SimilarityIndex.load(snapshot, metric)
+    if index is None:
+        index = SimilarityIndex.build(snapshot, metric)
+        index.save(table_name)
+    return index
+
+
+def load_saved_index(table_name, metric='pearson'):
+    """The index saved next to table_name's local snapshot, or None; never queries the database."""
+    if not has_snapshot(table_name):
+        return None
+    return SimilarityIndex.load(load_snapshot(table_name), metric)
+
+
+_indexes = {}  # (strain, metric) -> (index or None, checked_at)
+_indexes_lock = threading.Lock()
+# (strain, metric) -> lock held while that index is loaded or rebuilt, so other indexes stay available
+_build_locks = {}
+
+
+def _build_lock(key):
+    with _indexes_lock:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def _refresh(strain, metric):
+    key = (strain, metric)
+    with _build_lock(key):
+        try:
+            index = ensure_index(STRAINS[strain]['table'], metric)
+        except Exception as e:
+            print(f"Could not refresh the {metric} similarity index of {strain}: {e}")
+            return
+        with _indexes_lock:
+            _indexes[key] = (index, time.monotonic())
+
+
+def get_index(strain, metric='pearson', max_age=60):
+    """Process-wide index of a strain, or None while its first index is still being built.
+
+    The first call of a process only loads the index saved next to the local snapshot. Checking the
+    snapshot against the version stamp (and rebuilding the index when it changed) runs in a
+    background thread at most every max_age seconds, while callers get the previous index.
+    """
+    key = (strain, metric)
+    with _indexes_lock:
+        loaded = key in _indexes
+    if not loaded:
+        with _build_lock(key):
+            with _indexes_lock:
+                loaded = key in _indexes
+            if not loaded:
+                index = load_saved_index(STRAINS[strain]['table'], metric)
+                with _indexes_lock:
+                    _indexes[key] = (index, 0.0)  # checked against the snapshot right away
+
+    with _indexes_lock:
+        index, checked_at = _indexes[key]
+        stale = time.monotonic() - checked_at > max_age
+        if stale:
+            # Claim the refresh so concurrent requests do not start one each
+            _indexes[key] = (index, time.monotonic())
+    if stale:
+        threading.Thread(target=_refresh, args=key, name='similarity-refresh', daemon=True).start()
+    return index
+
+
+def invalidate_indexes(tables=None):
+    """Make the next get_index() call for the given tables (default: all) check the snapshots."""
+    with _indexes_lock:
+        for strain, metric in list(_indexes):
+            if tables is None or STRAINS[strain]['table'] in tables:
+                index, _ = _indexes[(strain, metric)]
+                _indexes[(strain, metric)] = (index, 0.0)
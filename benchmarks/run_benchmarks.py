@@ -0,0 +1,392 @@
+'''
+Benchmarks of every pipeline stage on synthetic OSD-253-shaped data.
+
+For each requested scale (a multiple of the 29,048 genes of the real study) the runner generates
+synthetic data with synthetic.py in a scratch directory and times:
+- preprocess: replicate averaging of the raw matrix (preprocessing/pipeline.py)
+- load: the COPY-based CSV loader (preprocessing/bulk_loader.py)                [--database]
+- fetch: streaming table reads and snapshot export (database/readers.py, snapshot.py)  [--database]
+- snapshot: opening the memory-mapped snapshots and scanning every value
+- train: train_artifact() on one strain, without the artifact cache
+- predict: predict_new_data() called per gene against one batched predict_batch() call, and the
+  load time, single-row latency, batch throughput and accuracy of every inference backend; a
+  backend whose error or batch dependence exceeds ACCURACY_TOLERANCE is flagged as not accurate
+- analysis: the differential expression precomputation (analysis/differential.py)
+- flask: the main webapp routes through Flask's test client
+
+Stages marked [--database] need a scratch PostgreSQL database given through the DB_* variables
+and the --database flag. They run in a `bench` schema that is dropped and recreated, and they are
+skipped otherwise. Without --database the connection pool points at a closed local port, so
+snapshot checks fall back to the local files immediately and nothing reaches the production RDS.
+
+Results are written as JSON to benchmarks/results/ (or --output), tagged with the git commit. Pass
+a previous result file with --compare to print the change of every timing.
+
+Usage:
+    python run_benchmarks.py --scales 1 10 --stages preprocess train predict
+    python run_benchmarks.py --scales 1 --database --compare results/<earlier>.json
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks import synthetic
+
+STAGES = ['preprocess', 'load', 'fetch', 'snapshot', 'train', 'predict', 'analysis', 'flask']
+DATABASE_STAGES = {'load', 'fetch'}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Schema the database stages run in
+BENCH_SCHEMA = 'bench'
+
+
+def timed(function, *args, **kwargs):
+    """Run function once and return (seconds, result)."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+class Context:
+    """Scratch directory, generated data and settings shared by the stages of one scale."""
+
+    def __init__(self, scale, work_dir, args):
+        self.scale = scale
+        self.genes = synthetic.BASE_GENES * scale
+        self.work_dir = work_dir
+        self.args = args
+        self._raw_path = None
+        self._processed = None
+        self._arrays = None
+
+    def path(self, *parts):
+        return os.path.join(self.work_dir, *parts)
+
+    def raw_path(self):
+        if self._raw_path is None:
+            self._raw_path = synthetic.write_raw(self.path('Mouse_data.csv'), self.genes, self.args.seed)
+        return self._raw_path
+
+    def processed_paths(self):
+        if self._processed is None:
+            self._processed = synthetic.write_processed(self.path('processed'), self.genes, self.args.seed)
+        return self._processed
+
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = synthetic.processed_arrays(self.genes, self.args.seed)
+        return self._arrays
+
+    def ensure_snapshots(self):
+        """Write the synthetic tables as local snapshots unless a stage already exported them."""
+        from database.snapshot import has_snapshot, write_snapshot
+        from database.strains import STRAINS
+
+        ids, values = self.arrays()
+        for strain, config in STRAINS.items():
+            if not has_snapshot(config['table']):
+                write_snapshot(config['table'], ids, values[strain], {'synthetic': self.args.seed, 'scale': self.scale})
+
+
+def stage_preprocess(ctx):
+    from preprocessing.pipeline import preprocess
+
+    raw_path = ctx.raw_path()
+    seconds, _ = timed(preprocess, raw_path, ctx.path('preprocessed'))
+    return {'seconds': seconds, 'rows': ctx.genes, 'rows_per_second': ctx.genes / seconds,
+            'input_mb': os.path.getsize(raw_path) / 1024 ** 2}
+
+
+def stage_load(ctx):
+    from database.db_connector import connection
+    from database.schema import create_schema
+    from database.strains import STRAINS
+    from preprocessing.bulk_loader import copy_rows, load_strain_csv
+
+    paths = ctx.processed_paths()
+    ids, _ = ctx.arrays()
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            cursor.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+            create_schema(cursor)
+            copy_rows(cursor, 'main_data', ['ensembl_id'], ([i] for i in ids.tolist()))
+
+    result = {'rows': ctx.genes * len(STRAINS), 'tables': {}}
+    total = 0.0
+    for strain, config in STRAINS.items():
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                seconds, _ = timed(load_strain_csv, cursor, paths[strain], config)
+        result['tables'][config['table']] = seconds
+        total += seconds
+    result.update(seconds=total, rows_per_second=result['rows'] / total)
+    return result
+
+
+def stage_fetch(ctx):
+    from database.db_connector import connection
+    from database.readers import iter_batches
+    from database.snapshot import export_snapshot
+    from database.strains import STRAINS
+
+    table = STRAINS['c57_6j']['table']
+    with connection() as conn:
+        stream_seconds, rows = timed(lambda: sum(len(batch) for batch in iter_batches(conn, table)))
+        with conn.cursor() as cursor:
+            export_seconds, _ = timed(export_snapshot, cursor, table)
+    return {'seconds': stream_seconds, 'rows': rows, 'rows_per_second': rows / stream_seconds,
+            'export_seconds': export_seconds}
+
+
+def stage_snapshot(ctx):
+    from database.snapshot import load_snapshot
+    from database.strains import STRAINS
+
+    ctx.ensure_snapshots()
+    table = STRAINS['c57_6j']['table']
+
+    def scan():
+        snapshot = load_snapshot(table)
+        return float(np.nansum(snapshot.values)), len(snapshot)
+
+    seconds, (_, rows) = timed(scan)
+    return {'seconds': seconds, 'rows': rows, 'rows_per_second': rows / seconds}
+
+
+def stage_train(ctx):
+    from database.snapshot import load_snapshot
+    from database.strains import STRAINS
+    from models.artifacts import promote_artifact
+    from models.transfer_model import train_artifact
+
+    ctx.ensure_snapshots()
+    table = STRAINS['c57_6j']['table']
+    seconds, (_, _, _, metadata) = timed(train_artifact, load_snapshot(table), table_name=table,
+                                         use_cache=False, verbose=False, epochs=ctx.args.epochs)
+    # The benchmark's own ARTIFACT_DIR; the predict stage serves this model
+    promote_artifact(table, metadata['key'])
+    return {'seconds': seconds, 'rows': metadata['rows'], 'epochs': len(metadata['train_losses']),
+            'seconds_per_epoch': seconds / max(1, len(metadata['train_losses'])),
+            'test_loss': metadata['test_loss']}
+
+
+def stage_predict(ctx):
+    from database.snapshot import load_snapshot
+    from database.strains import STRAINS
+    from models.artifacts import current_key
+    from models.inference import ACCURACY_TOLERANCE, BACKENDS, export_artifact
+    from models.predictor import clear_predictors, get_predictor
+    from models.transfer_model import predict_new_data
+
+    ctx.ensure_snapshots()
+    clear_predictors()
+    load_seconds, predictor = timed(get_predictor, 'c57_6j', 'torch')
+    engine = predictor.engine
+    bsl = np.asarray(load_snapshot(STRAINS['c57_6j']['table']).column('bsl_0days_avg'))
+    bsl = bsl[~np.isnan(bsl)]
+
+    # Calling the single-value API for every gene is extrapolated from a sample of calls
+    sample = bsl[:ctx.args.predict_sample]
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull  # predict_new_data prints on every call
+        try:
+            single_seconds, _ = timed(lambda: [predict_new_data(v, engine.model, engine.input_scaler,
+                                                                engine.output_scaler) for v in sample])
+        finally:
+            sys.stdout = stdout
+    batch_seconds, expected = timed(predictor.predict, bsl)
+    per_call = single_seconds / len(sample)
+
+    # quantized is not a serving backend, so artifacts do not carry its export
+    export_artifact(current_key(STRAINS['c57_6j']['table']), ('quantized',))
+    scale = float(np.max(np.abs(expected))) if len(bsl) else 1.0
+    backends = {}
+    for backend in BACKENDS:
+        backend_load_seconds, backend_predictor = timed(get_predictor, 'c57_6j', backend)
+        backend_predictor.predict(bsl[:1])
+        latency_seconds, _ = timed(lambda: [backend_predictor.predict(sample[i:i + 1]) for i in range(len(sample))])
+        backend_seconds, predictions = timed(backend_predictor.predict, bsl)
+        # How much the predictions of a batch move when one far out-of-range value joins it
+        with_outlier = backend_predictor.predict(np.append(sample, 1e7))[:len(sample)]
+        error = float(np.max(np.abs(predictions - expected), initial=0.0)) / scale
+        batch_shift = float(np.max(np.abs(with_outlier - backend_predictor.predict(sample)), initial=0.0)) / scale
+        backends[backend] = {'load_seconds': backend_load_seconds,
+                             'single_row_seconds': latency_seconds / len(sample),
+                             'seconds': backend_seconds, 'rows_per_second': len(bsl) / backend_seconds,
+                             'max_relative_error': error, 'batch_shift': batch_shift,
+                             'accurate': error <= ACCURACY_TOLERANCE and batch_shift <= ACCURACY_TOLERANCE}
+        if not backends[backend]['accurate']:
+            print(f"  {backend} backend is outside ACCURACY_TOLERANCE ({ACCURACY_TOLERANCE}): relative error "
+                  f"{error:.2e}, batch shift {batch_shift:.2e}")
+    return {'seconds': batch_seconds, 'rows': len(bsl), 'rows_per_second': len(bsl) / batch_seconds,
+            'load_seconds': load_seconds, 'single_call_seconds': per_call,
+            'single_calls_all_rows_seconds': per_call * len(bsl),
+            'speedup': per_call * len(bsl) / batch_seconds, 'backends': backends}
+
+
+def stage_analysis(ctx):
+    from analysis.differential import compute_results
+    from database.snapshot import load_snapshot
+    from database.strains import STRAINS
+
+    ctx.ensure_snapshots()
+    snapshots = {strain: load_snapshot(config['table']) for strain, config in STRAINS.items()}
+    seconds, _ = timed(compute_results, snapshots)
+    return {'seconds': seconds, 'rows': ctx.genes * len(STRAINS), 'rows_per_second': ctx.genes * len(STRAINS) / seconds}
+
+
+def stage_flask(ctx):
+    from webapp.app import app
+
+    ctx.ensure_snapshots()
+    client = app.test_client()
+    requests = {
+        'GET /': lambda: client.get('/'),
+        'GET /analysis': lambda: client.get('/analysis'),
+        'GET /api/analysis/top': lambda: client.get('/api/analysis/top?n=100&direction=down'),
+        'POST /api/predict': lambda: client.post('/api/predict', json={
+            'strain': 'c57_6j', 'bsl_values': list(np.linspace(1, 1000, 1000))}),
+    }
+    routes = {}
+    for name, send in requests.items():
+        send()  # Warm up caches and lazy imports
+        latencies = []
+        status = None
+        for _ in range(ctx.args.requests):
+            seconds, response = timed(send)
+            latencies.append(seconds)
+            status = response.status_code
+        routes[name] = {'status': status, 'mean_ms': 1000 * float(np.mean(latencies)),
+                        'p95_ms': 1000 * float(np.percentile(latencies, 95))}
+    return {'seconds': sum(r['mean_ms'] for r in routes.values()) / 1000, 'routes': routes}
+
+
+STAGE_FUNCTIONS = {name: globals()[f"stage_{name}"] for name in STAGES}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def configure_environment(work_dir, database):
+    """Point every data directory of the repository at work_dir before any module reads them."""
+    for variable, name in [('SNAPSHOT_DIR', 'snapshots'), ('ARTIFACT_DIR', 'artifacts'),
+                           ('ANALYSIS_DIR', 'analysis'), ('UPLOAD_DIR', 'uploads')]:
+        os.environ[variable] = os.path.join(work_dir, name)
+    if database:
+        os.environ['PGOPTIONS'] = f"{os.getenv('PGOPTIONS', '')} -c search_path={BENCH_SCHEMA}".strip()
+    else:
+        os.environ['DB_HOST'] = '127.0.0.1'
+        os.environ['DB_PORT'] = '1'
+        os.environ['DB_POOL_MIN'] = '0'
+
+
+def reset_scale(work_dir):
+    """Forget the data of the previous scale: files on disk and what was loaded in memory."""
+    for name in ('snapshots', 'artifacts', 'analysis'):
+        shutil.rmtree(os.path.join(work_dir, name), ignore_errors=True)
+    if 'models.predictor' in sys.modules:
+        sys.modules['models.predictor'].clear_predictors()
+    if 'analysis.differential' in sys.modules:
+        sys.modules['analysis.differential'].invalidate_results()
+
+
+def compare(results, previous_path):
+    """Print the ratio of every stage's seconds to the same stage and scale in a previous run."""
+    with open(previous_path) as file:
+        previous = {(r['stage'], r['scale']): r for r in json.load(file)['results']}
+    print(f"\nCompared with {previous_path}:")
+    for result in results:
+        before = previous.get((result['stage'], result['scale']))
+        if before and 'seconds' in before and 'seconds' in result:
+            ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+            flag = '  <-- slower' if ratio > 1.2 else ''
+            print(f"  {result['stage']:<10} x{result['scale']:<4} {before['seconds']:.4f}s -> {result['seconds']:.4f}s ({ratio:.2f}x){flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic data.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1], help="multiples of 29,048 genes (e.g. 1 10 100)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--database', action='store_true', help="run the database stages against DB_*")
+    parser.add_argument('--epochs', type=int, default=5, help="epochs for the train stage")
+    parser.add_argument('--predict-sample', type=int, default=1000, help="single predictions to time")
+    parser.add_argument('--requests', type=int, default=20, help="requests per Flask route")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help="scratch directory (default: a temporary directory)")
+    parser.add_argument('--output', help="result file (default: results/<commit>-<time>.json)")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    work_root = args.work_dir or tempfile.mkdtemp(prefix='sbm-bench-')
+    configure_environment(work_root, args.database)
+
+    results = []
+    try:
+        for scale in args.scales:
+            work_dir = os.path.join(work_root, f"x{scale}")
+            os.makedirs(work_dir, exist_ok=True)
+            reset_scale(work_root)
+            ctx = Context(scale, work_dir, args)
+            for stage in args.stages:
+                if stage in DATABASE_STAGES and not args.database:
+                    results.append({'stage': stage, 'scale': scale, 'skipped': 'needs --database'})
+                    continue
+                print(f"Running {stage} at x{scale} ({ctx.genes} genes)")
+                try:
+                    result = STAGE_FUNCTIONS[stage](ctx)
+                except Exception as e:
+                    result = {'error': f"{type(e).__name__}: {e}"}
+                result.update(stage=stage, scale=scale, genes=ctx.genes, peak_rss_mb=peak_rss_mb())
+                results.append(result)
+                if 'seconds' in result:
+                    print(f"  {result['seconds']:.4f}s")
+                elif 'error' in result:
+                    print(f"  failed: {result['error']}")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    revision = git_revision()
+    output = args.output or os.path.join(RESULTS_DIR, f"{revision}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'revision': revision,
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'results': results,
+        }, file, indent=2)
+    print(f"Wrote {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+'''
+Synthetic OSD-253-shaped datasets for the benchmarks.
+
+Generates, for any multiple of the 29,048 genes of the real study:
+- a raw expression matrix like Mouse_data.csv: an id column plus REPLICATES sample columns for every
+  strain, condition and time point, with about 10% dropouts stored as 0
+- the per-strain processed CSV files read by the loaders (processed_data_c3h.csv, ...)
+- the processed values as arrays, for writing local snapshots directly
+
+Expression levels are log-normal per gene with small per-condition effects, so the fold-change
+rankings and the model see realistic, non-degenerate data. The same seed always gives the same data.
+
+Usage:
+    python synthetic.py --scale 10 --output-dir /tmp/synthetic
+'''
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database.strains import STRAINS, VALUE_COLUMNS
+
+# Genes in the processed OSD-253 files
+BASE_GENES = 29048
+
+# Replicate samples per strain, condition and time point in the raw matrix
+REPLICATES = 4
+
+# Strain as spelled in the raw sample column names
+RAW_STRAIN_NAMES = {'c3h_hej': 'C3H-HeJ', 'c57_6j': 'C57-6J'}
+
+# Condition and time point of each VALUE_COLUMNS entry, e.g. bsl_0days_avg -> (BSL, 0days)
+CONDITIONS = [(column.split('_')[0].upper(), column.split('_')[1]) for column in VALUE_COLUMNS]
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def gene_ids(start, stop):
+    """Sorted, Ensembl-like ids for genes start..stop-1."""
+    return np.char.add('ENSMUSG', np.char.zfill(np.arange(start, stop).astype(str), 11))
+
+
+def raw_columns(strains=None):
+    columns = []
+    for strain in strains or STRAINS:
+        for condition, days in CONDITIONS:
+            for replicate in range(1, REPLICATES + 1):
+                columns.append(f"Mmus_{RAW_STRAIN_NAMES[strain]}_LVR_{condition}_{days}_Rep{replicate}")
+    return columns
+
+
+def processed_block(start, stop, strain_index, seed):
+    """(n, len(VALUE_COLUMNS)) processed averages of genes start..stop-1 for one strain."""
+    rng = np.random.default_rng([seed, strain_index, start])
+    n = stop - start
+    base = rng.lognormal(mean=3.0, sigma=2.0, size=(n, 1))
+    effects = rng.normal(0.0, 0.3, size=(n, len(VALUE_COLUMNS)))
+    values = base * np.exp2(effects)
+    values[rng.random(values.shape) < 0.02] = np.nan
+    return values
+
+
+def raw_block(start, stop, strain_index, seed):
+    """(n, len(VALUE_COLUMNS) * REPLICATES) replicate values of genes start..stop-1 for one strain."""
+    averages = processed_block(start, stop, strain_index, seed)
+    rng = np.random.default_rng([seed, strain_index, start, 1])
+    replicates = np.repeat(np.nan_to_num(averages, nan=0.0), REPLICATES, axis=1)
+    replicates *= rng.lognormal(0.0, 0.2, size=replicates.shape)
+    replicates[rng.random(replicates.shape) < 0.1] = 0.0
+    return replicates
+
+
+def write_raw(path, n_genes, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write a raw matrix with n_genes rows to path, one chunk at a time."""
+    strains = list(STRAINS)
+    with open(path, 'w', newline='') as file:
+        file.write(','.join(['ENSEMBL'] + raw_columns(strains)) + '\n')
+        for start in range(0, n_genes, chunk_size):
+            stop = min(start + chunk_size, n_genes)
+            blocks = [raw_block(start, stop, i, seed) for i in range(len(strains))]
+            frame = pd.DataFrame(np.hstack(blocks))
+            frame.insert(0, 'ENSEMBL', gene_ids(start, stop))
+            frame.to_csv(file, header=False, index=False, float_format='%.6g')
+    return path
+
+
+def processed_arrays(n_genes, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return (ids, {strain: values}) for n_genes genes."""
+    ids = gene_ids(0, n_genes)
+    values = {}
+    for i, strain in enumerate(STRAINS):
+        values[strain] = np.vstack([processed_block(start, min(start + chunk_size, n_genes), i, seed)
+                                    for start in range(0, n_genes, chunk_size)])
+    return ids, values
+
+
+def write_processed(output_dir, n_genes, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write one processed CSV per strain in the loaders' format. Returns {strain: path}."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for i, (strain, config) in enumerate(STRAINS.items()):
+        paths[strain] = os.path.join(output_dir, config['filename'])
+        with open(paths[strain], 'w', newline='') as file:
+            header = [config['csv_id_column']] + [config['csv_prefix'] + c for c in VALUE_COLUMNS]
+            file.write(','.join(header) + '\n')
+            for start in range(0, n_genes, chunk_size):
+                stop = min(start + chunk_size, n_genes)
+                frame = pd.DataFrame(processed_block(start, stop, i, seed))
+                frame.insert(0, 'id', gene_ids(start, stop))
+                frame.to_csv(file, header=False, index=False)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic OSD-253-shaped datasets.")
+    parser.add_argument('--scale', type=int, default=1, help=f"multiple of {BASE_GENES} genes")
+    parser.add_argument('--output-dir', default='.', help="directory for the generated files")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    n_genes = BASE_GENES * args.scale
+    os.makedirs(args.output_dir, exist_ok=True)
+    raw_path = write_raw(os.path.join(args.output_dir, 'Mouse_data.csv'), n_genes, args.seed)
+    print(f"Wrote raw matrix with {n_genes} genes to {raw_path}")
+    for strain, path in write_processed(args.output_dir, n_genes, args.seed).items():
+        print(f"Wrote processed {strain} data to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+'''
+Command line entry point for the whole pipeline.
+
+    python cli.py preprocess Mouse_data.csv --output-dir data/processed
+    python cli.py merge data/processed/processed_data_c3h.csv data/processed/processed_data_c57.csv
+    python cli.py load [--sync] [--delete-missing] [--force]
+    python cli.py train [tables ...] [--plot-dir data/plots] [--no-promote]
+    python cli.py predict c57_6j 9.35 12.1            (or --ids ENSMUSG... / --all)
+    python cli.py serve [--host 0.0.0.0] [--port 5000]
+    python cli.py verify
+
+Importing this module does nothing but define the parser. Every command imports what it needs
+when it runs, so `predict` and `verify` never load torch, sklearn, matplotlib or Flask: with the
+default numpy inference backend (see models/inference.py) a prediction from cron or a batch job
+starts in a fraction of a second. `train` never opens a plot window; the loss curves are saved as
+PNG files instead. Set PROFILE=1 to profile preprocess, merge, load and train (instrumentation/profiling.py).
+'''
+import argparse
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PLOT_DIR = os.getenv("PLOT_DIR", os.path.join(REPO_DIR, 'data', 'plots'))
+
+
+def preprocess_command(args):
+    from instrumentation.profiling import profiled
+    from preprocessing.pipeline import DEFAULT_CHUNK_SIZE, preprocess
+
+    with profiled('preprocess'):
+        paths = preprocess(args.input, args.output_dir, args.chunk_size or DEFAULT_CHUNK_SIZE)
+    for strain, path in paths.items():
+        print(f"Wrote {strain} averages to {path}")
+
+
+def merge_command(args):
+    from instrumentation.profiling import profiled
+    from preprocessing.merge import DEFAULT_CHUNK_SIZE, merge_files
+
+    with profiled('merge'):
+        dataset = merge_files(args.inputs, args.name, args.chunk_size or DEFAULT_CHUNK_SIZE)
+    print(f"Merged {len(dataset)} genes x {len(dataset.columns)} columns into {dataset.path}")
+
+
+def load_command(args):
+    from database.db_connector import connection
+    from database.strains import STRAINS
+    from instrumentation.profiling import profiled
+
+    strains = args.strains or list(STRAINS)
+    with connection() as conn:
+        print("Connected")
+        with conn.cursor() as cursor, profiled('upload'):
+            for strain in strains:
+                config = STRAINS[strain]
+                print(f"{strain.upper()} DATA STARTED")
+                if args.sync:
+                    from preprocessing.sync_loader import sync_strain_csv
+
+                    result = sync_strain_csv(cursor, config['filename'], config,
+                                             delete_missing=args.delete_missing, force=args.force)
+                    if result['file_skipped']:
+                        print(f"{config['filename']} was already synced into {result['table']}, skipping")
+                        continue
+                    print(f"Synced {result['rows_read']} rows into {result['table']}: {result['inserted']} "
+                          f"inserted, {result['updated']} updated, {result['deleted']} deleted")
+                else:
+                    from preprocessing.bulk_loader import load_strain_csv
+
+                    result = load_strain_csv(cursor, config['filename'], config)
+                    print(f"Inserted {result['inserted']} of {result['rows_read']} rows into {result['table']}")
+                if result['skipped_ids']:
+                    print(f"Skipped {len(result['skipped_ids'])} rows not found in main_data: "
+                          + ', '.join(result['skipped_ids']))
+        # The changes are committed when the connection goes back to the pool
+
+
+def train_command(args):
+    from database.snapshot import ensure_snapshot
+    from database.strains import STRAINS
+    from training.parallel import train_parallel
+
+    tables = args.tables or [config['table'] for config in STRAINS.values()]
+    hyperparams = {name: getattr(args, name) for name in ('epochs', 'lr', 'batch_size')
+                   if getattr(args, name) is not None}
+    # Bring the local snapshots up to date; the workers memory-map them instead of querying the database
+    jobs = []
+    for table_name in tables:
+        ensure_snapshot(table_name)
+        jobs.append({'table': table_name, 'hyperparams': hyperparams, 'use_cache': not args.no_cache})
+
+    results = train_parallel(jobs, processes=args.processes)
+    for metadata in results:
+        status = "loaded from cache" if metadata['cached'] else f"trained for {len(metadata['train_losses'])} epochs"
+        print(f"{metadata['table']}: artifact {metadata['key']} {status}, test loss {metadata['test_loss']}")
+        if not args.no_promote:
+            # Serve the model of the current data, even when it is an older cached artifact
+            from models.artifacts import promote_artifact
+
+            promote_artifact(metadata['table'], metadata['key'])
+            print(f"{metadata['table']}: now serving artifact {metadata['key']}")
+        if args.plot_dir and metadata['train_losses']:
+            from models.transfer_model import plot_losses
+
+            path = plot_losses(metadata['train_losses'], metadata['val_losses'],
+                               os.path.join(args.plot_dir, f"{metadata['table']}-{metadata['key']}.png"))
+            print(f"Saved loss curves to {path}")
+
+
+def predict_command(args):
+    import csv
+
+    import numpy as np
+
+    from models.inference import SERVING_BACKENDS
+    from models.predictor import INPUT_COLUMN, OUTPUT_COLUMNS, get_predictor
+
+    if args.backend not in SERVING_BACKENDS:
+        sys.exit(f"Unknown backend {args.backend}. Expected one of {', '.join(SERVING_BACKENDS)}")
+    try:
+        predictor = get_predictor(args.strain, args.backend)
+    except FileNotFoundError as e:
+        # "No trained model for <table>; run `python cli.py train` first"
+        print(e, file=sys.stderr)
+        return 1
+    writer = csv.writer(sys.stdout)
+    if args.ids or args.all:
+        from database.db_connector import connection
+        from database.strains import DB_ID_COLUMN, STRAINS
+
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                ids, predictions, missing = predictor.predict_ids(cursor, STRAINS[args.strain]['table'],
+                                                                  None if args.all else args.ids)
+        writer.writerow([DB_ID_COLUMN] + OUTPUT_COLUMNS)
+        for ensembl_id, row in zip(ids, predictions.tolist()):
+            writer.writerow([ensembl_id] + row)
+        if missing:
+            print(f"No baseline value for: {', '.join(missing)}", file=sys.stderr)
+    else:
+        bsl_values = np.array(args.values or [float(line) for line in sys.stdin if line.strip()], dtype=np.float64)
+        writer.writerow([INPUT_COLUMN] + OUTPUT_COLUMNS)
+        for bsl_value, row in zip(bsl_values.tolist(), predictor.predict(bsl_values).tolist()):
+            writer.writerow([bsl_value] + row)
+
+
+def serve_command(args):
+    from webapp.app import app
+
+    app.run(host=args.host, port=args.port, debug=args.debug)
+
+
+def verify_command(args):
+    from database.db_connector import connection
+    from database.schema import create_schema
+
+    try:
+        with connection() as conn:
+            print("Connected")
+            with conn.cursor() as cursor:
+                # Creating main_data, the expression table with one partition per strain (see
+                # database/strains.py), the per-strain views, dataset_versions and load_manifest
+                legacy = create_schema(cursor)
+            conn.commit()
+            print("Tables created successfully")
+            if legacy:
+                print("Still in the old per-strain layout, run Migrate To Expression Table.py: " + ', '.join(legacy))
+    except Exception as e:
+        print("Verification failed: {}".format(e))
+        return 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Space Biology Model Repository pipeline.")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    command = commands.add_parser('preprocess', help="average raw replicates into per-strain CSV files")
+    command.add_argument('input', help="raw expression matrix, e.g. Mouse_data.csv")
+    command.add_argument('--output-dir', default='.', help="directory for the processed_data_*.csv files")
+    command.add_argument('--chunk-size', type=int, help="rows read per chunk (default: 5000)")
+    command.set_defaults(func=preprocess_command)
+
+    command = commands.add_parser('merge', help="sort-merge per-strain CSV files into one wide dataset")
+    command.add_argument('inputs', nargs='+', help="processed_data_*.csv files")
+    command.add_argument('--name', default='merged', help="dataset name under data/merged/")
+    command.add_argument('--chunk-size', type=int, help="rows per read and per output chunk (default: 10000)")
+    command.set_defaults(func=merge_command)
+
+    command = commands.add_parser('load', help="upload the processed strain CSV files to the database")
+    command.add_argument('strains', nargs='*', help="strains to load (default: every strain)")
+    command.add_argument('--sync', action='store_true', help="update changed rows instead of only adding new ones")
+    command.add_argument('--delete-missing', action='store_true', help="with --sync, delete rows missing from the CSV")
+    command.add_argument('--force', action='store_true', help="with --sync, apply files the load manifest has seen")
+    command.set_defaults(func=load_command)
+
+    command = commands.add_parser('train', help="train one model per strain table")
+    command.add_argument('tables', nargs='*', help="strain tables (default: every strain table)")
+    command.add_argument('--processes', type=int, help="worker processes (default: one per table)")
+    command.add_argument('--epochs', type=int)
+    command.add_argument('--lr', type=float)
+    command.add_argument('--batch-size', type=int)
+    command.add_argument('--no-cache', action='store_true', help="retrain even if the artifact exists")
+    command.add_argument('--no-promote', action='store_true',
+                         help="store the models without serving them, e.g. for experiments")
+    command.add_argument('--plot-dir', default=PLOT_DIR, help="where loss curves are saved ('' to skip them)")
+    command.set_defaults(func=train_command)
+
+    command = commands.add_parser('predict', help="predict the six expression columns with a strain's model")
+    command.add_argument('strain', help="strain, e.g. c57_6j")
+    command.add_argument('values', nargs='*', type=float, help="bsl_0days_avg values (default: one per line on stdin)")
+    command.add_argument('--ids', nargs='+', help="predict for these genes, looking up their baselines")
+    command.add_argument('--all', action='store_true', help="predict for every gene of the strain")
+    command.add_argument('--backend', default=os.getenv("INFERENCE_BACKEND", "numpy"),
+                         help="torch, torchscript or numpy (default: INFERENCE_BACKEND or numpy)")
+    command.set_defaults(func=predict_command)
+
+    command = commands.add_parser('serve', help="run the Flask webapp")
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=5000)
+    command.add_argument('--debug', action='store_true')
+    command.set_defaults(func=serve_command)
+
+    command = commands.add_parser('verify', help="check the database connection and create missing tables")
+    command.set_defaults(func=verify_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'load' and not args.sync and (args.delete_missing or args.force):
+        parser.error("--delete-missing and --force only apply to `load --sync`")
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+''' This Python program moves the data of the per-strain wide tables (c3h_hej_data, c57_6j_data)
+into the long-format expression table, partitioned by study and strain (see database/schema.py).
+Each old table is copied with one INSERT ... SELECT, renamed to <table>_legacy and replaced by a
+view with the same name and columns, so every reader keeps working. Pass --drop-legacy to drop the
+old tables instead of keeping them. The whole migration is one transaction and can be run again.
+ '''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database.db_connector import connection
+from database.migration import migrate
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move the per-strain tables into the expression table.")
+    parser.add_argument('--drop-legacy', action='store_true', help="drop the old tables instead of renaming them")
+    args = parser.parse_args()
+
+    # The changes are committed when the connection goes back to the pool, or rolled back on error
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            moved = migrate(cursor, drop_legacy=args.drop_legacy)
+    print(f"Migrated {len(moved)} tables" if moved else "Nothing to migrate")
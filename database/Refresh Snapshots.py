@@ -0,0 +1,23 @@
+''' This Python program refreshes the local snapshots (data/snapshots/) of the strain tables.
+A table is only exported again when it changed in the database since its last snapshot.
+Pass table names to refresh only those tables, and --force to export even if nothing changed.
+ '''
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database.snapshot import ensure_snapshot
+from database.strains import STRAINS
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Refresh the local snapshots of the strain tables.")
+    parser.add_argument('tables', nargs='*', help="tables to refresh (default: every strain table)")
+    parser.add_argument('--force', action='store_true', help="export even if the snapshot is current")
+    args = parser.parse_args()
+
+    for table_name in args.tables or [config['table'] for config in STRAINS.values()]:
+        snapshot = ensure_snapshot(table_name, force=args.force)
+        print(f"{table_name}: {len(snapshot)} rows in {snapshot.path}")
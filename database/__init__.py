@@ -0,0 +1 @@
+from database.db_connector import ConnectionPool, close_pool, connection, get_pool
@@ -0,0 +1,128 @@
+'''
+Concurrent queries for the synchronous webapp through asyncpg.
+
+Flask 1.1 views are synchronous, so the asyncio side runs on one background event loop thread
+with its own asyncpg pool. A view hands that loop a batch of queries with fetch_concurrently(); the
+queries run at the same time on separate connections and the call returns once the slowest one is
+done. Over a cross-region connection a page that needs one query per strain then costs one round
+trip instead of one per strain.
+
+asyncpg is optional. available() is False when it is not installed or ASYNC_DB is set to 0, and
+callers fall back to the psycopg2 pool in db_connector.py. The pool reuses the DB_* connection
+settings; ASYNC_DB_POOL_MIN and ASYNC_DB_POOL_MAX size it (defaults: DB_POOL_MIN / DB_POOL_MAX).
+
+Queries use asyncpg's $1, $2 ... placeholders.
+'''
+import asyncio
+import os
+import threading
+
+try:
+    import asyncpg
+except ImportError:  # the webapp then queries strains one after another over psycopg2
+    asyncpg = None
+
+from database.db_connector import connection_settings, pool_settings
+from instrumentation.metrics import timer
+
+
+def available():
+    """Whether concurrent queries can be used in this process."""
+    return asyncpg is not None and os.getenv("ASYNC_DB", "1").lower() not in ('0', 'false', 'no')
+
+
+def quote_identifier(name):
+    """Quote a table or column name for use in a query string."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class AsyncDatabase:
+    """asyncpg pool on a background event loop, callable from ordinary threads."""
+
+    def __init__(self, min_size=1, max_size=10, timeout=30, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.connect_kwargs = connect_kwargs
+        self._loop = None
+        self._thread = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='async-db', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _get_pool(self):
+        # Only ever awaited on the background loop, so no lock is needed around the creation
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size,
+                                                   timeout=self.timeout, **self.connect_kwargs)
+        return self._pool
+
+    async def fetch(self, query, *args):
+        """Run one query on a pooled connection and return its rows as asyncpg Records."""
+        pool = await self._get_pool()
+        async with pool.acquire(timeout=self.timeout) as conn:
+            with timer('sbm_sql_seconds', statement=query.split(None, 1)[0].upper()):
+                return await conn.fetch(query, *args)
+
+    async def fetch_many(self, queries):
+        """Run (query, args) pairs concurrently and return their rows in the same order."""
+        return await asyncio.gather(*(self.fetch(query, *args) for query, args in queries))
+
+    def run(self, coroutine):
+        """Run a coroutine on the background loop and wait for its result."""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+        return future.result()
+
+    def fetch_concurrently(self, queries):
+        """Blocking front end of fetch_many() for synchronous code such as Flask views."""
+        return self.run(self.fetch_many(list(queries)))
+
+    def close(self):
+        """Close the pool and stop the background loop."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._pool is not None:
+            asyncio.run_coroutine_threadsafe(self._pool.close(), loop).result()
+            self._pool = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_async_db():
+    """Return the process-wide AsyncDatabase, configured like the psycopg2 pool."""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                settings = connection_settings()
+                pool = pool_settings()
+                _database = AsyncDatabase(
+                    min_size=int(os.getenv("ASYNC_DB_POOL_MIN", str(pool['minconn']))),
+                    max_size=int(os.getenv("ASYNC_DB_POOL_MAX", str(pool['maxconn']))),
+                    timeout=pool['timeout'],
+                    host=settings['host'], port=int(settings['port']), database=settings['database'],
+                    user=settings['user'], password=settings['password'])
+    return _database
+
+
+def close_async_db():
+    """Close the process-wide AsyncDatabase, e.g. at shutdown."""
+    global _database
+    with _database_lock:
+        if _database is not None:
+            _database.close()
+            _database = None
@@ -1,17 +1,274 @@
-import psycopg2
+'''
+Shared, pooled access to the RDS PostgreSQL database.
+
+Every script and the webapp borrow connections from one thread-safe pool instead of opening a new
+TCP+TLS connection for each piece of work. Connections that sat idle for a while are pinged before
+they are handed out, and connections that have been idle or alive for too long are recycled.
+
+The pool is configured from the environment:
+- DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD: connection parameters; DB_HOST has no default
+- DB_POOL_MIN, DB_POOL_MAX: number of connections kept open / allowed at once
+- DB_POOL_TIMEOUT: seconds to wait for a free connection before giving up
+- DB_POOL_HEALTH_CHECK: seconds of idleness after which a connection is pinged before reuse
+- DB_POOL_IDLE_TIMEOUT: seconds of idleness after which a connection is closed
+- DB_POOL_MAX_LIFETIME: seconds after which a connection is closed regardless of use
+
+With METRICS_ENABLED set, connection setup, pool waits and every statement run through a pooled
+cursor are timed (see instrumentation.metrics).
+
+Usage:
+    from database.db_connector import connection
 
-def connect():
-    try:
-        conn = psycopg2.connect(host="model-zoo-space-apps.cqxs7dfl7szm.us-east-2.rds.amazonaws.com",
-                                port="5432",
-                                database="postgres",
-                                user="postgress_space",
-                                password="SpaceApps2023!")
+    with connection() as conn:
         cursor = conn.cursor()
-        print("Connected")
+        cursor.execute("SELECT 1")
+'''
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+from psycopg2.pool import PoolError
+
+from instrumentation.metrics import count, timer
+from instrumentation.metrics import enabled as metrics_enabled
+
+
+def connection_settings():
+    """Read the psycopg2 connection parameters from the environment. DB_HOST must be set."""
+    host = os.getenv("DB_HOST")
+    if not host:
+        raise RuntimeError("DB_HOST is not set; point it at the PostgreSQL server to use")
+    return {
+        'host': host,
+        'port': os.getenv("DB_PORT", "5432"),
+        'database': os.getenv("DB_NAME", "postgres"),
+        'user': os.getenv("DB_USER"),
+        'password': os.getenv("DB_PASSWORD"),
+    }
+
+
+def _statement(query, cursor):
+    """The leading SQL keyword of query, used as a low-cardinality metrics label."""
+    if isinstance(query, sql.Composable):
+        query = query.as_string(cursor)
+    elif isinstance(query, bytes):
+        query = query.decode()
+    words = query.split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that records the duration of each statement by its leading keyword."""
+
+    def execute(self, query, vars=None):
+        if not metrics_enabled():
+            return super().execute(query, vars)
+        with timer('sbm_sql_seconds', statement=_statement(query, self)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        if not metrics_enabled():
+            return super().executemany(query, vars_list)
+        with timer('sbm_sql_seconds', statement=_statement(query, self)):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with timer('sbm_sql_seconds', statement='COPY'):
+            return super().copy_expert(sql, file, size)
+
+
+def pool_settings():
+    """Read the pool sizing and recycling parameters from the environment."""
+    return {
+        'minconn': int(os.getenv("DB_POOL_MIN", "1")),
+        'maxconn': int(os.getenv("DB_POOL_MAX", "10")),
+        'timeout': float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        'health_check_after': float(os.getenv("DB_POOL_HEALTH_CHECK", "30")),
+        'idle_timeout': float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300")),
+        'max_lifetime': float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+    }
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool with health checks and idle recycling."""
+
+    def __init__(self, minconn=1, maxconn=10, timeout=30, health_check_after=30,
+                 idle_timeout=300, max_lifetime=3600, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool sizes must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.connect_kwargs = dict(connect_kwargs)
+        self.connect_kwargs.setdefault('cursor_factory', TimedCursor)
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at) pairs, most recently returned last
+        self._created = {}  # id(connection) -> creation time
+        self._size = 0  # open connections, idle or in use
+        self._closed = False
+
+        for _ in range(minconn):
+            conn = self._open()
+            self._idle.append((conn, time.monotonic()))
+
+    def _open(self):
+        with self._cond:
+            self._size += 1
+        try:
+            with timer('sbm_stage_seconds', stage='db_connect'):
+                conn = psycopg2.connect(**self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._created[id(conn)] = time.monotonic()
+        count('sbm_db_connections_opened_total')
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _expired(self, conn, now):
+        return now - self._created.get(id(conn), now) > self.max_lifetime
+
+    def _healthy(self, conn, returned_at, now):
+        if conn.closed or self._expired(conn, now):
+            return False
+        if now - returned_at < self.health_check_after:
+            return True
+        # The connection sat idle long enough that the server or a load balancer may have dropped it
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reap_idle(self, now):
+        """Close idle connections above minconn that have not been used for idle_timeout seconds."""
+        stale = []
+        with self._cond:
+            keep = []
+            for conn, returned_at in self._idle:
+                if len(self._idle) - len(stale) > self.minconn and now - returned_at > self.idle_timeout:
+                    stale.append(conn)
+                else:
+                    keep.append((conn, returned_at))
+            self._idle = keep
+        for conn in stale:
+            self._discard(conn)
+
+    def getconn(self):
+        """Borrow a connection, waiting up to timeout seconds for one to become free."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if not self._idle and self._size >= self.maxconn:
+                    # Only the time spent waiting for a connection to come back is a pool wait
+                    with timer('sbm_stage_seconds', stage='db_pool_wait'):
+                        while not self._idle and self._size >= self.maxconn:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise PoolError(f"no free connection after {self.timeout} seconds")
+                            self._cond.wait(remaining)
+                candidate = self._idle.pop() if self._idle else None
+
+            if candidate is None:
+                return self._open()
+            conn, returned_at = candidate
+            # Health checks may hit the network, so they run outside the lock
+            if self._healthy(conn, returned_at, time.monotonic()):
+                return conn
+            self._discard(conn)
+
+    def putconn(self, conn, close=False):
+        """Return a borrowed connection to the pool, or close it if it is broken or expired."""
+        now = time.monotonic()
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                close = True
+        if close or conn.closed or self._closed or self._expired(conn, now):
+            self._discard(conn)
+        else:
+            with self._cond:
+                self._idle.append((conn, now))
+                self._cond.notify()
+        self._reap_idle(now)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for a with-block. Commits on success and rolls back on error."""
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            broken = conn.closed
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            self.putconn(conn, close=broken)
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        """Close every idle connection and refuse new checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it from the environment on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**pool_settings(), **connection_settings())
+    return _pool
+
+
+def connection():
+    """Borrow a connection from the process-wide pool for a with-block."""
+    return get_pool().connection()
 
-    except Exception as e:
-        print("Connection failed: {}".format(e))
-    return conn, cursor
 
-connect()
\ No newline at end of file
+def close_pool():
+    """Close the process-wide pool, e.g. before forking worker processes or at shutdown."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,48 @@
+'''
+Gene profile lookups across every strain.
+'''
+from psycopg2 import sql
+
+from database.async_db import quote_identifier
+from database.strains import DB_ID_COLUMN, EXPRESSION_TABLE, STRAINS, VALUE_COLUMNS
+
+
+def fetch_gene_profiles(cursor, ensembl_ids, strains=None):
+    """Return {ensembl_id: {strain: {column: value}}} for the ids found in any strain.
+
+    All strains are read in a single query over the covering gene index of the expression table.
+    Strains without a row for a gene are left out of that gene's profile; genes found nowhere are
+    left out of the result.
+    """
+    strains = list(strains or STRAINS)
+    profiles = {}
+    columns = sql.SQL(', ').join(map(sql.Identifier, [DB_ID_COLUMN] + VALUE_COLUMNS))
+    cursor.execute(sql.SQL("""
+        SELECT study, strain, {columns} FROM {table}
+        WHERE {id} = ANY(%s) AND (study, strain) IN (SELECT * FROM unnest(%s::varchar[], %s::varchar[]))
+    """).format(columns=columns, table=sql.Identifier(EXPRESSION_TABLE), id=sql.Identifier(DB_ID_COLUMN)),
+        (list(ensembl_ids), [STRAINS[s]['study'] for s in strains], strains))
+    for _, strain, *row in cursor.fetchall():
+        profiles.setdefault(row[0], {})[strain] = dict(zip(VALUE_COLUMNS, row[1:]))
+    return profiles
+
+
+def fetch_gene_profiles_concurrently(database, ensembl_ids, strains=None):
+    """Like fetch_gene_profiles(), but with one query per strain, all run at once.
+
+    database is an AsyncDatabase (database/async_db.py); the call takes as long as the slowest
+    strain query instead of one round trip per strain. Each query goes through the expression table
+    with the strain's study and strain as parameters, so PostgreSQL prunes it to that strain's
+    partition (at execution time for generic plans) and reads it through the covering gene index,
+    without partition names being hard-coded here.
+    """
+    strains = list(strains or STRAINS)
+    columns = ', '.join(map(quote_identifier, [DB_ID_COLUMN] + VALUE_COLUMNS))
+    query = (f"SELECT {columns} FROM {quote_identifier(EXPRESSION_TABLE)} "
+             f"WHERE study = $1 AND strain = $2 AND {quote_identifier(DB_ID_COLUMN)} = ANY($3::varchar[])")
+    queries = [(query, (STRAINS[strain]['study'], strain, list(ensembl_ids))) for strain in strains]
+    profiles = {}
+    for strain, rows in zip(strains, database.fetch_concurrently(queries)):
+        for row in rows:
+            profiles.setdefault(row[0], {})[strain] = dict(zip(VALUE_COLUMNS, row[1:]))
+    return profiles
@@ -0,0 +1,61 @@
+'''
+Load manifest: one row per file synced into a strain table.
+
+The incremental loader (preprocessing/sync_loader.py) records the SHA-256 of every file it applies
+together with what the sync changed, whether it deleted missing rows and the dataset_versions
+version the table had afterwards. A file is only skipped without reading it when the newest entry
+of its table has the same digest, covered the same deletions and the table has not changed since
+(for example through a plain load by bulk_loader.py).
+'''
+
+CREATE_MANIFEST_TABLE = """
+    CREATE TABLE IF NOT EXISTS load_manifest (
+        id BIGSERIAL PRIMARY KEY,
+        table_name VARCHAR NOT NULL,
+        source VARCHAR NOT NULL,
+        file_digest CHAR(64) NOT NULL,
+        rows_read BIGINT NOT NULL,
+        inserted BIGINT NOT NULL,
+        updated BIGINT NOT NULL,
+        deleted BIGINT NOT NULL,
+        delete_missing BOOLEAN NOT NULL DEFAULT false,
+        table_version BIGINT,
+        loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# Columns added after the first version of the table
+MANIFEST_MIGRATIONS = (
+    "ALTER TABLE load_manifest ADD COLUMN IF NOT EXISTS delete_missing BOOLEAN NOT NULL DEFAULT false",
+    "ALTER TABLE load_manifest ADD COLUMN IF NOT EXISTS table_version BIGINT",
+)
+
+
+def create_manifest_table(cursor):
+    """Create the load_manifest table if it does not exist yet."""
+    cursor.execute(CREATE_MANIFEST_TABLE)
+    for statement in MANIFEST_MIGRATIONS:
+        cursor.execute(statement)
+    cursor.execute("CREATE INDEX IF NOT EXISTS load_manifest_table_idx ON load_manifest (table_name, id)")
+
+
+def last_load(cursor, table_name):
+    """The newest manifest entry of table_name as {'file_digest', 'delete_missing', 'table_version'}, or None."""
+    create_manifest_table(cursor)
+    cursor.execute("""
+        SELECT file_digest, delete_missing, table_version FROM load_manifest
+        WHERE table_name = %s ORDER BY id DESC LIMIT 1
+    """, (table_name,))
+    row = cursor.fetchone()
+    return dict(zip(('file_digest', 'delete_missing', 'table_version'), row)) if row else None
+
+
+def record_load(cursor, table_name, source, digest, rows_read, inserted, updated, deleted, delete_missing=False,
+                table_version=None):
+    """Add a manifest entry. Runs in the caller's transaction, so it commits with the data."""
+    create_manifest_table(cursor)
+    cursor.execute("""
+        INSERT INTO load_manifest (table_name, source, file_digest, rows_read, inserted, updated, deleted,
+                                   delete_missing, table_version)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (table_name, source, digest, rows_read, inserted, updated, deleted, delete_missing, table_version))
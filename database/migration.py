@@ -0,0 +1,66 @@
+'''
+Migration from the per-strain wide tables to the long-format expression table.
+
+Every STRAINS table that is still a plain table is moved with one INSERT ... SELECT into its
+partition of the expression table, checked by row count, renamed to <table>_legacy (or dropped)
+and replaced by a view of the same name. Everything runs in the caller's transaction, so a failed
+migration leaves the database as it was. Strains that were already migrated are skipped, which
+makes the migration safe to run again.
+'''
+from psycopg2 import sql
+
+from database.schema import create_schema
+from database.strains import DB_ID_COLUMN, EXPRESSION_TABLE, STRAINS, VALUE_COLUMNS
+from database.versions import bump_version
+
+LEGACY_SUFFIX = '_legacy'
+
+
+def migrate_strain_table(cursor, strain_config, drop_legacy=False):
+    """Move one legacy wide table into the expression table and return the number of rows moved."""
+    table = strain_config['table']
+    legacy = table + LEGACY_SUFFIX
+    columns = sql.SQL(', ').join(map(sql.Identifier, [DB_ID_COLUMN] + VALUE_COLUMNS))
+
+    cursor.execute(sql.SQL("""
+        INSERT INTO {expression} (study, strain, {columns})
+        SELECT {study}, {strain}, {columns} FROM {table}
+        ON CONFLICT (study, strain, {id}) DO NOTHING
+    """).format(expression=sql.Identifier(EXPRESSION_TABLE), columns=columns,
+                study=sql.Literal(strain_config['study']), strain=sql.Literal(strain_config['strain']),
+                table=sql.Identifier(table), id=sql.Identifier(DB_ID_COLUMN)))
+    moved = cursor.rowcount
+
+    cursor.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(table)))
+    expected = cursor.fetchone()[0]
+    cursor.execute(sql.SQL("SELECT count(*) FROM {} WHERE study = %s AND strain = %s").format(
+        sql.Identifier(EXPRESSION_TABLE)), (strain_config['study'], strain_config['strain']))
+    migrated = cursor.fetchone()[0]
+    if migrated != expected:
+        raise RuntimeError(f"{table} has {expected} rows but its partition has {migrated} after the migration")
+
+    if drop_legacy:
+        cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(table)))
+    else:
+        cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table), sql.Identifier(legacy)))
+    # With the name free, create_schema() puts the view in its place
+    return moved
+
+
+def migrate(cursor, drop_legacy=False, progress=print):
+    """Migrate every legacy strain table. Returns {table: rows moved}. The caller commits."""
+    legacy = create_schema(cursor)
+    moved = {}
+    for config in STRAINS.values():
+        if config['table'] not in legacy:
+            continue
+        progress(f"Migrating {config['table']}")
+        moved[config['table']] = migrate_strain_table(cursor, config, drop_legacy)
+    remaining = create_schema(cursor)
+    if remaining:
+        raise RuntimeError(f"Could not replace {', '.join(remaining)} with views")
+    for table, rows in moved.items():
+        # Snapshots and caches of the table are rebuilt from the new layout
+        bump_version(cursor, table)
+        progress(f"Moved {rows} rows of {table} into {EXPRESSION_TABLE}")
+    return moved
@@ -0,0 +1,100 @@
+'''
+Streaming reads of the strain tables.
+
+Nothing here calls fetchall() on a whole table:
+- iter_rows() / iter_batches() read through a named (server-side) cursor, so only `itersize` rows are
+  held in the client at any time, however large the table grows
+- fetch_page() / iter_pages() use keyset pagination on ensembl_id, so every page is a short index
+  range scan and no cursor has to stay open between pages (e.g. across web requests)
+
+Every function accepts an optional column projection; by default the id and all VALUE_COLUMNS are
+read.
+
+All of them order and compare ids by ID_ORDER, ensembl_id under the "C" collation: byte order,
+which is the order NumPy sorts id arrays in, so snapshots (database/snapshot.py) and the sync diff
+can binary-search what was streamed. The expression table has an index in that order
+(ID_ORDER_INDEX in database/schema.py), so neither reader sorts the table on the server.
+'''
+import itertools
+
+from psycopg2 import sql
+
+from database.strains import DB_ID_COLUMN, VALUE_COLUMNS
+
+DEFAULT_ITERSIZE = 2000
+
+ID_ORDER = sql.SQL('{} COLLATE "C"').format(sql.Identifier(DB_ID_COLUMN))
+
+_cursor_names = itertools.count()
+
+
+def _columns(columns):
+    columns = list(columns or [DB_ID_COLUMN] + VALUE_COLUMNS)
+    unknown = [c for c in columns if c != DB_ID_COLUMN and c not in VALUE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return columns
+
+
+def _select(table_name, columns):
+    return sql.SQL("SELECT {} FROM {}").format(
+        sql.SQL(', ').join(map(sql.Identifier, columns)), sql.Identifier(table_name))
+
+
+def iter_batches(conn, table_name, columns=None, itersize=DEFAULT_ITERSIZE, ordered=True):
+    """Yield lists of up to itersize rows of table_name from a server-side cursor.
+
+    Must run inside a transaction (the default for psycopg2 connections).
+    """
+    query = _select(table_name, _columns(columns))
+    if ordered:
+        query += sql.SQL(" ORDER BY ") + ID_ORDER
+    cursor = conn.cursor(name=f"stream_{table_name}_{next(_cursor_names)}")
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def iter_rows(conn, table_name, columns=None, itersize=DEFAULT_ITERSIZE, ordered=True):
+    """Yield the rows of table_name one at a time from a server-side cursor."""
+    for rows in iter_batches(conn, table_name, columns, itersize, ordered):
+        yield from rows
+
+
+def fetch_page(cursor, table_name, after=None, limit=100, columns=None):
+    """Return (rows, next_after): up to limit rows with ensembl_id > after, in ID_ORDER.
+
+    next_after is the id to pass as `after` for the following page, or None on the last page.
+    The id is always selected (as the first column) because the keyset needs it.
+    """
+    columns = _columns(columns)
+    if DB_ID_COLUMN in columns:
+        columns.remove(DB_ID_COLUMN)
+    columns.insert(0, DB_ID_COLUMN)
+    query = _select(table_name, columns)
+    if after is not None:
+        query += sql.SQL(" WHERE {} > %s").format(ID_ORDER)
+    query += sql.SQL(" ORDER BY {} LIMIT %s").format(ID_ORDER)
+    # Fetch one extra row to know whether another page follows
+    cursor.execute(query, ([after] if after is not None else []) + [limit + 1])
+    rows = cursor.fetchall()
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def iter_pages(cursor, table_name, page_size=1000, columns=None):
+    """Yield every page of table_name in id order using keyset pagination."""
+    after = None
+    while True:
+        rows, after = fetch_page(cursor, table_name, after, page_size, columns)
+        if rows:
+            yield rows
+        if after is None:
+            break
@@ -0,0 +1,105 @@
+'''
+Table definitions of the OSD-253 database.
+
+create_schema() creates main_data, the long-format expression table with one partition per study
+and strain, one view per STRAINS entry, dataset_versions and load_manifest. It is used by
+`Verify RDS Database.py` and by the benchmarks, which build the same schema in a scratch database.
+
+Databases created before the expression table existed still hold one wide table per strain; they
+are moved over by database/migration.py (`Migrate To Expression Table.py`).
+'''
+from psycopg2 import sql
+
+from database.manifest import create_manifest_table
+from database.readers import ID_ORDER
+from database.strains import DB_ID_COLUMN, EXPRESSION_TABLE, STRAINS, VALUE_COLUMNS, partition_name
+from database.versions import create_versions_table
+
+# Covering index for gene lookups: every column a profile needs is in the index itself, so looking
+# a gene up across all studies and strains is an index-only scan
+GENE_INDEX = f"{EXPRESSION_TABLE}_gene_lookup"
+
+# Index giving every partition in ID_ORDER (database/readers.py), so streamed and paged reads of a
+# strain table are ordered index scans instead of full sorts
+ID_ORDER_INDEX = f"{EXPRESSION_TABLE}_id_order"
+
+
+def create_main_table(cursor):
+    # Creating the main table that holds the unique ensembl_id
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS main_data (
+            ensembl_id VARCHAR PRIMARY KEY
+        )
+    """)
+
+
+def relation_kind(cursor, name):
+    """pg_class.relkind of the relation called name ('r' table, 'v' view, 'p' partitioned), or None."""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_expression_table(cursor):
+    # Creating the long-format table of every study and strain, split by study and then strain
+    # This table references the main_data table through the ensembl_id field
+    columns = sql.SQL(',\n').join(sql.SQL("{} DOUBLE PRECISION").format(sql.Identifier(c)) for c in VALUE_COLUMNS)
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            study VARCHAR NOT NULL,
+            strain VARCHAR NOT NULL,
+            {id} VARCHAR NOT NULL REFERENCES main_data(ensembl_id),
+            {columns},
+            PRIMARY KEY (study, strain, {id})
+        ) PARTITION BY LIST (study)
+    """).format(table=sql.Identifier(EXPRESSION_TABLE), id=sql.Identifier(DB_ID_COLUMN), columns=columns))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({}) INCLUDE (study, strain, {})").format(
+        sql.Identifier(GENE_INDEX), sql.Identifier(EXPRESSION_TABLE), sql.Identifier(DB_ID_COLUMN),
+        sql.SQL(', ').join(map(sql.Identifier, VALUE_COLUMNS))))
+    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})").format(
+        sql.Identifier(ID_ORDER_INDEX), sql.Identifier(EXPRESSION_TABLE), ID_ORDER))
+
+
+def create_partition(cursor, study, strain):
+    """Create the partitions holding one strain of one study, if they do not exist yet."""
+    study_partition = partition_name(study)
+    cursor.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({}) PARTITION BY LIST (strain)
+    """).format(sql.Identifier(study_partition), sql.Identifier(EXPRESSION_TABLE), sql.Literal(study)))
+    cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({})").format(
+        sql.Identifier(partition_name(study, strain)), sql.Identifier(study_partition), sql.Literal(strain)))
+
+
+def create_strain_view(cursor, strain_config):
+    """Create the wide per-strain view over the strain's partition.
+
+    Returns False without changing anything while a legacy wide table still has the view's name.
+    """
+    if relation_kind(cursor, strain_config['table']) == 'r':
+        return False
+    cursor.execute(sql.SQL("""
+        CREATE OR REPLACE VIEW {view} AS
+        SELECT {columns} FROM {table} WHERE study = {study} AND strain = {strain}
+    """).format(view=sql.Identifier(strain_config['table']),
+                columns=sql.SQL(', ').join(map(sql.Identifier, [DB_ID_COLUMN] + VALUE_COLUMNS)),
+                table=sql.Identifier(EXPRESSION_TABLE),
+                study=sql.Literal(strain_config['study']), strain=sql.Literal(strain_config['strain'])))
+    return True
+
+
+def create_schema(cursor):
+    """Create every table that does not exist yet. The caller commits.
+
+    Returns the strain tables that are still in the legacy wide layout and need migrating.
+    """
+    create_main_table(cursor)
+    create_expression_table(cursor)
+    legacy = []
+    for config in STRAINS.values():
+        create_partition(cursor, config['study'], config['strain'])
+        if not create_strain_view(cursor, config):
+            legacy.append(config['table'])
+    # Creating the tables that record when each data table was last loaded, and from which file
+    create_versions_table(cursor)
+    create_manifest_table(cursor)
+    return legacy
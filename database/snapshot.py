@@ -0,0 +1,145 @@
+'''
+Local columnar snapshots of the strain tables.
+
+Each table is exported once to SNAPSHOT_DIR/<table>/ (default: data/snapshots/) as:
+- ids.npy: the ensembl ids, sorted, as a fixed-width string array
+- values.npy: a float64 matrix with one row per id and one column per VALUE_COLUMNS entry (NULL -> NaN)
+- meta.json: table, columns, row count and the dataset_versions stamp the export was taken at
+
+Consumers memory-map the .npy files, so loading a snapshot costs no network I/O and no parsing, and
+every process on the machine shares one page-cached copy of the data. ensure_snapshot() compares the
+stored stamp (or, for tables never written by the loaders, the row count and a checksum) with the
+database and only exports again when the table changed.
+
+`Refresh Snapshots.py` refreshes the snapshots of every strain table from the command line.
+'''
+import json
+import os
+import shutil
+
+import numpy as np
+from psycopg2 import sql
+
+from database.db_connector import connection
+from database.readers import iter_batches
+from database.strains import VALUE_COLUMNS
+from database.versions import fetch_versions
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'snapshots'))
+
+IDS_FILE = 'ids.npy'
+VALUES_FILE = 'values.npy'
+META_FILE = 'meta.json'
+
+
+class Snapshot:
+    """Memory-mapped copy of one strain table. Rows are sorted by ensembl_id."""
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as file:
+            self.meta = json.load(file)
+        mode = 'r' if mmap else None
+        self.ids = np.load(os.path.join(path, IDS_FILE), mmap_mode=mode)
+        self.values = np.load(os.path.join(path, VALUES_FILE), mmap_mode=mode)
+        self.columns = self.meta['columns']
+        self.table = self.meta['table']
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_index(self, ensembl_ids):
+        """Row of each id (-1 when absent), found by binary search over the sorted ids."""
+        ensembl_ids = np.asarray(ensembl_ids, dtype=str)
+        if len(self.ids) == 0:
+            return np.full(len(ensembl_ids), -1)
+        positions = np.minimum(np.searchsorted(self.ids, ensembl_ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == ensembl_ids, positions, -1)
+
+    def column(self, name):
+        return self.values[:, self.columns.index(name)]
+
+
+def snapshot_path(table_name):
+    return os.path.join(SNAPSHOT_DIR, table_name)
+
+
+def has_snapshot(table_name):
+    return os.path.exists(os.path.join(snapshot_path(table_name), META_FILE))
+
+
+def load_snapshot(table_name, mmap=True):
+    """Open the local snapshot of table_name; raises FileNotFoundError if it was never exported."""
+    if not has_snapshot(table_name):
+        raise FileNotFoundError(f"No snapshot of {table_name} in {SNAPSHOT_DIR}")
+    return Snapshot(snapshot_path(table_name), mmap=mmap)
+
+
+def table_state(cursor, table_name):
+    """What a snapshot has to match to be current: the version stamp, or row count and checksum."""
+    versions = fetch_versions(cursor)
+    if table_name in versions:
+        version, updated_at = versions[table_name]
+        return {'version': version, 'updated_at': updated_at.isoformat()}
+    cursor.execute(sql.SQL("SELECT count(*), md5(string_agg(t::text, ',' ORDER BY t.ensembl_id)) FROM {} t").format(
+        sql.Identifier(table_name)))
+    rows, checksum = cursor.fetchone()
+    return {'rows': rows, 'checksum': checksum}
+
+
+def export_snapshot(cursor, table_name, state=None, fetch_size=10000):
+    """Export table_name to its snapshot directory, replacing any older snapshot atomically."""
+    state = state or table_state(cursor, table_name)
+    # Stream the table through a server-side cursor, one block of rows at a time
+    ids = []
+    blocks = []
+    for rows in iter_batches(cursor.connection, table_name, itersize=fetch_size):
+        ids.extend(row[0] for row in rows)
+        blocks.append(np.array([row[1:] for row in rows], dtype=np.float64))
+    values = np.vstack(blocks) if blocks else np.empty((0, len(VALUE_COLUMNS)))
+
+    return write_snapshot(table_name, ids, values, state)
+
+
+def write_snapshot(table_name, ids, values, state):
+    """Write ids (sorted) and values as the snapshot of table_name, replacing any older one atomically."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    final_dir = snapshot_path(table_name)
+    tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, IDS_FILE), np.array(ids, dtype=str))
+    np.save(os.path.join(tmp_dir, VALUES_FILE), np.asarray(values, dtype=np.float64))
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as file:
+        json.dump({'table': table_name, 'columns': VALUE_COLUMNS, 'rows': len(ids), 'state': state}, file, indent=2)
+
+    # Swap the directories; readers that still have the old files mapped keep working
+    old_dir = f"{final_dir}.old-{os.getpid()}"
+    if os.path.exists(final_dir):
+        os.rename(final_dir, old_dir)
+    os.rename(tmp_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return load_snapshot(table_name)
+
+
+def ensure_snapshot(table_name, force=False):
+    """Return a current snapshot of table_name, exporting it first if it is missing or stale.
+
+    If the database cannot be reached, an existing snapshot is used as it is.
+    """
+    try:
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                state = table_state(cursor, table_name)
+                if not force and has_snapshot(table_name):
+                    snapshot = load_snapshot(table_name)
+                    if snapshot.meta.get('state') == state:
+                        return snapshot
+                print(f"Refreshing snapshot of {table_name}")
+                return export_snapshot(cursor, table_name, state)
+    except Exception as e:
+        if force or not has_snapshot(table_name):
+            raise
+        print(f"Could not check {table_name} against the database, using the local snapshot: {e}")
+        return load_snapshot(table_name)
+
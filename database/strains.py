@@ -0,0 +1,61 @@
+'''
+Description of the expression data hosted in the database.
+
+All measurements live in one long-format table, EXPRESSION_TABLE, keyed by (study, strain,
+ensembl_id) and partitioned by study and then strain (see database/schema.py). Each row holds the
+seven averaged expression values in VALUE_COLUMNS. Every STRAINS entry also has a view under its
+own table name (e.g. c3h_hej_data) that selects its partition with the old wide layout, so code that
+reads one strain at a time keeps using those names. The loaders, the webapp and the models all read
+table and column names from here instead of hard-coding them.
+'''
+
+# Name of the id column in the database tables
+DB_ID_COLUMN = 'ensembl_id'
+
+# Long-format table holding the measurements of every study and strain
+EXPRESSION_TABLE = 'expression'
+
+# Measurement columns shared by every strain table, in table order
+VALUE_COLUMNS = [
+    'bsl_0days_avg',
+    'flt_25days_avg',
+    'flt_75days_avg',
+    'gc_25days_avg',
+    'gc_75days_avg',
+    'viv_25days_avg',
+    'viv_75days_avg',
+]
+
+# Per-strain configuration. 'table' is the strain's view, 'study' and 'strain' (the key) select its
+# partition of EXPRESSION_TABLE. The CSV value columns are the table columns with csv_prefix in
+# front of them (e.g. c3h_hej_bsl_0days_avg -> bsl_0days_avg).
+STRAINS = {
+    'c3h_hej': {
+        'study': 'OSD-253',
+        'table': 'c3h_hej_data',
+        'filename': 'processed_data_c3h.csv',
+        'csv_id_column': 'ensmbl_id',
+        'csv_prefix': 'c3h_hej_',
+    },
+    'c57_6j': {
+        'study': 'OSD-253',
+        'table': 'c57_6j_data',
+        'filename': 'processed_data_c57.csv',
+        'csv_id_column': 'ensmbl_id',
+        'csv_prefix': 'c57_6j_',
+    },
+}
+
+for _strain, _config in STRAINS.items():
+    _config['strain'] = _strain
+
+
+def strain_table(strain):
+    """Return the table name for a strain key, raising KeyError for unknown strains."""
+    return STRAINS[strain]['table']
+
+
+def partition_name(study, strain=None):
+    """Partition of EXPRESSION_TABLE for a study, or for one strain of it, e.g. expression_osd_253_c57_6j."""
+    parts = [EXPRESSION_TABLE, study] + ([strain] if strain else [])
+    return '_'.join(parts).lower().replace('-', '_')
@@ -0,0 +1,61 @@
+'''
+Version stamps for the data tables.
+
+Every loader that writes to a strain table bumps that table's row in dataset_versions inside the
+same transaction. Caches and derived files (the webapp gene cache, local snapshots, precomputed
+analysis) compare these stamps to decide when their copy is stale, so they never have to diff the
+data itself.
+
+Code that writes data inside the webapp process can additionally call data_changed() after the
+commit so in-process caches are dropped right away instead of at their next version check.
+'''
+import threading
+
+CREATE_VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS dataset_versions (
+        table_name VARCHAR PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def create_versions_table(cursor):
+    """Create the dataset_versions table if it does not exist yet."""
+    cursor.execute(CREATE_VERSIONS_TABLE)
+
+
+def bump_version(cursor, table_name):
+    """Record that table_name changed. Runs in the caller's transaction."""
+    create_versions_table(cursor)
+    cursor.execute("""
+        INSERT INTO dataset_versions (table_name) VALUES (%s)
+        ON CONFLICT (table_name) DO UPDATE
+        SET version = dataset_versions.version + 1, updated_at = now()
+    """, (table_name,))
+
+
+def fetch_versions(cursor):
+    """Return {table_name: (version, updated_at)}, or an empty dict before the first load."""
+    cursor.execute("SELECT to_regclass('dataset_versions') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return {}
+    cursor.execute("SELECT table_name, version, updated_at FROM dataset_versions")
+    return {name: (version, updated_at) for name, version, updated_at in cursor.fetchall()}
+
+
+def add_listener(callback):
+    """Register callback(tables) to be called by data_changed()."""
+    with _listeners_lock:
+        _listeners.append(callback)
+
+
+def data_changed(tables):
+    """Tell in-process listeners that tables were written. Call after the commit."""
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        callback(list(tables))
@@ -0,0 +1,159 @@
+'''
+Lightweight timers, counters and histograms with Prometheus text output.
+
+Instrumentation is off unless METRICS_ENABLED is set (1/true/yes) or enable() is called. While it
+is off, timers skip the clock and count()/observe() return after a single flag check, so instrumented
+code pays next to nothing.
+
+Usage:
+    from instrumentation.metrics import count, timer
+
+    with timer('sbm_stage_seconds', stage='csv_parse'):
+        ...
+
+    @timer('sbm_stage_seconds', stage='inference')
+    def predict(...):
+        ...
+
+    count('sbm_rows_total', len(rows), stage='copy')
+'''
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond queries to long training runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = os.getenv("METRICS_ENABLED", "").lower() in ('1', 'true', 'yes')
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """Forget every recorded value."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def count(name, amount=1, **labels):
+    """Add amount to the counter name{labels}."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Record value (usually seconds) in the histogram name{labels}."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        index = bisect_left(DEFAULT_BUCKETS, value)
+        if index < len(DEFAULT_BUCKETS):
+            histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+class _Timer:
+    """Context manager and decorator that observes elapsed seconds into a histogram."""
+
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _enabled else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+    def __call__(self, function):
+        name, labels = self.name, self.labels
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+
+
+def timer(name, **labels):
+    """Time a with-block, or decorate a function to time each of its calls."""
+    return _Timer(name, labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render_prometheus():
+    """Every counter and histogram in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(DEFAULT_BUCKETS, values):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,94 @@
+'''
+Opt-in profiling for scripts and individual requests.
+
+Set PROFILE=1 to profile the blocks wrapped in profiled(); PROFILE=pyinstrument uses pyinstrument
+instead of cProfile when it is installed. Reports are written to PROFILE_DIR (default
+data/profiles) as <name>-<timestamp>.prof (cProfile, open with pstats or snakeviz) or .html
+(pyinstrument).
+'''
+import cProfile
+import io
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'profiles'))
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def profiler_from_env():
+    """The profiler selected by PROFILE, or None when profiling is off."""
+    value = os.getenv("PROFILE", "").lower()
+    if value in ('', '0', 'false', 'no'):
+        return None
+    return 'pyinstrument' if value == 'pyinstrument' else 'cprofile'
+
+
+class Profile:
+    """One profiling session around a block of code, backed by cProfile or pyinstrument."""
+
+    def __init__(self, profiler='cprofile'):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {profiler}. Expected one of {PROFILERS}")
+        if profiler == 'pyinstrument':
+            try:
+                import pyinstrument
+            except ImportError:
+                profiler = 'cprofile'
+            else:
+                self._profiler = pyinstrument.Profiler()
+        if profiler == 'cprofile':
+            self._profiler = cProfile.Profile()
+        self.profiler = profiler
+
+    def start(self):
+        if self.profiler == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.profiler == 'pyinstrument':
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def summary(self, limit=25):
+        """A plain-text report of the hottest calls."""
+        if self.profiler == 'pyinstrument':
+            return self._profiler.output_text()
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def save(self, name, directory=None):
+        """Write the report to directory and return its path."""
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        if self.profiler == 'pyinstrument':
+            path = stem + '.html'
+            with open(path, 'w') as f:
+                f.write(self._profiler.output_html())
+        else:
+            path = stem + '.prof'
+            self._profiler.dump_stats(path)
+        return path
+
+
+@contextmanager
+def profiled(name, profiler=None):
+    """Profile a with-block when PROFILE is set (or profiler is given) and save the report."""
+    profiler = profiler or profiler_from_env()
+    if profiler is None:
+        yield None
+        return
+    profile = Profile(profiler)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        path = profile.save(name)
+        print(f"Profile for {name} written to {path}")
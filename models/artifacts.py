@@ -0,0 +1,164 @@
+'''
+Content-addressed store for trained model artifacts.
+
+Every artifact lives in ARTIFACT_DIR/<key>/, where the key is a hash of the training data and the
+hyperparameters that produced it. Training the same data with the same settings therefore always
+maps to the same key, and train_model() loads the stored artifact instead of retraining.
+
+Each artifact directory holds:
+- model.pt: the model weights and scaler state, written by transfer_model.save_model()
+- metadata.json: key, table, hyperparameters, row count, losses and creation time, plus the
+  data_key (hash of the training rows alone) and data_version (the snapshot state trained on)
+
+The directory listing is the registry: list_artifacts() reads every metadata.json and
+evict_artifacts() removes all but the newest artifacts of a table. Which artifact of a table is
+served is not decided by age: promote_artifact() records it in ARTIFACT_DIR/.current/<table>.json,
+`cli.py train` promotes what it trained (or found cached) for the current data, and
+current_artifact() is what models/predictor.py serves. Experiments, benchmarks and sweeps store
+artifacts without changing what is served.
+'''
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts'))
+
+# Bump when the saved file layout or the training procedure changes, so old keys stop matching
+ARTIFACT_FORMAT = 1
+
+MODEL_FILE = 'model.pt'
+METADATA_FILE = 'metadata.json'
+
+# Directory of the per-table pointers to the served artifact; hidden, so it is never taken for a key
+CURRENT_DIR = '.current'
+
+
+def artifact_key(ids, values, hyperparams):
+    """Hash of the training rows and hyperparameters, used as the artifact directory name."""
+    digest = hashlib.sha256()
+    digest.update(str(ARTIFACT_FORMAT).encode('utf-8'))
+    digest.update('\n'.join(map(str, ids)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    digest.update(json.dumps(hyperparams, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:24]
+
+
+def data_key(ids, values):
+    """Hash of the training rows alone, recorded in the metadata to tell which data a model saw."""
+    digest = hashlib.sha256()
+    digest.update('\n'.join(map(str, ids)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:24]
+
+
+def artifact_path(key, filename=''):
+    return os.path.join(ARTIFACT_DIR, key, filename)
+
+
+def artifact_exists(key):
+    return os.path.exists(artifact_path(key, METADATA_FILE))
+
+
+def new_artifact_dir(key):
+    """Create an empty temporary directory that commit_artifact() will move to the key's path."""
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    tmp_dir = os.path.join(ARTIFACT_DIR, f".tmp-{key}-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def commit_artifact(tmp_dir, key, metadata):
+    """Write metadata.json into tmp_dir and atomically publish it as the artifact for key."""
+    metadata = dict(metadata, key=key, created_at=time.time())
+    with open(os.path.join(tmp_dir, METADATA_FILE), 'w') as file:
+        json.dump(metadata, file, indent=2)
+    try:
+        os.rename(tmp_dir, artifact_path(key))
+    except OSError:
+        # Another process stored the same key first; both artifacts are equivalent
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return metadata
+
+
+def read_metadata(key):
+    with open(artifact_path(key, METADATA_FILE)) as file:
+        return json.load(file)
+
+
+def list_artifacts(table_name=None):
+    """Metadata of every stored artifact, newest first, optionally limited to one table."""
+    if not os.path.isdir(ARTIFACT_DIR):
+        return []
+    artifacts = []
+    for key in os.listdir(ARTIFACT_DIR):
+        if key.startswith('.') or not artifact_exists(key):
+            continue
+        metadata = read_metadata(key)
+        if table_name is None or metadata.get('table') == table_name:
+            artifacts.append(metadata)
+    return sorted(artifacts, key=lambda m: m['created_at'], reverse=True)
+
+
+def latest_artifact(table_name):
+    """Metadata of the newest artifact trained on table_name, or None."""
+    artifacts = list_artifacts(table_name)
+    return artifacts[0] if artifacts else None
+
+
+def current_path(table_name):
+    return os.path.join(ARTIFACT_DIR, CURRENT_DIR, f"{table_name}.json")
+
+
+def promote_artifact(table_name, key):
+    """Make the artifact key the one served for table_name."""
+    metadata = read_metadata(key)
+    os.makedirs(os.path.join(ARTIFACT_DIR, CURRENT_DIR), exist_ok=True)
+    path = current_path(table_name)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        json.dump({'key': key, 'data_version': metadata.get('data_version'), 'promoted_at': time.time()}, file)
+    os.replace(tmp_path, path)
+    return metadata
+
+
+def current_key(table_name):
+    """Key of the artifact promoted for table_name, or None."""
+    try:
+        with open(current_path(table_name)) as file:
+            return json.load(file)['key']
+    except FileNotFoundError:
+        return None
+
+
+def current_artifact(table_name):
+    """Metadata of the artifact promoted for table_name, or None if none was promoted or it is gone."""
+    key = current_key(table_name)
+    return read_metadata(key) if key is not None and artifact_exists(key) else None
+
+
+def remove_artifact(key):
+    shutil.rmtree(artifact_path(key), ignore_errors=True)
+
+
+def evict_artifacts(keep=3, table_name=None):
+    """Remove all but the `keep` newest artifacts of each table. Returns the removed keys.
+
+    The promoted artifact of a table is kept even when it is older.
+    """
+    by_table = {}
+    for metadata in list_artifacts(table_name):
+        by_table.setdefault(metadata.get('table'), []).append(metadata)
+    removed = []
+    for table, artifacts in by_table.items():
+        current = current_key(table) if table is not None else None
+        for metadata in artifacts[keep:]:
+            if metadata['key'] == current:
+                continue
+            remove_artifact(metadata['key'])
+            removed.append(metadata['key'])
+    return removed
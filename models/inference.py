@@ -0,0 +1,239 @@
+'''
+Inference backends for trained TransferModel artifacts.
+
+TransferModel is a tiny MLP, so an eager forward pass is mostly Python and autograd overhead. Next
+to model.pt, an artifact carries exported forms of the same network that map raw bsl_0days_avg
+values straight to the six predicted columns:
+- torchscript (model.ts): the network traced to TorchScript, with both StandardScalers folded into
+  its first and last Linear layers
+- numpy (model.npz): the same folded layers as float32 arrays, evaluated with NumPy matmuls;
+  serving with this backend never imports torch
+
+Both are written when the artifact is stored (models/transfer_model.py store_artifact()), so a
+serving process never has to export. Artifacts stored before that can be exported with
+    python -m models.inference <artifact key> ...
+
+The serving backend is chosen with the INFERENCE_BACKEND environment variable (torch, torchscript
+or numpy; default torch).
+
+quantized (model_int8.ts) is the network with dynamically quantized int8 Linear layers, for
+benchmarking only. Dynamic quantization picks the activation range per batch, so a gene's prediction
+depends on the other values of its batch: one very large baseline shifts every other prediction.
+The scalers are applied in float outside the quantized layers to keep inputs near unit range, but
+the error is still far above the float backends (see the predict stage of benchmarks/run_benchmarks.py,
+which checks every backend against ACCURACY_TOLERANCE), so it is not a serving backend.
+'''
+import argparse
+import os
+
+import numpy as np
+
+from models.artifacts import MODEL_FILE, artifact_path
+
+# Backends that INFERENCE_BACKEND and get_predictor() accept
+SERVING_BACKENDS = ('torch', 'torchscript', 'numpy')
+# Every backend, including the ones that are only benchmarked
+BACKENDS = SERVING_BACKENDS + ('quantized',)
+
+# Exports written with every new artifact
+SERVING_EXPORTS = ('torchscript', 'numpy')
+
+# Largest error relative to the torch backend, as a fraction of the largest predicted value, that
+# the benchmark accepts for a backend
+ACCURACY_TOLERANCE = 1e-4
+
+EXPORT_FILES = {
+    'torchscript': 'model.ts',
+    'quantized': 'model_int8.ts',
+    'numpy': 'model.npz',
+}
+
+
+def default_backend():
+    backend = os.getenv("INFERENCE_BACKEND", "torch")
+    if backend not in SERVING_BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {backend}. Expected one of {SERVING_BACKENDS}")
+    return backend
+
+
+def model_layers(model):
+    """[(weight, bias), ...] float64 arrays of model's Linear layers."""
+    return [(module.weight.detach().double().numpy().copy(), module.bias.detach().double().numpy().copy())
+            for module in model.fc if hasattr(module, 'weight')]
+
+
+def fold_scalers(model, input_scaler, output_scaler):
+    """model_layers() of model with both scalers folded in.
+
+    The first layer absorbs (x - mean) / scale of the input scaler and the last layer absorbs
+    y * scale + mean of the output scaler, so the layers map raw values to raw predictions.
+    """
+    layers = model_layers(model)
+    in_mean, in_scale = input_scaler.mean_, input_scaler.scale_
+    weight, bias = layers[0]
+    layers[0] = (weight / in_scale, bias - weight @ (in_mean / in_scale))
+    out_mean, out_scale = output_scaler.mean_, output_scaler.scale_
+    weight, bias = layers[-1]
+    layers[-1] = (weight * out_scale[:, None], bias * out_scale + out_mean)
+    return layers
+
+
+def _linear_module(layers):
+    import torch
+    import torch.nn as nn
+
+    modules = []
+    for i, (weight, bias) in enumerate(layers):
+        linear = nn.Linear(weight.shape[1], weight.shape[0])
+        with torch.no_grad():
+            linear.weight.copy_(torch.from_numpy(weight))
+            linear.bias.copy_(torch.from_numpy(bias))
+        modules.append(linear)
+        if i < len(layers) - 1:
+            modules.append(nn.ReLU())
+    return nn.Sequential(*modules).eval()
+
+
+def _quantized_module(model, input_scaler, output_scaler):
+    """int8 dynamically quantized layers between float input scaling and output unscaling."""
+    import torch
+    import torch.nn as nn
+
+    class Affine(nn.Module):
+        def __init__(self, scale, shift):
+            super().__init__()
+            self.register_buffer('scale', torch.tensor(scale, dtype=torch.float32))
+            self.register_buffer('shift', torch.tensor(shift, dtype=torch.float32))
+
+        def forward(self, x):
+            return x * self.scale + self.shift
+
+    layers = torch.ao.quantization.quantize_dynamic(_linear_module(model_layers(model)), {nn.Linear},
+                                                    dtype=torch.qint8)
+    in_mean, in_scale = input_scaler.mean_, input_scaler.scale_
+    return nn.Sequential(Affine(1 / in_scale, -in_mean / in_scale), layers,
+                         Affine(output_scaler.scale_, output_scaler.mean_)).eval()
+
+
+def export_model(model, input_scaler, output_scaler, directory, backends=SERVING_EXPORTS):
+    """Write the exported forms of a model to directory and return {backend: path}."""
+    import torch
+
+    layers = fold_scalers(model, input_scaler, output_scaler)
+    paths = {}
+    for backend in backends:
+        path = os.path.join(directory, EXPORT_FILES[backend])
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        if backend == 'numpy':
+            arrays = {}
+            for i, (weight, bias) in enumerate(layers):
+                arrays[f"weight_{i}"] = weight.astype(np.float32)
+                arrays[f"bias_{i}"] = bias.astype(np.float32)
+            with open(tmp_path, 'wb') as file:
+                np.savez(file, **arrays)
+        else:
+            if backend == 'quantized':
+                module = _quantized_module(model, input_scaler, output_scaler)
+            else:
+                module = _linear_module(layers)
+            with torch.no_grad():
+                traced = torch.jit.trace(module, torch.zeros(8, 1))
+            torch.jit.save(torch.jit.freeze(traced), tmp_path)
+        os.replace(tmp_path, path)
+        paths[backend] = path
+    return paths
+
+
+def export_artifact(key, backends=SERVING_EXPORTS):
+    """Export the model of an artifact next to its model.pt and return {backend: path}."""
+    from models.transfer_model import load_model
+
+    return export_model(*load_model(artifact_path(key, MODEL_FILE)), artifact_path(key), backends)
+
+
+class TorchEngine:
+    """The eager TransferModel with its sklearn scalers, as trained."""
+
+    def __init__(self, path):
+        from models.transfer_model import load_model
+
+        self.model, self.input_scaler, self.output_scaler = load_model(path)
+
+    def predict(self, bsl_values):
+        from models.transfer_model import predict_batch
+
+        return predict_batch(bsl_values, self.model, self.input_scaler, self.output_scaler)
+
+
+class TorchScriptEngine:
+    """A traced (and possibly quantized) module with the scalers folded in."""
+
+    def __init__(self, path):
+        import torch
+
+        self._torch = torch
+        self.module = torch.jit.load(path)
+
+    def predict(self, bsl_values):
+        inputs = self._torch.from_numpy(np.asarray(bsl_values, dtype=np.float32).reshape(-1, 1))
+        with self._torch.inference_mode():
+            return self.module(inputs).numpy().astype(np.float64)
+
+
+class NumpyEngine:
+    """Folded float32 weights evaluated with NumPy; torch is never imported."""
+
+    def __init__(self, path):
+        with np.load(path) as archive:
+            count = len(archive.files) // 2
+            # Stored as (out, in) like torch; transposed once so each layer is a plain x @ weight
+            self.layers = [(np.ascontiguousarray(archive[f"weight_{i}"].T), archive[f"bias_{i}"])
+                           for i in range(count)]
+
+    def predict(self, bsl_values):
+        x = np.asarray(bsl_values, dtype=np.float32).reshape(-1, 1)
+        for i, (weight, bias) in enumerate(self.layers):
+            x = x @ weight
+            x += bias
+            if i < len(self.layers) - 1:
+                np.maximum(x, 0, out=x)
+        return x.astype(np.float64)
+
+
+ENGINES = {
+    'torch': TorchEngine,
+    'torchscript': TorchScriptEngine,
+    'quantized': TorchScriptEngine,
+    'numpy': NumpyEngine,
+}
+
+
+def load_engine(key, backend=None):
+    """Inference engine of an artifact for backend (default: INFERENCE_BACKEND).
+
+    Raises FileNotFoundError if the artifact has no export for backend; serving never exports, so
+    the numpy backend stays free of torch.
+    """
+    backend = backend or default_backend()
+    if backend == 'torch':
+        return TorchEngine(artifact_path(key, MODEL_FILE))
+    path = artifact_path(key, EXPORT_FILES[backend])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Artifact {key} has no {backend} export; "
+                                f"create it with: python -m models.inference {key} --backends {backend}")
+    return ENGINES[backend](path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export stored model artifacts for the inference backends.")
+    parser.add_argument('keys', nargs='+', help="artifact keys")
+    parser.add_argument('--backends', nargs='+', choices=sorted(EXPORT_FILES), default=list(SERVING_EXPORTS))
+    args = parser.parse_args(argv)
+
+    for key in args.keys:
+        for backend, path in export_artifact(key, args.backends).items():
+            print(f"{key}: {backend} -> {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+'''
+Batch prediction service for TransferModel.
+
+A Predictor wraps the inference engine of a trained model. get_predictor() loads the served model
+of a strain once per process and hands out the same instance afterwards, so callers never retrain
+or reload. At most every ARTIFACT_CHECK_INTERVAL seconds it reads the strain's artifact pointer
+again and swaps in a new Predictor when `cli.py train` has promoted another model. Predictions are
+vectorized: any number of baseline values (or ensembl ids whose baselines are looked up in one
+query) go through the model as a single batch.
+
+The served model is the artifact promoted for a strain's table (see current_artifact() in
+models/artifacts.py), not simply the newest one, so benchmark, experimental and sweep artifacts
+are never served by accident. It runs through the backend selected by INFERENCE_BACKEND (see
+models/inference.py). With the numpy backend this module does not import torch.
+'''
+import os
+import threading
+import time
+
+import numpy as np
+from psycopg2 import sql
+
+from database.strains import DB_ID_COLUMN, STRAINS, VALUE_COLUMNS
+from instrumentation.metrics import count, timer
+from models.artifacts import current_key
+from models.inference import TorchEngine, default_backend, load_engine
+
+# Same as models.transfer_model, which is not imported here so serving can run without torch
+INPUT_COLUMN = VALUE_COLUMNS[0]
+OUTPUT_COLUMNS = VALUE_COLUMNS[1:]
+
+# Seconds a loaded Predictor is served before the artifact pointer is read again
+ARTIFACT_CHECK_INTERVAL = float(os.getenv("ARTIFACT_CHECK_INTERVAL", "5"))
+
+# (strain, backend) -> [artifact key, time of the last check, Predictor]
+_predictors = {}
+_predictors_lock = threading.Lock()
+
+
+class Predictor:
+    """Inference engine of a trained TransferModel, ready for batched prediction."""
+
+    def __init__(self, engine, backend='torch'):
+        self.engine = engine
+        self.backend = backend
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(TorchEngine(path))
+
+    def predict(self, bsl_values):
+        """Return an (n, 6) array of predicted OUTPUT_COLUMNS for n baseline values."""
+        bsl_values = np.asarray(bsl_values, dtype=np.float64).reshape(-1)
+        if bsl_values.size == 0:
+            return np.empty((0, len(OUTPUT_COLUMNS)))
+        count('sbm_rows_total', bsl_values.size, stage='inference', backend=self.backend)
+        with timer('sbm_stage_seconds', stage='inference', backend=self.backend):
+            return self.engine.predict(bsl_values)
+
+    def predict_ids(self, cursor, table_name, ensembl_ids=None):
+        """Predict for genes of table_name by looking up their baselines in one query.
+
+        With ensembl_ids=None every gene of the table is predicted. Returns (ids, predictions,
+        missing) where missing lists requested ids that are unknown or have no baseline value.
+        """
+        query = sql.SQL("SELECT {id}, {bsl} FROM {table} WHERE {bsl} IS NOT NULL").format(
+            id=sql.Identifier(DB_ID_COLUMN), bsl=sql.Identifier(INPUT_COLUMN),
+            table=sql.Identifier(table_name))
+        if ensembl_ids is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query + sql.SQL(" AND {} = ANY(%s)").format(sql.Identifier(DB_ID_COLUMN)),
+                           (list(ensembl_ids),))
+        rows = cursor.fetchall()
+        ids = [row[0] for row in rows]
+        predictions = self.predict([row[1] for row in rows])
+        found = set(ids)
+        missing = [i for i in ensembl_ids if i not in found] if ensembl_ids is not None else []
+        return ids, predictions, missing
+
+
+def get_predictor(strain, backend=None):
+    """Return the process-wide Predictor of a strain, loading its promoted artifact on first use.
+
+    backend defaults to INFERENCE_BACKEND. Once the cached Predictor is older than
+    ARTIFACT_CHECK_INTERVAL seconds, the promoted key is read again and another model replaces it.
+    Raises FileNotFoundError when no model was promoted for the strain yet.
+    """
+    backend = backend or default_backend()
+    entry = _predictors.get((strain, backend))
+    if entry is not None and time.monotonic() - entry[1] < ARTIFACT_CHECK_INTERVAL:
+        return entry[2]
+    with _predictors_lock:
+        entry = _predictors.get((strain, backend))
+        if entry is not None and time.monotonic() - entry[1] < ARTIFACT_CHECK_INTERVAL:
+            return entry[2]
+        table_name = STRAINS[strain]['table']
+        key = current_key(table_name)
+        if key is None:
+            if entry is not None:
+                # The pointer was removed under us; keep serving the loaded model
+                entry[1] = time.monotonic()
+                return entry[2]
+            raise FileNotFoundError(f"No trained model for {table_name}; run `python cli.py train` first")
+        if entry is None or entry[0] != key:
+            entry = [key, 0.0, Predictor(load_engine(key, backend), backend)]
+            _predictors[(strain, backend)] = entry
+        entry[1] = time.monotonic()
+        return entry[2]
+
+
+def clear_predictors():
+    """Forget loaded predictors so the next get_predictor() reloads them from disk."""
+    with _predictors_lock:
+        _predictors.clear()
@@ -0,0 +1,261 @@
+'''
+TransferModel and the functions to train it, save it and predict with it.
+
+The network predicts the six non-baseline expression columns of a strain table (flt/gc/viv at
+25 and 75 days) from bsl_0days_avg. `ML Transfer Model.py` is the script that trains it from the
+database; models/predictor.py serves predictions from a saved model.
+
+Trained models are stored as content-addressed artifacts (see models/artifacts.py): train_model()
+returns the stored artifact instead of retraining when the same data and hyperparameters were
+already trained on.
+'''
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import mean_squared_error
+
+from database.readers import iter_rows
+from database.strains import VALUE_COLUMNS
+from models.artifacts import (MODEL_FILE, artifact_exists, artifact_key, artifact_path, commit_artifact, data_key,
+                              new_artifact_dir, read_metadata)
+from models.inference import export_model
+from training.engine import fit
+
+# Model input and output columns of the strain tables
+INPUT_COLUMN = VALUE_COLUMNS[0]
+OUTPUT_COLUMNS = VALUE_COLUMNS[1:]
+
+# Default training settings. Every value is part of the artifact key.
+DEFAULT_HYPERPARAMS = {
+    'hidden_sizes': [64, 128],
+    'lr': 0.001,
+    'epochs': 100,  # 100 is a good solid number as most deep learning models shouldnt need more than that to train.
+    'batch_size': 256,  # None trains on the full training set every step
+    'patience': 10,  # Stop after this many epochs without a better validation loss; None disables it
+    'random_state': 42,
+}
+
+# Fetch data from the specified table in the database
+# Rows are ordered by ensembl_id so the same table contents always give the same artifact key
+def fetch_data(conn, table_name):
+    return list(iter_rows(conn, table_name))
+
+# Define a feed-forward neural network model structure
+class TransferModel(nn.Module):
+    def __init__(self, hidden_sizes=(64, 128)):
+        super(TransferModel, self).__init__()
+        self.hidden_sizes = list(hidden_sizes)
+        # Define the layers and activation functions
+        layers = []
+        width = 1  # Assuming bsl_0days_avg is 1-dimensional
+        for size in self.hidden_sizes:
+            layers += [nn.Linear(width, size), nn.ReLU()]
+            width = size
+        layers.append(nn.Linear(width, len(OUTPUT_COLUMNS)))  # Output: flt_25days_avg, ..., viv_75days_avg
+        self.fc = nn.Sequential(*layers)
+
+    # Define the forward propagation of the model
+    def forward(self, x):
+        return self.fc(x)
+
+def prepare_data(data):
+    """Turn the training data into (ids, values) arrays.
+
+    data is either rows of (ensembl_id, bsl_0days_avg, ...six outputs) as fetched from a strain
+    table, or a database.snapshot.Snapshot whose arrays are used without building Python rows.
+    """
+    if hasattr(data, 'ids') and hasattr(data, 'values'):
+        ids, values = np.asarray(data.ids), np.asarray(data.values)
+    else:
+        ids = np.array([item[0] for item in data], dtype=object)
+        values = np.array([item[1:] for item in data], dtype=np.float64)
+    # Genes with a missing (NULL) measurement would turn every loss into NaN
+    complete = ~np.isnan(values).any(axis=1)
+    return ids[complete], values[complete]
+
+def split_data(values, random_state=42):
+    """Scale (n, 7) training values and split them 70/15/15 into train, validation and test tensors.
+
+    Returns (input_scaler, output_scaler, (X_train, y_train, X_val, y_val, X_test, y_test)).
+    """
+    # Extract input and output columns from the fetched data
+    inputs = values[:, :1]  # bsl_0days_avg values as a 2D array for pytorch and scikitlearn
+    outputs = values[:, 1:]  # Other column values
+
+    # Normalize the data to have a mean of 0 and variance of 1
+    input_scaler = StandardScaler()
+    inputs = input_scaler.fit_transform(inputs)
+
+    output_scaler = StandardScaler()
+    outputs = output_scaler.fit_transform(outputs)
+
+    # Split the data into training, validation, and test sets
+    X_train, X_temp, y_train, y_temp = train_test_split(inputs, outputs, test_size=0.3, random_state=random_state)
+    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, random_state=random_state)
+
+    # Convert the datasets into PyTorch tensors for compatibility with PyTorch
+    tensors = tuple(torch.Tensor(array) for array in (X_train, y_train, X_val, y_val, X_test, y_test))
+    return input_scaler, output_scaler, tensors
+
+def evaluate(model, X_test, y_test):
+    """Mean squared error of model on the (scaled) test set."""
+    model.eval()
+    with torch.no_grad():
+        test_predictions = model(X_test)
+    return float(mean_squared_error(test_predictions.numpy(), y_test.numpy()))
+
+def data_version(data):
+    """The dataset_versions state of a snapshot (see database/snapshot.py), or None for plain rows."""
+    return getattr(data, 'meta', {}).get('state')
+
+def store_artifact(key, model, input_scaler, output_scaler, metadata):
+    """Save a trained model and its serving exports as the artifact key and return the committed metadata."""
+    tmp_dir = new_artifact_dir(key)
+    save_model(os.path.join(tmp_dir, MODEL_FILE), model, input_scaler, output_scaler)
+    # Exported now so serving processes never need torch to create them (see models/inference.py)
+    export_model(model, input_scaler, output_scaler, tmp_dir)
+    return commit_artifact(tmp_dir, key, metadata)
+
+def train_artifact(data, table_name=None, use_cache=True, checkpoint_path=None, verbose=True, **hyperparams):
+    """Train a TransferModel on a snapshot or rows of (ensembl_id, bsl_0days_avg, ...six outputs).
+
+    Hyperparameters default to DEFAULT_HYPERPARAMS. The result is saved as an artifact keyed by the
+    data and hyperparameters; with use_cache a previously saved artifact is loaded instead.
+    Returns (model, input_scaler, output_scaler, metadata); metadata['cached'] tells whether the
+    model was loaded rather than trained.
+    """
+    hyperparams = dict(DEFAULT_HYPERPARAMS, **hyperparams)
+    ids, values = prepare_data(data)
+    key = artifact_key(ids, values, hyperparams)
+    if use_cache and artifact_exists(key):
+        if verbose:
+            print(f"Loaded cached model artifact {key}")
+        return load_model(artifact_path(key, MODEL_FILE)) + (dict(read_metadata(key), cached=True),)
+
+    # Preprocess and Split Data
+    input_scaler, output_scaler, (X_train, y_train, X_val, y_val, X_test, y_test) = split_data(
+        values, hyperparams['random_state'])
+
+    # Define the Model Architecture and train it
+    torch.manual_seed(hyperparams['random_state'])
+    model = TransferModel(hyperparams['hidden_sizes'])
+    history = fit(model, X_train, y_train, X_val, y_val,
+                  epochs=hyperparams['epochs'], lr=hyperparams['lr'],
+                  batch_size=hyperparams['batch_size'], patience=hyperparams['patience'],
+                  checkpoint_path=checkpoint_path, seed=hyperparams['random_state'], verbose=verbose)
+
+    # Evaluate the Model
+    test_loss = evaluate(model, X_test, y_test)
+    if verbose:
+        print(f"Test Loss: {test_loss}")
+
+    # Save the trained model so the next run with the same data and settings can skip training
+    metadata = store_artifact(key, model, input_scaler, output_scaler, dict(history, **{
+        'table': table_name,
+        'hyperparams': hyperparams,
+        'rows': len(ids),
+        'test_loss': test_loss,
+        'data_key': data_key(ids, values),
+        'data_version': data_version(data),
+    }))
+    if verbose:
+        print(f"Saved model artifact {key}")
+    return model, input_scaler, output_scaler, dict(metadata, cached=False)
+
+def plot_losses(train_losses, val_losses, path=None):
+    """Plot the training and validation losses per epoch.
+
+    With path the figure is written to that file without a GUI backend, so it works headless (cron,
+    batch jobs, servers); otherwise it is shown in a window. matplotlib is only imported here.
+    """
+    if path is None:
+        import matplotlib.pyplot as plt
+        figure = plt.figure(figsize=(10, 6))
+    else:
+        # A bare Figure renders through Agg and never touches pyplot's interactive backend
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=(10, 6))
+    # Ploting the training data to show the model getting better over time
+    axes = figure.subplots()
+    axes.plot(train_losses, label="Training Loss", color="blue")
+    axes.plot(val_losses, label="Validation Loss", color="red")
+    axes.set_xlabel("Epochs")
+    axes.set_ylabel("Loss")
+    axes.set_title("Training and Validation Loss over Epochs")
+    axes.legend()
+    axes.grid(True)
+    if path is None:
+        plt.show()
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        figure.savefig(path)
+    return path
+
+def train_model(data, table_name=None, use_cache=True, plot_path=None, **hyperparams):
+    """Train (or load the cached artifact of) a TransferModel and plot its losses.
+
+    The losses are saved to plot_path if given, else shown. Returns (model, input_scaler,
+    output_scaler). See train_artifact() for the other arguments.
+    """
+    model, input_scaler, output_scaler, metadata = train_artifact(data, table_name, use_cache, **hyperparams)
+    if not metadata['cached']:
+        plot_losses(metadata['train_losses'], metadata['val_losses'], plot_path)
+    return model, input_scaler, output_scaler
+
+def predict_batch(bsl_values, model, input_scaler, output_scaler):
+    """Predict the six output columns for an array of baseline values in one forward pass."""
+    # Scale every value at once and run them through the model as a single (n, 1) tensor
+    bsl_values = np.asarray(bsl_values, dtype=np.float64).reshape(-1, 1)
+    bsl_tensor = torch.from_numpy(input_scaler.transform(bsl_values).astype(np.float32))
+
+    model.eval()
+    with torch.no_grad():
+        predictions = model(bsl_tensor)
+
+    # Postprocess the predictions
+    return output_scaler.inverse_transform(predictions.numpy())
+
+def predict_new_data(bsl_value, model, input_scaler, output_scaler):
+    # Preprocess the input value
+    print("Predicting values...")
+    return predict_batch([bsl_value], model, input_scaler, output_scaler)[0]
+
+def scaler_state(scaler):
+    """Plain-data copy of a fitted StandardScaler that can be saved without pickling sklearn."""
+    return {
+        'mean': scaler.mean_.tolist(),
+        'scale': scaler.scale_.tolist(),
+        'var': scaler.var_.tolist(),
+        'n_samples_seen': int(np.max(scaler.n_samples_seen_)),
+    }
+
+def scaler_from_state(state):
+    """Rebuild a fitted StandardScaler from scaler_state()."""
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(state['mean'], dtype=np.float64)
+    scaler.scale_ = np.asarray(state['scale'], dtype=np.float64)
+    scaler.var_ = np.asarray(state['var'], dtype=np.float64)
+    scaler.n_samples_seen_ = state['n_samples_seen']
+    scaler.n_features_in_ = len(scaler.mean_)
+    return scaler
+
+def save_model(path, model, input_scaler, output_scaler):
+    """Save the model weights and both scalers to a single file."""
+    torch.save({
+        'hidden_sizes': list(model.hidden_sizes),
+        'state_dict': model.state_dict(),
+        'input_scaler': scaler_state(input_scaler),
+        'output_scaler': scaler_state(output_scaler),
+    }, path)
+
+def load_model(path):
+    """Load a file written by save_model() and return (model, input_scaler, output_scaler)."""
+    checkpoint = torch.load(path, map_location='cpu')
+    model = TransferModel(checkpoint.get('hidden_sizes', (64, 128)))
+    model.load_state_dict(checkpoint['state_dict'])
+    model.eval()
+    return model, scaler_from_state(checkpoint['input_scaler']), scaler_from_state(checkpoint['output_scaler'])
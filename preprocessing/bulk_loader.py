@@ -0,0 +1,131 @@
+'''
+Streaming bulk loader for the per-strain OSD-253 CSV files.
+
+Instead of checking and inserting every row on its own, the CSV is read in chunks and each chunk
+is streamed into a temporary staging table with COPY FROM STDIN. Once the whole file is staged, a
+single anti-join against main_data reports every ensembl_id that has to be skipped, and one
+INSERT ... SELECT moves the remaining rows into the strain's partition of the expression table.
+
+Every strain is described by an entry in STRAINS (database/strains.py), so adding a new strain or
+study only needs a new entry there, which becomes a new partition. Each load bumps the strain
+table's stamp in dataset_versions so caches of the data know to refresh.
+'''
+import csv
+import io
+import itertools
+
+from psycopg2 import sql
+
+from database.strains import DB_ID_COLUMN, EXPRESSION_TABLE, VALUE_COLUMNS
+from database.versions import bump_version
+from instrumentation.metrics import count, timer
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Suffixes that keep staging tables of one session apart without dropping anything
+_staging_ids = itertools.count()
+
+
+def column_mapping(strain_config):
+    """Return the {database column: CSV column} mapping for a strain configuration."""
+    mapping = {DB_ID_COLUMN: strain_config['csv_id_column']}
+    for column in VALUE_COLUMNS:
+        mapping[column] = strain_config['csv_prefix'] + column
+    return mapping
+
+
+def iter_csv_chunks(filename, column_map, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of rows from the CSV, with values ordered like the keys of column_map."""
+    with open(filename, 'r', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        missing = [name for name in column_map.values() if name not in header]
+        if missing:
+            raise ValueError(f"{filename} is missing columns: {', '.join(missing)}")
+        positions = [header.index(name) for name in column_map.values()]
+
+        chunk = []
+        for row in reader:
+            chunk.append([row[i] for i in positions])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Stream rows into table with COPY FROM STDIN. Empty strings are loaded as NULL."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns)))
+    cursor.copy_expert(statement.as_string(cursor), buffer)
+
+
+def create_staging_table(cursor, table):
+    """Create an empty temporary copy of table and return its name. It is dropped on commit.
+
+    The name is new for every call, so several loads in one transaction never meet, and as a
+    temporary table it cannot collide with a permanent table of the same name.
+    """
+    staging = f"staging_{table}_{next(_staging_ids)}"
+    cursor.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {}) ON COMMIT DROP").format(
+        sql.Identifier(staging), sql.Identifier(table)))
+    return staging
+
+
+def load_strain_csv(cursor, filename, strain_config, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Bulk load one strain CSV into its partition of the expression table.
+
+    Rows whose ensembl_id is not in main_data are skipped and returned together; rows that are
+    already in the table are left untouched. progress, if given, is called with the number of rows
+    staged so far after every chunk. The caller is responsible for committing.
+    """
+    table = strain_config['table']
+    column_map = column_mapping(strain_config)
+    columns = list(column_map)
+
+    staging = create_staging_table(cursor, table)
+    rows_read = 0
+    chunks = iter_csv_chunks(filename, column_map, chunk_size)
+    while True:
+        with timer('sbm_stage_seconds', stage='csv_parse'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        with timer('sbm_stage_seconds', stage='copy'):
+            copy_rows(cursor, staging, columns, chunk)
+        count('sbm_rows_total', len(chunk), stage='copy')
+        rows_read += len(chunk)
+        if progress is not None:
+            progress(rows_read)
+
+    # One anti-join reports every id that is missing from main_data
+    cursor.execute(sql.SQL("""
+        SELECT s.ensembl_id FROM {staging} s
+        WHERE NOT EXISTS (SELECT 1 FROM main_data m WHERE m.ensembl_id = s.ensembl_id)
+        ORDER BY s.ensembl_id
+    """).format(staging=sql.Identifier(staging)))
+    skipped_ids = [row[0] for row in cursor.fetchall()]
+
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    cursor.execute(sql.SQL("""
+        INSERT INTO {expression} (study, strain, {columns})
+        SELECT %s, %s, {columns} FROM {staging} s
+        WHERE EXISTS (SELECT 1 FROM main_data m WHERE m.ensembl_id = s.ensembl_id)
+        ON CONFLICT (study, strain, ensembl_id) DO NOTHING
+    """).format(expression=sql.Identifier(EXPRESSION_TABLE), columns=column_list, staging=sql.Identifier(staging)),
+        (strain_config['study'], strain_config['strain']))
+    inserted = cursor.rowcount
+    if inserted:
+        bump_version(cursor, table)
+
+    return {
+        'table': table,
+        'rows_read': rows_read,
+        'inserted': inserted,
+        'skipped_ids': skipped_ids,
+    }
@@ -0,0 +1,364 @@
+'''
+Streaming sort-merge of per-strain processed CSV files into one wide cross-strain dataset.
+
+The per-strain outputs of pipeline.py (processed_data_c3h.csv, processed_data_c57.csv, ...) hold
+one row per gene, in the order of the raw matrix rather than sorted by id. merge_files() therefore
+sorts every file externally first: one thread per file parses it in row chunks and writes each
+chunk, sorted by normalized id, as a run of .npy files next to the dataset being built. The header
+may be spelled ensembl_id or ensmbl_id, ids are stripped and lose any Ensembl version suffix (.12).
+The runs of a file are k-way merged back into chunks in id order (a file that was already sorted is
+read back run by run), and the files are then joined on the id: each step emits every id up to the
+smallest last id buffered by a file that is not exhausted yet. Memory is bounded by chunk_size per
+file rather than by the size of the data. A gene missing from a strain gets NaN in that strain's
+columns (a full outer join); an id repeated within a file raises ValueError.
+
+The result is written to MERGED_DIR/<name>/ (default: data/merged/) as:
+- ids.npy: the normalized ids, sorted, as a fixed-width string array; row i of the dataset is ids[i]
+- values-00000.npy, values-00001.npy, ...: float64 chunks of chunk_size rows, stored column-major so
+  a column is contiguous within a chunk
+- meta.json: the id column, value columns, source files, row count and chunk size
+
+MergedDataset memory-maps the chunks. Looking a gene up is a binary search over ids.npy and a read
+of one row of one chunk, so no file is scanned and nothing is joined in pandas.
+
+Usage:
+    python -m preprocessing.merge data/processed/processed_data_c3h.csv data/processed/processed_data_c57.csv
+'''
+import argparse
+import csv
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from database.strains import DB_ID_COLUMN
+from instrumentation.metrics import count, timer
+from instrumentation.profiling import profiled
+
+MERGED_DIR = os.getenv("MERGED_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'merged'))
+
+# Spellings of the id column header in processed files; pipeline.py writes ensmbl_id
+ID_HEADERS = ('ensembl_id', 'ensmbl_id')
+
+VERSION_SUFFIX = re.compile(r'\.\d+$')
+
+DEFAULT_CHUNK_SIZE = 10000
+
+IDS_FILE = 'ids.npy'
+META_FILE = 'meta.json'
+
+
+def chunk_filename(index):
+    return f"values-{index:05d}.npy"
+
+
+def normalize_ids(ids):
+    """Strip whitespace and the version suffix of Ensembl ids, e.g. ' ENSMUSG00000000001.4' -> 'ENSMUSG00000000001'."""
+    return np.array([VERSION_SUFFIX.sub('', str(i).strip()) for i in ids], dtype=str)
+
+
+class _SortedCsv:
+    """Chunks of (ids, values) of one processed CSV in normalized id order, sorted externally.
+
+    The file is split into sorted runs on the executor as soon as the source is created, so the
+    files of a merge are parsed in parallel; next_chunk() then merges the runs of this file.
+    """
+
+    def __init__(self, path, chunk_size, executor, runs_dir):
+        self.path = path
+        with open(path, newline='') as file:
+            header = next(csv.reader(file))
+        if header[0].strip().lower() not in ID_HEADERS:
+            raise ValueError(f"{path} does not start with an id column ({' or '.join(ID_HEADERS)})")
+        self.columns = header[1:]
+        self.chunk_size = chunk_size
+        self._id_header = header[0]
+        self._runs_dir = runs_dir
+        self._chunks = None
+        self._last_id = None
+        self._pending = executor.submit(self._write_runs)
+
+    def _write_runs(self):
+        """Write every chunk of the file sorted by id; returns (run paths, whether the file was sorted)."""
+        os.makedirs(self._runs_dir, exist_ok=True)
+        reader = pd.read_csv(self.path, chunksize=self.chunk_size, dtype={self._id_header: str},
+                             float_precision='round_trip')
+        runs = []
+        presorted = True
+        last_id = None
+        for index, chunk in enumerate(reader):
+            ids = normalize_ids(chunk.iloc[:, 0].to_numpy())
+            values = chunk.iloc[:, 1:].to_numpy(dtype=np.float64)
+            if len(ids) == 0:
+                continue
+            if presorted and (np.any(ids[1:] < ids[:-1]) or (last_id is not None and ids[0] < last_id)):
+                presorted = False
+            if not presorted:
+                order = np.argsort(ids, kind='stable')
+                ids, values = ids[order], values[order]
+            last_id = ids[-1]
+            stem = os.path.join(self._runs_dir, f"run-{index:05d}")
+            np.save(stem + '-ids.npy', ids)
+            np.save(stem + '-values.npy', values)
+            runs.append(stem)
+        return runs, presorted
+
+    def _merge_runs(self, stems, presorted):
+        runs = [(np.load(stem + '-ids.npy', mmap_mode='r'), np.load(stem + '-values.npy', mmap_mode='r'))
+                for stem in stems]
+        if presorted:
+            yield from runs
+            return
+        # A window per run keeps every step at no more than chunk_size rows
+        window = max(1, self.chunk_size // max(1, len(runs)))
+        starts = [0] * len(runs)
+        while True:
+            active = [i for i, (ids, _) in enumerate(runs) if starts[i] < len(ids)]
+            if not active:
+                return
+            # Ids up to the smallest last id of the windows cannot appear later in any run
+            frontier = min(runs[i][0][min(starts[i] + window, len(runs[i][0])) - 1] for i in active)
+            id_parts, value_parts = [], []
+            for i in active:
+                ids, values = runs[i]
+                end = starts[i] + int(np.searchsorted(ids[starts[i]:], frontier, side='right'))
+                id_parts.append(ids[starts[i]:end])
+                value_parts.append(values[starts[i]:end])
+                starts[i] = end
+            ids = np.concatenate(id_parts)
+            order = np.argsort(ids, kind='stable')
+            yield ids[order], np.concatenate(value_parts)[order]
+
+    def next_chunk(self):
+        """The next (ids, values) chunk, or None once the file is exhausted."""
+        if self._chunks is None:
+            self._chunks = self._merge_runs(*self._pending.result())
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return None
+        ids, values = chunk
+        # Strictly increasing ids within the chunk and across the chunk boundary
+        repeated = np.flatnonzero(ids[1:] == ids[:-1])
+        if len(repeated) or (self._last_id is not None and len(ids) and ids[0] == self._last_id):
+            repeated_id = ids[repeated[0]] if len(repeated) else self._last_id
+            raise ValueError(f"{self.path} repeats {DB_ID_COLUMN} {repeated_id}; "
+                             "the merge needs one row per gene")
+        if len(ids):
+            self._last_id = ids[-1]
+        return np.asarray(ids), np.asarray(values)
+
+
+class _ChunkWriter:
+    """Collects merged rows and writes them out in chunks of exactly chunk_size rows."""
+
+    def __init__(self, directory, width, chunk_size):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.chunks = 0
+        self.rows = 0
+        self._blocks = []
+        self._buffered = 0
+        self._width = width
+
+    def append(self, values):
+        self._blocks.append(values)
+        self._buffered += len(values)
+        self.rows += len(values)
+        while self._buffered >= self.chunk_size:
+            self._flush(self.chunk_size)
+
+    def close(self):
+        if self._buffered:
+            self._flush(self._buffered)
+
+    def _flush(self, size):
+        buffered = np.vstack(self._blocks) if self._blocks else np.empty((0, self._width))
+        # Column-major, so the columns of a chunk are contiguous on disk
+        np.save(os.path.join(self.directory, chunk_filename(self.chunks)), np.asfortranarray(buffered[:size]))
+        self.chunks += 1
+        self._blocks = [buffered[size:]]
+        self._buffered = len(buffered) - size
+
+
+def merged_path(name):
+    return os.path.join(MERGED_DIR, name)
+
+
+def _write_merged(directory, paths, name, chunk_size, progress):
+    """Write the files of the merged dataset of paths to directory."""
+    runs_dir = os.path.join(directory, 'runs')
+    with ThreadPoolExecutor(max_workers=len(paths) or 1, thread_name_prefix='merge-sort') as executor:
+        sources = [_SortedCsv(path, chunk_size, executor, os.path.join(runs_dir, str(i)))
+                   for i, path in enumerate(paths)]
+        columns = [column for source in sources for column in source.columns]
+        repeated = sorted({column for column in columns if columns.count(column) > 1})
+        if repeated:
+            raise ValueError(f"Columns appear in more than one file: {', '.join(repeated)}")
+        # Column range of every source in the merged rows
+        offsets = np.cumsum([0] + [len(source.columns) for source in sources])
+
+        writer = _ChunkWriter(directory, len(columns), chunk_size)
+        id_blocks = []
+        buffers = [None] * len(sources)
+        exhausted = [False] * len(sources)
+        while True:
+            with timer('sbm_stage_seconds', stage='csv_parse'):
+                for i, source in enumerate(sources):
+                    while not exhausted[i] and (buffers[i] is None or len(buffers[i][0]) == 0):
+                        buffers[i] = source.next_chunk()
+                        exhausted[i] = buffers[i] is None
+            active = [buffer for buffer, done in zip(buffers, exhausted) if not done]
+            if not active:
+                break
+
+            with timer('sbm_stage_seconds', stage='merge'):
+                # Ids up to the smallest last buffered id are complete in every file: later chunks
+                # of any file only hold larger ids
+                frontier = min(ids[-1] for ids, _ in active)
+                ends = [np.searchsorted(buffer[0], frontier, side='right') if not done else 0
+                        for buffer, done in zip(buffers, exhausted)]
+                ids = np.unique(np.concatenate([buffer[0][:end] for buffer, end, done
+                                                in zip(buffers, ends, exhausted) if not done]))
+                block = np.full((len(ids), len(columns)), np.nan)
+                for i, (buffer, end) in enumerate(zip(buffers, ends)):
+                    if exhausted[i] or end == 0:
+                        continue
+                    source_ids, source_values = buffer
+                    block[np.searchsorted(ids, source_ids[:end]), offsets[i]:offsets[i + 1]] = source_values[:end]
+                    buffers[i] = (source_ids[end:], source_values[end:])
+            id_blocks.append(ids)
+            writer.append(block)
+            count('sbm_rows_total', len(ids), stage='merge')
+            if progress is not None:
+                progress(writer.rows)
+    writer.close()
+    shutil.rmtree(runs_dir, ignore_errors=True)
+
+    np.save(os.path.join(directory, IDS_FILE), np.concatenate(id_blocks) if id_blocks else np.array([], dtype=str))
+    with open(os.path.join(directory, META_FILE), 'w') as file:
+        json.dump({'name': name, 'id_column': DB_ID_COLUMN, 'columns': columns,
+                   'sources': [os.path.abspath(path) for path in paths], 'rows': writer.rows,
+                   'chunk_size': chunk_size, 'chunks': writer.chunks}, file, indent=2)
+
+
+def merge_files(paths, name='merged', chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Sort-merge the processed CSV files at paths into the merged dataset name and open it.
+
+    The files may list their genes in any order; they are sorted by normalized id on the way (see
+    the module docstring), and a file that repeats an id raises ValueError. Value columns keep their
+    headers, which must differ between files.
+    progress, if given, is called with the number of merged rows after every step. An older
+    dataset of the same name is replaced atomically.
+    """
+    os.makedirs(MERGED_DIR, exist_ok=True)
+    final_dir = merged_path(name)
+    tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        _write_merged(tmp_dir, paths, name, chunk_size, progress)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # Swap the directories; readers that still have the old files mapped keep working
+    old_dir = f"{final_dir}.old-{os.getpid()}"
+    if os.path.exists(final_dir):
+        os.rename(final_dir, old_dir)
+    os.rename(tmp_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return MergedDataset(final_dir)
+
+
+class MergedDataset:
+    """Memory-mapped merged dataset written by merge_files(). Rows are sorted by id."""
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as file:
+            self.meta = json.load(file)
+        self._mode = 'r' if mmap else None
+        self.ids = np.load(os.path.join(path, IDS_FILE), mmap_mode=self._mode)
+        self.columns = self.meta['columns']
+        self.chunk_size = self.meta['chunk_size']
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, ensembl_id):
+        return self.row_index([ensembl_id])[0] >= 0
+
+    def chunk(self, index):
+        """The values of chunk index, opened on first use."""
+        values = self._chunks.get(index)
+        if values is None:
+            values = np.load(os.path.join(self.path, chunk_filename(index)), mmap_mode=self._mode)
+            self._chunks[index] = values
+        return values
+
+    def iter_chunks(self):
+        """Yield (ids, values) chunk by chunk, in id order."""
+        for index in range(self.meta['chunks']):
+            start = index * self.chunk_size
+            values = self.chunk(index)
+            yield self.ids[start:start + len(values)], values
+
+    def row_index(self, ensembl_ids):
+        """Row of each id (-1 when absent), found by binary search over the sorted ids."""
+        ensembl_ids = normalize_ids(ensembl_ids)
+        if len(self.ids) == 0:
+            return np.full(len(ensembl_ids), -1)
+        positions = np.minimum(np.searchsorted(self.ids, ensembl_ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == ensembl_ids, positions, -1)
+
+    def row(self, ensembl_id):
+        """Values of one gene; raises KeyError for unknown ids."""
+        position = self.row_index([ensembl_id])[0]
+        if position < 0:
+            raise KeyError(ensembl_id)
+        return np.array(self.chunk(position // self.chunk_size)[position % self.chunk_size])
+
+    def rows(self, ensembl_ids):
+        """(n, columns) values of ensembl_ids, NaN for unknown ids."""
+        positions = self.row_index(ensembl_ids)
+        values = np.full((len(positions), len(self.columns)), np.nan)
+        for i, position in enumerate(positions.tolist()):
+            if position >= 0:
+                values[i] = self.chunk(position // self.chunk_size)[position % self.chunk_size]
+        return values
+
+    def column(self, name):
+        """One column over every gene, read chunk by chunk."""
+        index = self.columns.index(name)
+        return np.concatenate([values[:, index] for _, values in self.iter_chunks()]
+                              or [np.empty(0)])
+
+
+def load_merged(name='merged', mmap=True):
+    """Open the merged dataset name; raises FileNotFoundError if it was never built."""
+    path = merged_path(name)
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        raise FileNotFoundError(f"No merged dataset {name} in {MERGED_DIR}")
+    return MergedDataset(path, mmap=mmap)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sort-merge per-strain processed CSV files into one dataset.")
+    parser.add_argument('inputs', nargs='+', help="processed_data_*.csv files")
+    parser.add_argument('--name', default='merged', help="dataset name under MERGED_DIR")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows per read and per output chunk")
+    args = parser.parse_args(argv)
+
+    with profiled('merge'):
+        dataset = merge_files(args.inputs, args.name, args.chunk_size)
+    print(f"Merged {len(dataset)} genes x {len(dataset.columns)} columns into {dataset.path}")
+
+
+if __name__ == '__main__':
+    main()
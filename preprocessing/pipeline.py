@@ -0,0 +1,136 @@
+'''
+Chunked preprocessing of a raw OSD-253 expression matrix into per-strain averaged CSV files.
+
+The raw matrix has one row per gene: the id in the first column, then one column per sample, named
+like <organism>_<STRAIN>_<tissue>_<GROUP>_<days>_<replicate>. Every sample of the same strain, group
+and time point is a replicate; the output holds their average (zeros count as missing values) with
+one file per strain, e.g. processed_data_c3h.csv and processed_data_c57.csv.
+
+The matrix is streamed in row chunks, so peak memory is bounded by chunk_size rather than by the
+size of the raw file. The column -> group mapping is worked out once from the header, after which
+every chunk is averaged with NumPy index reductions and appended to the strain files.
+
+Usage:
+    python -m preprocessing.pipeline Mouse_data.csv --output-dir . --chunk-size 5000
+'''
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation.metrics import count, timer
+from instrumentation.profiling import profiled
+
+# Header of the id column in the processed files, spelled the way the loaders expect it
+ID_COLUMN = 'ensmbl_id'
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def group_name(column):
+    """Name of the averaged column a raw sample column belongs to, e.g. c3h_hej_flt_25days."""
+    parts = column.split('_')
+    if len(parts) < 5:
+        raise ValueError(f"Unexpected sample column name: {column}")
+    return f"{parts[1]}_{parts[3]}_{parts[4]}".lower().replace('-', '_')
+
+
+def strain_name(column):
+    """Normalized strain of a raw sample column, e.g. c3h_hej."""
+    return column.split('_')[1].lower().replace('-', '_')
+
+
+def output_filename(strain):
+    """Per-strain output file, e.g. processed_data_c3h.csv for c3h_hej."""
+    return f"processed_data_{strain.split('_')[0]}.csv"
+
+
+def build_layout(sample_columns):
+    """Work out once how the sample columns are reduced.
+
+    Returns (order, starts, groups, strains): sample positions ordered so replicates of a group are
+    contiguous, the offset where each group starts in that order, the sorted group names and
+    {strain: indexes into groups}.
+    """
+    names = [group_name(column) for column in sample_columns]
+    groups = sorted(set(names))
+    group_index = {name: i for i, name in enumerate(groups)}
+    codes = np.array([group_index[name] for name in names])
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(groups)))
+
+    strains = {}
+    for strain in dict.fromkeys(strain_name(column) for column in sample_columns):
+        strains[strain] = [i for i, name in enumerate(groups) if name.startswith(strain + '_')]
+    return order, starts, groups, strains
+
+
+def average_replicates(values, order, starts):
+    """Mean of every group of replicate columns, ignoring zeros and NaNs (all-missing -> NaN)."""
+    values = values[:, order]
+    missing = np.isnan(values) | (values == 0)
+    values[missing] = 0.0
+    sums = np.add.reduceat(values, starts, axis=1)
+    counts = np.add.reduceat(~missing, starts, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def preprocess(input_path, output_dir='.', chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Average the raw matrix at input_path into one CSV per strain in output_dir.
+
+    progress, if given, is called with the number of rows processed so far after every chunk.
+    Returns {strain: output path}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    reader = pd.read_csv(input_path, chunksize=chunk_size)
+    files = {}
+    paths = {}
+    rows_done = 0
+    try:
+        while True:
+            with timer('sbm_stage_seconds', stage='csv_parse'):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            if not files:
+                order, starts, groups, strains = build_layout(list(chunk.columns[1:]))
+                for strain, indexes in strains.items():
+                    paths[strain] = os.path.join(output_dir, output_filename(strain))
+                    files[strain] = open(paths[strain], 'w', newline='')
+                    header = [ID_COLUMN] + [groups[i] + '_avg' for i in indexes]
+                    files[strain].write(','.join(header) + '\n')
+
+            with timer('sbm_stage_seconds', stage='preprocess'):
+                ids = chunk.iloc[:, 0].to_numpy()
+                averages = average_replicates(chunk.iloc[:, 1:].to_numpy(dtype=np.float64), order, starts)
+                for strain, indexes in strains.items():
+                    frame = pd.DataFrame(averages[:, indexes])
+                    frame.insert(0, ID_COLUMN, ids)
+                    frame.to_csv(files[strain], header=False, index=False)
+            count('sbm_rows_total', len(chunk), stage='preprocess')
+            rows_done += len(chunk)
+            if progress is not None:
+                progress(rows_done)
+    finally:
+        for file in files.values():
+            file.close()
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Average raw OSD-253 replicates into per-strain CSV files.")
+    parser.add_argument('input', help="raw expression matrix, e.g. Mouse_data.csv")
+    parser.add_argument('--output-dir', default='.', help="directory for the processed_data_*.csv files")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows read per chunk")
+    args = parser.parse_args(argv)
+
+    with profiled('preprocess'):
+        paths = preprocess(args.input, args.output_dir, args.chunk_size)
+    for strain, path in paths.items():
+        print(f"Wrote {strain} averages to {path}")
+
+
+if __name__ == '__main__':
+    main()
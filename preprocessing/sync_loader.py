@@ -0,0 +1,184 @@
+'''
+Incremental, idempotent sync of a per-strain CSV into its partition of the expression table.
+
+Unlike load_strain_csv() in bulk_loader.py, which only adds ids that are not in the table yet, a sync
+makes the table match the file:
+- the SHA-256 of the file is compared with the newest entry of load_manifest for the table, and a
+  file that was already applied is skipped without being read, unless the table changed since
+  (its dataset_versions version differs) or this sync deletes missing rows and that one did not
+- if the local snapshot (database/snapshot.py) is current, the file is diffed against it in NumPy
+  and only new or changed rows are sent to the database; otherwise every row is staged and the
+  database compares them
+- new and changed rows are applied with one INSERT ... ON CONFLICT DO UPDATE, which leaves rows
+  with identical values untouched
+- with delete_missing, rows whose ids are no longer in the file are deleted
+
+Running the same sync twice changes nothing the second time, and a daily refresh costs the size of
+its diff rather than the size of the file.
+'''
+import hashlib
+import os
+
+import numpy as np
+from psycopg2 import sql
+
+from database.manifest import last_load, record_load
+from database.snapshot import has_snapshot, load_snapshot, table_state
+from database.strains import DB_ID_COLUMN, EXPRESSION_TABLE, VALUE_COLUMNS
+from database.versions import bump_version, fetch_versions
+from preprocessing.bulk_loader import (DEFAULT_CHUNK_SIZE, column_mapping, copy_rows, create_staging_table,
+                                       iter_csv_chunks)
+
+
+def file_digest(path, block_size=1024 * 1024):
+    """Hex SHA-256 of the file at path."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_strain_arrays(filename, strain_config, chunk_size=DEFAULT_CHUNK_SIZE):
+    """(ids, values) of a strain CSV, sorted by id. Empty cells are NaN; the last row of a repeated id wins."""
+    ids = []
+    blocks = []
+    for chunk in iter_csv_chunks(filename, column_mapping(strain_config), chunk_size):
+        ids.extend(row[0] for row in chunk)
+        blocks.append(np.array([[float(value) if value != '' else np.nan for value in row[1:]] for row in chunk],
+                               dtype=np.float64).reshape(-1, len(VALUE_COLUMNS)))
+    ids = np.array(ids, dtype=str)
+    values = np.vstack(blocks) if blocks else np.empty((0, len(VALUE_COLUMNS)))
+    # np.unique keeps the first occurrence, so search the reversed ids to keep the last one
+    _, first = np.unique(ids[::-1], return_index=True)
+    keep = len(ids) - 1 - first
+    return ids[keep], values[keep]
+
+
+def diff_arrays(old_ids, old_values, new_ids, new_values):
+    """Positions in new_ids of new or changed rows, and the ids of old_ids missing from new_ids.
+
+    Both id arrays must be sorted. NaN compares equal to NaN.
+    """
+    if len(old_ids) == 0:
+        return np.arange(len(new_ids)), old_ids[:0]
+    positions = np.minimum(np.searchsorted(old_ids, new_ids), len(old_ids) - 1)
+    found = old_ids[positions] == new_ids
+    old = np.asarray(old_values)[positions]
+    same = ((old == new_values) | (np.isnan(old) & np.isnan(new_values))).all(axis=1)
+    changed = np.flatnonzero(~(found & same))
+    deleted = old_ids[~np.isin(old_ids, new_ids)]
+    return changed, deleted
+
+
+def current_snapshot(cursor, table_name):
+    """The local snapshot of table_name if it matches the database, else None."""
+    if not has_snapshot(table_name):
+        return None
+    snapshot = load_snapshot(table_name)
+    return snapshot if snapshot.meta.get('state') == table_state(cursor, table_name) else None
+
+
+def table_version(cursor, table_name):
+    """Current dataset_versions version of table_name, or None before its first load."""
+    return fetch_versions(cursor).get(table_name, (None, None))[0]
+
+
+def already_synced(cursor, table_name, digest, delete_missing=False):
+    """Whether the newest sync of table_name applied the file with this digest and nothing changed since.
+
+    A sync without delete_missing does not cover one with it, and any write to the table after the
+    sync (a plain load, another file) bumps its version and makes the file apply again.
+    """
+    last = last_load(cursor, table_name)
+    return (last is not None and last['file_digest'] == digest
+            and (last['delete_missing'] or not delete_missing)
+            and last['table_version'] is not None and last['table_version'] == table_version(cursor, table_name))
+
+
+def _rows(ids, values):
+    for ensembl_id, row in zip(ids.tolist(), values.tolist()):
+        yield [ensembl_id] + ['' if value != value else repr(value) for value in row]
+
+
+def sync_strain_csv(cursor, filename, strain_config, chunk_size=DEFAULT_CHUNK_SIZE, delete_missing=False,
+                    force=False):
+    """Make a strain's partition match the CSV at filename and record the sync in load_manifest.
+
+    Rows whose ensembl_id is not in main_data are skipped and returned together. force applies the
+    file even if the manifest says it was already synced. The caller is responsible for committing.
+    """
+    table = strain_config['table']
+    result = {'table': table, 'file_skipped': False, 'rows_read': 0, 'inserted': 0, 'updated': 0,
+              'deleted': 0, 'skipped_ids': [], 'compared_with': None}
+    digest = file_digest(filename)
+    if not force and already_synced(cursor, table, digest, delete_missing):
+        result['file_skipped'] = True
+        return result
+
+    ids, values = read_strain_arrays(filename, strain_config, chunk_size)
+    result['rows_read'] = len(ids)
+    snapshot = current_snapshot(cursor, table)
+    if snapshot is not None:
+        changed, deleted = diff_arrays(snapshot.ids, snapshot.values, ids, values)
+        result['compared_with'] = 'snapshot'
+    else:
+        # Without a trustworthy local copy every row is staged and the database does the comparison
+        changed, deleted = np.arange(len(ids)), None
+        result['compared_with'] = 'database'
+
+    columns = [DB_ID_COLUMN] + VALUE_COLUMNS
+    staging = create_staging_table(cursor, table)
+    copy_rows(cursor, staging, columns, _rows(ids[changed], values[changed]))
+    key = {'study': strain_config['study'], 'strain': strain_config['strain']}
+
+    cursor.execute(sql.SQL("""
+        SELECT s.ensembl_id FROM {staging} s
+        WHERE NOT EXISTS (SELECT 1 FROM main_data m WHERE m.ensembl_id = s.ensembl_id)
+        ORDER BY s.ensembl_id
+    """).format(staging=sql.Identifier(staging)))
+    result['skipped_ids'] = [row[0] for row in cursor.fetchall()]
+    cursor.execute(sql.SQL("""
+        SELECT count(*) FROM {staging} s JOIN {expression} e
+        ON e.study = %(study)s AND e.strain = %(strain)s AND e.ensembl_id = s.ensembl_id
+    """).format(staging=sql.Identifier(staging), expression=sql.Identifier(EXPRESSION_TABLE)), key)
+    existing = cursor.fetchone()[0]
+
+    # Rows whose values did not change are filtered out by the WHERE and not rewritten
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    cursor.execute(sql.SQL("""
+        INSERT INTO {expression} AS e (study, strain, {columns})
+        SELECT %(study)s, %(strain)s, {columns} FROM {staging} s
+        WHERE EXISTS (SELECT 1 FROM main_data m WHERE m.ensembl_id = s.ensembl_id)
+        ON CONFLICT (study, strain, ensembl_id) DO UPDATE SET {assignments}
+        WHERE ({current}) IS DISTINCT FROM ({excluded})
+    """).format(
+        expression=sql.Identifier(EXPRESSION_TABLE), columns=column_list, staging=sql.Identifier(staging),
+        assignments=sql.SQL(', ').join(sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c))
+                                       for c in VALUE_COLUMNS),
+        current=sql.SQL(', ').join(sql.SQL("e.{}").format(sql.Identifier(c)) for c in VALUE_COLUMNS),
+        excluded=sql.SQL(', ').join(sql.SQL("EXCLUDED.{}").format(sql.Identifier(c)) for c in VALUE_COLUMNS)), key)
+    result['inserted'] = len(changed) - len(result['skipped_ids']) - existing
+    result['updated'] = cursor.rowcount - result['inserted']
+
+    if delete_missing:
+        if deleted is not None:
+            cursor.execute(sql.SQL("""
+                DELETE FROM {expression}
+                WHERE study = %(study)s AND strain = %(strain)s AND ensembl_id = ANY(%(ids)s)
+            """).format(expression=sql.Identifier(EXPRESSION_TABLE)), dict(key, ids=deleted.tolist()))
+        else:
+            cursor.execute(sql.SQL("""
+                DELETE FROM {expression} e WHERE e.study = %(study)s AND e.strain = %(strain)s
+                AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.ensembl_id = e.ensembl_id)
+            """).format(expression=sql.Identifier(EXPRESSION_TABLE), staging=sql.Identifier(staging)), key)
+        result['deleted'] = cursor.rowcount
+
+    version = table_version(cursor, table)
+    if result['inserted'] or result['updated'] or result['deleted'] or version is None:
+        # A table without a stamp gets one, so the manifest entry can tell later writes apart
+        bump_version(cursor, table)
+        version = table_version(cursor, table)
+    record_load(cursor, table, os.path.basename(filename), digest, result['rows_read'],
+                result['inserted'], result['updated'], result['deleted'], delete_missing, version)
+    return result
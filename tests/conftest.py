@@ -0,0 +1,35 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+@pytest.fixture
+def pg_cursor():
+    """Cursor on the TEST_DB_* PostgreSQL server inside a throwaway schema with the full schema created.
+
+    Everything runs in one transaction that is rolled back afterwards. Tests using it are skipped
+    when TEST_DB_HOST is not set.
+    """
+    if not os.getenv("TEST_DB_HOST"):
+        pytest.skip("TEST_DB_HOST is not set")
+    import psycopg2
+
+    from database.schema import create_schema
+
+    conn = psycopg2.connect(host=os.getenv("TEST_DB_HOST"), port=os.getenv("TEST_DB_PORT", "5432"),
+                            database=os.getenv("TEST_DB_NAME", "postgres"), user=os.getenv("TEST_DB_USER"),
+                            password=os.getenv("TEST_DB_PASSWORD"))
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA {schema}")
+            cursor.execute(f"SET LOCAL search_path TO {schema}")
+            create_schema(cursor)
+            yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+pytest.importorskip('flask')
+
+import models.predictor  # noqa: E402
+import webapp.api as api  # noqa: E402
+import webapp.gene_cache  # noqa: E402
+from database.strains import STRAINS  # noqa: E402
+from webapp.app import app  # noqa: E402
+
+PROFILES = {'ENSMUSG00000000001': {'c57_6j': {'bsl_0days_avg': 1.0}}}
+
+
+class FakeCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeResults:
+    groups = dict.fromkeys(STRAINS)
+
+    def top(self, group, contrast, n, direction):
+        return [{'ensembl_id': f"g{i}", 'direction': direction} for i in range(n)]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Stand-in for the database: counts borrowed connections and answers gene lookups from PROFILES."""
+    calls = {'connections': 0, 'fetched': []}
+
+    @contextmanager
+    def connection():
+        calls['connections'] += 1
+        yield type('FakeConnection', (), {'cursor': lambda self: FakeCursor()})()
+
+    def fetch_gene_profiles(cursor, ensembl_ids):
+        calls['fetched'].append(list(ensembl_ids))
+        return {i: PROFILES[i] for i in ensembl_ids if i in PROFILES}
+
+    monkeypatch.setattr(api, 'connection', connection)
+    monkeypatch.setattr(api, 'fetch_gene_profiles', fetch_gene_profiles)
+    monkeypatch.setattr(api, 'async_db_available', lambda: False)
+    monkeypatch.setattr(webapp.gene_cache, 'fetch_versions', lambda cursor: {})
+    monkeypatch.setattr(api, 'get_results', lambda: FakeResults())
+    api.gene_cache.invalidate()
+    yield calls
+    api.gene_cache.invalidate()
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+def test_gene_found_then_served_from_cache(client, db):
+    response = client.get('/api/gene/ENSMUSG00000000001')
+    assert response.status_code == 200
+    assert response.get_json()['strains'] == PROFILES['ENSMUSG00000000001']
+    connections = db['connections']
+    assert client.get('/api/gene/ENSMUSG00000000001').status_code == 200
+    assert db['fetched'] == [['ENSMUSG00000000001']]
+    assert db['connections'] == connections
+
+
+def test_gene_conditional_request(client, db):
+    etag = client.get('/api/gene/ENSMUSG00000000001').headers['ETag']
+    response = client.get('/api/gene/ENSMUSG00000000001', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_unknown_gene_is_a_json_404(client, db):
+    response = client.get('/api/gene/ENSMUSG99999999999')
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'Unknown ensembl_id ENSMUSG99999999999'}
+
+
+def test_bulk_genes_split_found_and_missing(client, db):
+    response = client.get('/api/genes?ids=ENSMUSG00000000001,ENSMUSG99999999999,ENSMUSG00000000001')
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert [gene['ensembl_id'] for gene in payload['genes']] == ['ENSMUSG00000000001']
+    assert payload['missing'] == ['ENSMUSG99999999999']
+
+
+def test_bulk_genes_errors_are_json(client, db):
+    response = client.get('/api/genes')
+    assert response.status_code == 400
+    assert 'ids' in response.get_json()['error']
+    response = client.get('/api/genes?ids=' + ','.join(f"g{i}" for i in range(api.MAX_BULK_IDS + 1)))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('query, status', [('n=3', 200), ('n=0', 400), ('n=-1', 400), ('n=x', 400),
+                                           ('group=nope', 400), ('contrast=nope', 400), ('direction=sideways', 400)])
+def test_analysis_top_validation(client, db, query, status):
+    response = client.get(f"/api/analysis/top?{query}")
+    assert response.status_code == status
+    if status == 200:
+        assert len(response.get_json()['genes']) == 3
+    else:
+        assert 'error' in response.get_json()
+
+
+def test_analysis_top_is_503_when_results_cannot_be_built(client, db, monkeypatch):
+    def get_results():
+        raise ConnectionError("database unreachable")
+
+    monkeypatch.setattr(api, 'get_results', get_results)
+    response = client.get('/api/analysis/top')
+    assert response.status_code == 503
+    assert response.is_json and 'not available' in response.get_json()['error']
+
+
+class FakePredictor:
+    def predict(self, bsl_values):
+        return np.outer(np.asarray(bsl_values, dtype=np.float64), np.ones(6))
+
+
+@pytest.fixture
+def served(monkeypatch):
+    monkeypatch.setattr(models.predictor, 'get_predictor', lambda strain: FakePredictor())
+
+
+def test_predict_values(client, db, served):
+    response = client.post('/api/predict', json={'strain': 'c57_6j', 'bsl_values': [1.0, 2.5]})
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert len(payload['columns']) == 6
+    assert payload['predictions'][1] == [2.5] * 6
+
+
+@pytest.mark.parametrize('body', [{'strain': 'nope', 'bsl_values': [1.0]}, {'strain': 'c57_6j'},
+                                  {'strain': 'c57_6j', 'bsl_values': [1.0], 'ensembl_ids': ['g1']},
+                                  {'strain': 'c57_6j', 'bsl_values': ['x']}])
+def test_predict_rejects_bad_bodies(client, db, served, body):
+    response = client.post('/api/predict', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_predict_without_a_model_is_503(client, db, monkeypatch):
+    def get_predictor(strain):
+        raise FileNotFoundError("No trained model for c57_6j_data; run `python cli.py train` first")
+
+    monkeypatch.setattr(models.predictor, 'get_predictor', get_predictor)
+    response = client.post('/api/predict', json={'strain': 'c57_6j', 'bsl_values': [1.0]})
+    assert response.status_code == 503
+    assert 'cli.py train' in response.get_json()['error']
+
+
+class FakeIndex:
+    def __contains__(self, ensembl_id):
+        return ensembl_id == 'g1'
+
+    def similar(self, ensembl_id, k):
+        return [{'ensembl_id': 'g2', 'score': 1.0}][:k]
+
+
+def test_similar_genes(client, db, monkeypatch):
+    monkeypatch.setattr(api, 'get_index', lambda strain, metric: FakeIndex())
+    response = client.get('/api/gene/g1/similar?strain=c57_6j&k=5')
+    assert response.status_code == 200
+    assert response.get_json()['strains'] == {'c57_6j': [{'ensembl_id': 'g2', 'score': 1.0}]}
+    assert client.get('/api/gene/g9/similar').status_code == 404
+
+
+def test_similar_genes_is_503_until_the_index_is_built(client, db, monkeypatch):
+    monkeypatch.setattr(api, 'get_index', lambda strain, metric: None if strain == 'c57_6j' else FakeIndex())
+    response = client.get('/api/gene/g1/similar')
+    assert response.status_code == 503
+    assert response.get_json() == {'error': "The pearson similarity index of c57_6j is still being built"}
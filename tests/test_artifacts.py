@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from models import artifacts
+from models.artifacts import (artifact_key, commit_artifact, current_artifact, current_key, data_key,
+                              evict_artifacts, latest_artifact, list_artifacts, new_artifact_dir, promote_artifact)
+
+
+@pytest.fixture(autouse=True)
+def artifact_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, 'ARTIFACT_DIR', str(tmp_path / 'artifacts'))
+
+
+def store(key, table='c57_6j_data', **metadata):
+    return commit_artifact(new_artifact_dir(key), key, dict(metadata, table=table))
+
+
+def test_artifact_key_is_stable():
+    ids = ['g1', 'g2']
+    values = np.array([[1.0, 2.0], [3.0, 4.0]])
+    key = artifact_key(ids, values, {'lr': 0.001, 'epochs': 10})
+    assert len(key) == 24
+    assert artifact_key(list(ids), values.astype(np.float32), {'epochs': 10, 'lr': 0.001}) == key
+    assert artifact_key(ids, np.asfortranarray(values), {'lr': 0.001, 'epochs': 10}) == key
+
+
+def test_artifact_key_changes_with_data_and_hyperparams():
+    ids = ['g1', 'g2']
+    values = np.array([[1.0, 2.0], [3.0, 4.0]])
+    key = artifact_key(ids, values, {'lr': 0.001})
+    assert artifact_key(['g1', 'g3'], values, {'lr': 0.001}) != key
+    assert artifact_key(ids, values + 1e-9, {'lr': 0.001}) != key
+    assert artifact_key(ids, values, {'lr': 0.01}) != key
+
+
+def test_data_key_ignores_hyperparams():
+    ids = ['g1']
+    values = np.array([[1.0, 2.0]])
+    assert data_key(ids, values) == data_key(ids, values.copy())
+    assert data_key(ids, values) != data_key(ids, values * 2)
+
+
+def test_served_artifact_is_the_promoted_one_not_the_newest():
+    store('old', data_version={'version': 3})
+    store('new', data_version={'version': 3})
+    assert latest_artifact('c57_6j_data')['key'] == 'new'
+    assert current_artifact('c57_6j_data') is None
+
+    promote_artifact('c57_6j_data', 'old')
+    assert current_key('c57_6j_data') == 'old'
+    assert current_artifact('c57_6j_data')['data_version'] == {'version': 3}
+    assert current_artifact('c3h_hej_data') is None
+
+
+def test_pointer_directory_is_not_listed_as_an_artifact():
+    store('a')
+    promote_artifact('c57_6j_data', 'a')
+    assert [metadata['key'] for metadata in list_artifacts()] == ['a']
+
+
+def test_eviction_keeps_the_promoted_artifact():
+    for key in ('a', 'b', 'c', 'd'):
+        store(key)
+    promote_artifact('c57_6j_data', 'a')
+    removed = evict_artifacts(keep=2)
+    assert removed == ['b']
+    assert sorted(os.listdir(artifacts.ARTIFACT_DIR)) == ['.current', 'a', 'c', 'd']
@@ -0,0 +1,73 @@
+import csv
+
+import pytest
+
+from database.strains import STRAINS, VALUE_COLUMNS
+from preprocessing.bulk_loader import (column_mapping, copy_rows, create_staging_table, iter_csv_chunks,
+                                       load_strain_csv)
+
+CONFIG = STRAINS['c57_6j']
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(repr(statement))
+
+
+def write_strain_csv(path, ids):
+    header = [CONFIG['csv_id_column']] + [CONFIG['csv_prefix'] + column for column in VALUE_COLUMNS]
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for i, ensembl_id in enumerate(ids):
+            writer.writerow([ensembl_id] + [float(i)] * (len(VALUE_COLUMNS) - 1) + [''])
+    return str(path)
+
+
+def test_column_mapping_prefixes_value_columns():
+    mapping = column_mapping(CONFIG)
+    assert mapping['ensembl_id'] == 'ensmbl_id'
+    assert mapping['bsl_0days_avg'] == 'c57_6j_bsl_0days_avg'
+    assert list(mapping)[1:] == VALUE_COLUMNS
+
+
+def test_iter_csv_chunks_reorders_columns_and_chunks(tmp_path):
+    path = write_strain_csv(tmp_path / 'strain.csv', ['g1', 'g2', 'g3'])
+    chunks = list(iter_csv_chunks(path, {'b': 'c57_6j_flt_25days_avg', 'a': 'ensmbl_id'}, chunk_size=2))
+    assert chunks == [[['0.0', 'g1'], ['1.0', 'g2']], [['2.0', 'g3']]]
+
+
+def test_iter_csv_chunks_reports_missing_columns(tmp_path):
+    path = tmp_path / 'strain.csv'
+    path.write_text('ensmbl_id\ng1\n')
+    with pytest.raises(ValueError, match='missing columns'):
+        next(iter_csv_chunks(str(path), column_mapping(CONFIG)))
+
+
+def test_staging_tables_are_temporary_and_never_dropped():
+    cursor = RecordingCursor()
+    first = create_staging_table(cursor, 'c57_6j_data')
+    second = create_staging_table(cursor, 'c57_6j_data')
+    assert first != second
+    assert all('DROP TABLE' not in statement for statement in cursor.statements)
+    assert all('CREATE TEMP TABLE' in statement and 'ON COMMIT DROP' in statement for statement in cursor.statements)
+
+
+def test_load_skips_ids_missing_from_main_data(pg_cursor, tmp_path):
+    copy_rows(pg_cursor, 'main_data', ['ensembl_id'], [['g1'], ['g2'], ['g4']])
+    path = write_strain_csv(tmp_path / 'strain.csv', ['g1', 'g2', 'g3', 'g4', 'g5'])
+
+    result = load_strain_csv(pg_cursor, path, CONFIG, chunk_size=2)
+    assert result['rows_read'] == 5
+    assert result['inserted'] == 3
+    assert result['skipped_ids'] == ['g3', 'g5']
+    pg_cursor.execute(f"SELECT ensembl_id, viv_75days_avg FROM {CONFIG['table']} ORDER BY ensembl_id")
+    assert pg_cursor.fetchall() == [('g1', None), ('g2', None), ('g4', None)]
+
+    # A second load of the same file adds nothing and reports the same skipped ids
+    again = load_strain_csv(pg_cursor, path, CONFIG)
+    assert again['inserted'] == 0
+    assert again['skipped_ids'] == ['g3', 'g5']
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import cli
+import models.predictor
+
+
+class FakePredictor:
+    def predict(self, bsl_values):
+        return np.outer(bsl_values, np.arange(6, dtype=np.float64))
+
+
+def test_predict_writes_one_csv_row_per_value(monkeypatch, capsys):
+    monkeypatch.setattr(models.predictor, 'get_predictor', lambda strain, backend: FakePredictor())
+    assert cli.main(['predict', 'c57_6j', '1.0', '2.0']) is None
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith('bsl_0days_avg,')
+    assert lines[2] == '2.0,0.0,2.0,4.0,6.0,8.0,10.0'
+
+
+def test_predict_without_a_model_fails_with_a_hint(monkeypatch, capsys):
+    def get_predictor(strain, backend):
+        raise FileNotFoundError("No trained model for c57_6j_data; run `python cli.py train` first")
+
+    monkeypatch.setattr(models.predictor, 'get_predictor', get_predictor)
+    assert cli.main(['predict', 'c57_6j', '1.0']) == 1
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'No trained model for c57_6j_data' in captured.err and 'train' in captured.err
+
+
+@pytest.mark.parametrize('flag', ['--delete-missing', '--force'])
+def test_sync_options_need_sync(flag, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['load', flag])
+    assert exit_info.value.code == 2
+    assert '--sync' in capsys.readouterr().err
+
+
+def test_sync_options_are_accepted_with_sync():
+    args = cli.build_parser().parse_args(['load', 'c57_6j', '--sync', '--delete-missing', '--force'])
+    assert args.sync and args.delete_missing and args.force and args.strains == ['c57_6j']
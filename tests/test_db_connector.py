@@ -0,0 +1,157 @@
+import psycopg2.extensions
+import pytest
+from psycopg2.pool import PoolError
+
+from database import db_connector
+from database.db_connector import ConnectionPool, connection_settings
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.pings = 0
+        self.broken = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        self.pings += 1
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(db_connector, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+
+    def connect(**kwargs):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(db_connector.psycopg2, 'connect', connect)
+    return connections
+
+
+def test_connections_are_reused(clock, opened):
+    pool = ConnectionPool(minconn=1, maxconn=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(opened) == 1
+
+
+def test_idle_connection_is_pinged_and_replaced_when_broken(clock, opened):
+    pool = ConnectionPool(minconn=1, maxconn=2, health_check_after=30)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    clock.now += 10
+    assert pool.getconn() is conn and conn.pings == 0
+    pool.putconn(conn)
+
+    clock.now += 60
+    conn.broken = True
+    replacement = pool.getconn()
+    assert conn.pings == 1 and conn.closed
+    assert replacement is opened[1]
+
+
+def test_expired_connections_are_closed_on_return(clock, opened):
+    pool = ConnectionPool(minconn=0, maxconn=2, max_lifetime=100)
+    conn = pool.getconn()
+    clock.now += 101
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.getconn() is not conn
+
+
+def test_idle_connections_above_minconn_are_reaped(clock, opened):
+    pool = ConnectionPool(minconn=1, maxconn=3, idle_timeout=300)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    clock.now += 301
+    pool.putconn(pool.getconn())
+    assert sum(1 for conn in opened if not conn.closed) == 1
+
+
+def test_open_transactions_are_rolled_back_on_return(clock, opened):
+    pool = ConnectionPool(minconn=0, maxconn=1)
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1 and not conn.closed
+
+
+def test_exhausted_pool_times_out(opened):
+    pool = ConnectionPool(minconn=0, maxconn=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolError, match='no free connection'):
+        pool.getconn()
+
+
+def test_connection_block_rolls_back_on_error(clock, opened):
+    pool = ConnectionPool(minconn=0, maxconn=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            raise RuntimeError("boom")
+    assert opened[0].rollbacks == 1
+    assert pool.getconn() is opened[0]
+
+
+def test_closed_pool_refuses_checkouts(clock, opened):
+    pool = ConnectionPool(minconn=1, maxconn=1)
+    pool.closeall()
+    assert opened[0].closed
+    with pytest.raises(PoolError, match='closed'):
+        pool.getconn()
+
+
+def test_invalid_sizes_are_rejected():
+    with pytest.raises(ValueError):
+        ConnectionPool(minconn=2, maxconn=1)
+
+
+def test_db_host_is_required(monkeypatch):
+    monkeypatch.delenv('DB_HOST', raising=False)
+    with pytest.raises(RuntimeError, match='DB_HOST'):
+        connection_settings()
+    monkeypatch.setenv('DB_HOST', 'db.example.org')
+    assert connection_settings()['host'] == 'db.example.org'
@@ -0,0 +1,89 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from analysis import differential
+from analysis.differential import (CONTRASTS, PSEUDOCOUNT, DifferentialResults, compute_results, get_results,
+                                   rank_order)
+from database.strains import VALUE_COLUMNS
+
+
+def snapshot(ids, values):
+    return SimpleNamespace(ids=np.array(ids), values=np.array(values, dtype=np.float64), columns=VALUE_COLUMNS)
+
+
+def profile(flt_25, gc_25):
+    """A profile whose only flt_vs_gc_25days change comes from these two values."""
+    values = dict.fromkeys(VALUE_COLUMNS, 3.0)
+    values.update(flt_25days_avg=flt_25, gc_25days_avg=gc_25)
+    return [values[column] for column in VALUE_COLUMNS]
+
+
+@pytest.fixture
+def results():
+    snapshots = {
+        'c3h_hej': snapshot(['g1', 'g2', 'g3'], [profile(7.0, 1.0), profile(1.0, 7.0), profile(3.0, 3.0)]),
+        'c57_6j': snapshot(['g2', 'g3', 'g4'], [profile(3.0, 3.0), profile(15.0, 1.0), profile(np.nan, 3.0)]),
+    }
+    return DifferentialResults(compute_results(snapshots), {'c3h_hej': 1, 'c57_6j': 1})
+
+
+def test_rank_order_sorts_descending_with_nan_last():
+    scores = np.array([[1.0, -2.0], [np.nan, 5.0], [3.0, np.nan], [3.0, 0.0]])
+    order, valid = rank_order(scores)
+    assert order.dtype == np.int32
+    assert order.tolist() == [[2, 3, 0, 1], [1, 3, 0, 2]]
+    assert valid.tolist() == [3, 3]
+
+
+def test_top_genes_of_a_strain(results):
+    up = results.top('c3h_hej', 'flt_vs_gc_25days', 2, 'up')
+    assert [gene['ensembl_id'] for gene in up] == ['g1', 'g3']
+    assert up[0]['log2_fold_change'] == pytest.approx(np.log2(7.0 + PSEUDOCOUNT) - np.log2(1.0 + PSEUDOCOUNT))
+    assert up[0]['rank'] == 1
+    down = results.top('c3h_hej', 'flt_vs_gc_25days', 1, 'down')
+    assert down[0]['ensembl_id'] == 'g2' and down[0]['rank'] == 3
+
+
+def test_missing_values_are_left_out_of_the_ranking(results):
+    genes = results.top('c57_6j', 'flt_vs_gc_25days', 10, 'up')
+    assert [gene['ensembl_id'] for gene in genes] == ['g3', 'g2']
+
+
+def test_cross_strain_group_holds_shared_genes(results):
+    genes = results.top('c3h_hej_vs_c57_6j', 'flt_vs_gc_25days', 10, 'up')
+    # First strain minus second: g2 is -2 in c3h and flat in c57, g3 flat in c3h and +3 in c57
+    assert [(gene['ensembl_id'], gene['log2_fold_change']) for gene in genes] == [('g2', -2.0), ('g3', -3.0)]
+    assert len(results.contrasts) == len(CONTRASTS)
+
+
+def test_results_survive_a_save_and_load(results, tmp_path):
+    path = str(tmp_path / 'differential.npz')
+    results.save(path)
+    loaded = DifferentialResults.load(path)
+    assert loaded.source == results.source
+    assert loaded.top('c3h_hej', 'flt_vs_viv_75days', 3) == results.top('c3h_hej', 'flt_vs_viv_75days', 3)
+
+
+def test_stale_results_are_served_while_refreshing_in_the_background(results, monkeypatch):
+    release = threading.Event()
+    refreshed = threading.Event()
+
+    def slow_ensure_results():
+        release.wait(5)
+        refreshed.set()
+        return 'new results'
+
+    monkeypatch.setattr(differential, '_results', results)
+    monkeypatch.setattr(differential, '_checked_at', 0.0)
+    monkeypatch.setattr(differential, 'ensure_results', slow_ensure_results)
+    assert get_results(max_age=0) is results  # answered without waiting for the refresh
+    release.set()
+    assert refreshed.wait(5)
+    for _ in range(100):
+        if differential._results == 'new results':
+            break
+        threading.Event().wait(0.01)
+    assert differential._results == 'new results'
@@ -0,0 +1,75 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+import torch.nn as nn  # noqa: E402
+
+from training.engine import fit  # noqa: E402
+
+
+@pytest.fixture
+def data():
+    generator = torch.Generator().manual_seed(0)
+    X = torch.randn(256, 1, generator=generator)
+    y = 3 * X + 1 + 0.01 * torch.randn(256, 1, generator=generator)
+    return X[:192], y[:192], X[192:], y[192:]
+
+
+def linear_model():
+    torch.manual_seed(0)
+    return nn.Sequential(nn.Linear(1, 1))
+
+
+def val_loss(model, X_val, y_val):
+    with torch.no_grad():
+        return nn.MSELoss()(model(X_val), y_val).item()
+
+
+@pytest.mark.parametrize('batch_size', [None, 32])
+def test_fit_learns(data, batch_size):
+    model = linear_model()
+    history = fit(model, *data, epochs=60, lr=0.05, batch_size=batch_size, verbose=False)
+    assert len(history['train_losses']) == len(history['val_losses']) == 60
+    assert history['val_losses'][-1] < history['val_losses'][0] / 10
+    assert not history['stopped_early'] and not history['stopped_by_callback']
+
+
+def test_fit_stops_after_patience_epochs_without_improvement(data):
+    history = fit(linear_model(), *data, epochs=50, lr=0.0, patience=3, verbose=False)
+    assert history['stopped_early']
+    assert history['best_epoch'] == 0
+    assert len(history['val_losses']) == 4
+
+
+def test_fit_restores_and_checkpoints_the_best_weights(data, tmp_path):
+    model = linear_model()
+    checkpoint = tmp_path / 'best.pt'
+    # A learning rate this large makes the validation loss diverge after a few epochs
+    history = fit(model, *data, epochs=30, lr=5.0, batch_size=None, checkpoint_path=str(checkpoint), verbose=False)
+    assert history['best_epoch'] < len(history['val_losses']) - 1
+    assert val_loss(model, *data[2:]) == pytest.approx(history['best_val_loss'])
+
+    saved = torch.load(str(checkpoint))
+    assert saved['epoch'] == history['best_epoch']
+    assert saved['val_loss'] == history['best_val_loss']
+    for name, value in model.state_dict().items():
+        assert torch.equal(saved['state_dict'][name], value)
+
+
+def test_on_epoch_callback_can_stop_training(data):
+    seen = []
+
+    def on_epoch(epoch, train_loss, val_loss):
+        seen.append(epoch)
+        return epoch == 2
+
+    history = fit(linear_model(), *data, epochs=10, lr=0.01, verbose=False, on_epoch=on_epoch)
+    assert seen == [0, 1, 2]
+    assert history['stopped_by_callback'] and len(history['train_losses']) == 3
+
+
+def test_mini_batches_are_reproducible(data):
+    first, second = linear_model(), linear_model()
+    fit(first, *data, epochs=5, lr=0.05, batch_size=16, seed=7, verbose=False)
+    fit(second, *data, epochs=5, lr=0.05, batch_size=16, seed=7, verbose=False)
+    for name, value in first.state_dict().items():
+        assert torch.equal(second.state_dict()[name], value)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+from sklearn.preprocessing import StandardScaler  # noqa: E402
+
+from models.inference import NumpyEngine, export_model, fold_scalers  # noqa: E402
+from models.transfer_model import TransferModel  # noqa: E402
+
+
+@pytest.fixture
+def fitted():
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    model = TransferModel((8, 16)).eval()
+    input_scaler = StandardScaler().fit(rng.lognormal(2, 1, (200, 1)))
+    output_scaler = StandardScaler().fit(rng.lognormal(2, 1, (200, 6)))
+    return model, input_scaler, output_scaler
+
+
+def reference(model, input_scaler, output_scaler, bsl_values):
+    scaled = input_scaler.transform(bsl_values.reshape(-1, 1))
+    with torch.no_grad():
+        outputs = model(torch.tensor(scaled, dtype=torch.float32)).double().numpy()
+    return output_scaler.inverse_transform(outputs)
+
+
+def folded_forward(layers, bsl_values):
+    x = bsl_values.reshape(-1, 1)
+    for i, (weight, bias) in enumerate(layers):
+        x = x @ weight.T + bias
+        if i < len(layers) - 1:
+            x = np.maximum(x, 0)
+    return x
+
+
+def test_fold_scalers_matches_scaled_model(fitted):
+    bsl_values = np.array([0.0, 1.5, 9.35, 120.0])
+    expected = reference(*fitted, bsl_values)
+    np.testing.assert_allclose(folded_forward(fold_scalers(*fitted), bsl_values), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_numpy_export_matches_scaled_model(fitted, tmp_path):
+    paths = export_model(*fitted, str(tmp_path), backends=('numpy',))
+    bsl_values = np.array([0.0, 1.5, 9.35, 120.0])
+    predictions = NumpyEngine(paths['numpy']).predict(bsl_values)
+    assert predictions.shape == (4, 6)
+    np.testing.assert_allclose(predictions, reference(*fitted, bsl_values), rtol=1e-4, atol=1e-4)
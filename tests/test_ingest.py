@@ -0,0 +1,89 @@
+import io
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+
+import webapp.app as webapp_app  # noqa: E402
+import webapp.ingest as ingest  # noqa: E402
+from webapp.app import app  # noqa: E402
+
+CSV = b"Gene,Sample1\nENSMUSG00000000001,1.0\n"
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'UPLOAD_DIR', str(tmp_path))
+    submitted = []
+
+    def submit(file_storage, kind='raw', strain=None):
+        submitted.append(ingest.keep_upload(file_storage, str(tmp_path / 'job')))
+        return 'job'
+
+    monkeypatch.setattr(webapp_app.jobs, 'submit', submit)
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024 ** 2)
+    monkeypatch.setitem(app.config, 'TESTING', True)
+    return tmp_path, submitted
+
+
+def post(client, data, **form):
+    return client.post('/upload', data={'file': (io.BytesIO(data), 'data.csv'), **form},
+                       content_type='multipart/form-data')
+
+
+def test_upload_is_spooled_and_moved_into_the_job(uploads):
+    tmp_path, submitted = uploads
+    response = post(app.test_client(), CSV)
+    assert response.status_code == 202
+    assert response.get_json()['job_id'] == 'job'
+    with open(submitted[0], 'rb') as f:
+        assert f.read() == CSV
+    assert os.listdir(tmp_path) == ['job']
+
+
+def test_upload_over_the_limit_is_a_json_413(uploads):
+    tmp_path, submitted = uploads
+    response = post(app.test_client(), CSV + b"ENSMUSG00000000002,2.0\n" * 50000)
+    assert response.status_code == 413
+    assert response.get_json() == {'error': "The file is larger than the upload limit of 1.0 MB"}
+    assert submitted == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_limit_is_shown_in_megabytes_and_gigabytes(monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 5 * 1024 ** 2)
+    with app.test_request_context():
+        assert webapp_app.upload_limit() == '5.0 MB'
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 2 * 1024 ** 3)
+    with app.test_request_context():
+        assert webapp_app.upload_limit() == '2.0 GB'
+
+
+def test_upload_form_shows_the_limit(uploads):
+    assert b'up to 1.0 MB' in app.test_client().get('/upload').data
+
+
+def test_rejected_upload_leaves_no_spooled_file(uploads):
+    tmp_path, submitted = uploads
+    response = post(app.test_client(), CSV, kind='processed')
+    assert response.status_code == 400
+    assert 'strain' in response.get_json()['error']
+    assert submitted == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_only_spool_endpoints_write_to_upload_dir(uploads, monkeypatch):
+    tmp_path, submitted = uploads
+    monkeypatch.setattr(ingest.UploadRequest, 'SPOOL_ENDPOINTS', ())
+    response = post(app.test_client(), CSV)
+    assert response.status_code == 202
+    assert os.listdir(tmp_path) == ['job']
+
+
+def test_upload_without_file_is_rejected(uploads):
+    tmp_path, submitted = uploads
+    response = app.test_client().post('/upload', data={'kind': 'raw'}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "Choose a CSV file to upload"}
+    assert submitted == []
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from preprocessing import merge
+from preprocessing.merge import MergedDataset, merge_files, normalize_ids
+
+
+@pytest.fixture(autouse=True)
+def merged_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(merge, 'MERGED_DIR', str(tmp_path / 'merged'))
+
+
+def write_csv(path, header, rows):
+    path.write_text('\n'.join([','.join(header)] + [','.join(map(str, row)) for row in rows]) + '\n')
+    return str(path)
+
+
+def test_normalize_ids_strips_whitespace_and_version():
+    assert normalize_ids([' ENSMUSG00000000001.4', 'ENSMUSG00000000002']).tolist() == \
+        ['ENSMUSG00000000001', 'ENSMUSG00000000002']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 100])
+def test_merge_files_outer_joins_in_id_order(tmp_path, chunk_size):
+    left = write_csv(tmp_path / 'left.csv', ['ensmbl_id', 'a'], [['g1', 1.0], ['g3.2', 3.0], ['g4', 4.0]])
+    right = write_csv(tmp_path / 'right.csv', ['ensembl_id', 'b', 'c'],
+                      [['g2', 20.0, 200.0], ['g3', 30.0, 300.0], ['g5', 50.0, 500.0]])
+    dataset = merge_files([left, right], 'test', chunk_size=chunk_size)
+
+    assert dataset.columns == ['a', 'b', 'c']
+    assert np.asarray(dataset.ids).tolist() == ['g1', 'g2', 'g3', 'g4', 'g5']
+    rows = np.vstack([values for _, values in dataset.iter_chunks()])
+    expected = np.array([[1.0, np.nan, np.nan], [np.nan, 20.0, 200.0], [3.0, 30.0, 300.0],
+                         [4.0, np.nan, np.nan], [np.nan, 50.0, 500.0]])
+    np.testing.assert_array_equal(rows, expected)
+    assert len(MergedDataset(dataset.path)) == 5
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 100])
+def test_merge_files_sorts_unsorted_files(tmp_path, chunk_size):
+    # pipeline.py writes the genes in the order of the raw matrix
+    left = write_csv(tmp_path / 'left.csv', ['ensmbl_id', 'a'],
+                     [['g5', 5.0], ['g1', 1.0], ['g4.1', 4.0], ['g2', 2.0], ['g3', 3.0]])
+    right = write_csv(tmp_path / 'right.csv', ['ensmbl_id', 'b'], [['g4', 40.0], ['g0', 0.0], ['g2', 20.0]])
+    dataset = merge_files([left, right], 'test', chunk_size=chunk_size)
+
+    assert np.asarray(dataset.ids).tolist() == ['g0', 'g1', 'g2', 'g3', 'g4', 'g5']
+    np.testing.assert_array_equal(dataset.rows(['g0', 'g2', 'g4', 'g5']),
+                                  [[np.nan, 0.0], [2.0, 20.0], [4.0, 40.0], [5.0, np.nan]])
+    assert sorted(os.listdir(dataset.path)) == sorted(['ids.npy', 'meta.json'] + [
+        merge.chunk_filename(i) for i in range(dataset.meta['chunks'])])
+
+
+def test_merge_files_sorts_many_runs_of_generated_ids(tmp_path):
+    rng = np.random.default_rng(0)
+    numbers = rng.permutation(500)
+    path = write_csv(tmp_path / 'shuffled.csv', ['ensmbl_id', 'a'],
+                     [[f"ENSMUSG{n:011d}", float(n)] for n in numbers])
+    dataset = merge_files([path], 'test', chunk_size=37)
+    assert np.asarray(dataset.ids).tolist() == [f"ENSMUSG{n:011d}" for n in range(500)]
+    np.testing.assert_array_equal(dataset.column('a'), np.arange(500.0))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 100])
+def test_merge_files_rejects_repeated_ids(tmp_path, chunk_size):
+    path = write_csv(tmp_path / 'repeated.csv', ['ensmbl_id', 'a'], [['g2', 2.0], ['g1', 1.0], ['g2.2', 3.0]])
+    with pytest.raises(ValueError, match='repeats ensembl_id g2'):
+        merge_files([path], 'test', chunk_size=chunk_size)
+    assert not (tmp_path / 'merged' / 'test').exists()
+    assert not os.listdir(tmp_path / 'merged')
+
+
+def test_merge_files_rejects_repeated_columns(tmp_path):
+    left = write_csv(tmp_path / 'left.csv', ['ensmbl_id', 'a'], [['g1', 1.0]])
+    right = write_csv(tmp_path / 'right.csv', ['ensmbl_id', 'a'], [['g2', 2.0]])
+    with pytest.raises(ValueError, match='more than one file'):
+        merge_files([left, right], 'test')
+
+
+def test_merge_files_rejects_missing_id_column(tmp_path):
+    path = write_csv(tmp_path / 'noid.csv', ['gene', 'a'], [['g1', 1.0]])
+    with pytest.raises(ValueError, match='id column'):
+        merge_files([path], 'test')
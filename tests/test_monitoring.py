@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from instrumentation import metrics  # noqa: E402
+from webapp import monitoring  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    was_enabled = metrics.enabled()
+    metrics.enable()
+    metrics.reset()
+    monkeypatch.setattr('instrumentation.profiling.PROFILE_DIR', str(tmp_path))
+    app = flask.Flask(__name__)
+    app.config['PROFILE_REQUESTS'] = True
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    monitoring.init_app(app)
+
+    @app.route('/ok/<name>')
+    def ok(name):
+        return name
+
+    @app.route('/fail')
+    def fail():
+        raise RuntimeError("boom")
+
+    yield app
+    metrics.reset()
+    if not was_enabled:
+        metrics.disable()
+
+
+def test_requests_are_timed_by_route_and_status(app):
+    client = app.test_client()
+    client.get('/ok/a')
+    client.get('/ok/b')
+    client.get('/missing')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'sbm_http_request_seconds_count{method="GET",route="/ok/<name>",status="200"} 2' in body
+    assert 'sbm_http_request_seconds_count{method="GET",route="unmatched",status="404"} 1' in body
+    assert body.startswith('# TYPE sbm_http_request_seconds histogram')
+
+
+def test_failed_requests_are_timed(app):
+    with pytest.raises(RuntimeError):
+        app.test_client().get('/fail')
+    body = app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'sbm_http_request_seconds_count{method="GET",route="/fail",status="500"} 1' in body
+
+
+def test_profiled_request_reports_its_profile(app, tmp_path):
+    response = app.test_client().get('/ok/a?profile=1')
+    path = response.headers['X-Profile-Path']
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.basename(path).startswith('ok-') and path.endswith('.prof')
+    assert sys.getprofile() is None
+
+
+def test_profiler_is_released_when_the_view_raises(app, tmp_path):
+    with pytest.raises(RuntimeError):
+        app.test_client().get('/fail?profile=1')
+    assert sys.getprofile() is None
+    assert [name.split('-')[0] for name in os.listdir(tmp_path)] == ['fail']
+
+
+def test_nothing_is_recorded_when_metrics_are_disabled(app):
+    metrics.disable()
+    app.test_client().get('/ok/a')
+    assert app.test_client().get('/metrics').get_data(as_text=True) == '\n'
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_raw
+from preprocessing.pipeline import average_replicates, build_layout, group_name, preprocess
+
+
+def original_preprocessing(raw_path):
+    """The averaging of the original preprocessing.py, kept here as the reference."""
+    df = pd.read_csv(raw_path)
+    df = df.replace(0, np.nan)
+    df.columns = [df.columns[0]] + [group_name(column) for column in df.columns[1:]]
+    averages = df.iloc[:, 1:].T.groupby(level=0).mean().T
+    final = pd.concat([df.iloc[:, 0], averages], axis=1)
+    final.columns = ['ensmbl_id'] + [column + '_avg' for column in final.columns[1:]]
+    return {
+        'c3h_hej': final.filter(regex='c3h|ensmbl_id', axis=1),
+        'c57_6j': final.filter(regex='c57|ensmbl_id', axis=1),
+    }
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1000])
+def test_pipeline_matches_the_original_preprocessing(tmp_path, chunk_size):
+    raw_path = write_raw(str(tmp_path / 'Mouse_data.csv'), 50, seed=3)
+    paths = preprocess(raw_path, str(tmp_path / 'out'), chunk_size=chunk_size)
+    expected = original_preprocessing(raw_path)
+
+    assert set(paths) == set(expected)
+    for strain, path in paths.items():
+        output = pd.read_csv(path)
+        assert list(output.columns) == list(expected[strain].columns)
+        assert output['ensmbl_id'].tolist() == expected[strain]['ensmbl_id'].tolist()
+        np.testing.assert_allclose(output.iloc[:, 1:].to_numpy(), expected[strain].iloc[:, 1:].to_numpy(),
+                                   rtol=1e-12, equal_nan=True)
+    assert paths['c3h_hej'].endswith('processed_data_c3h.csv')
+
+
+def test_zeros_and_missing_replicates_are_ignored():
+    columns = ['Mmus_C57-6J_LVR_FLT_25days_Rep1', 'Mmus_C57-6J_LVR_FLT_25days_Rep2',
+               'Mmus_C57-6J_LVR_GC_25days_Rep1']
+    order, starts, groups, strains = build_layout(columns)
+    assert groups == ['c57_6j_flt_25days', 'c57_6j_gc_25days']
+    assert strains == {'c57_6j': [0, 1]}
+    averages = average_replicates(np.array([[2.0, 0.0, np.nan], [2.0, 4.0, 5.0]]), order, starts)
+    np.testing.assert_array_equal(averages, [[2.0, np.nan], [3.0, 5.0]])
+
+
+def test_unexpected_column_names_are_rejected():
+    with pytest.raises(ValueError, match='Unexpected sample column'):
+        group_name('Mmus_C57-6J')
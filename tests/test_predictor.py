@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from models import predictor
+from models.predictor import OUTPUT_COLUMNS, Predictor, get_predictor
+
+
+class DoublingEngine:
+    def __init__(self, key='a'):
+        self.key = key
+
+    def predict(self, bsl_values):
+        return np.outer(bsl_values, np.full(len(OUTPUT_COLUMNS), 2.0))
+
+
+class RowsCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        self.params = params
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """The promoted key of every table, changed by the tests; engines are built without files."""
+    pointer = {'key': 'a'}
+    monkeypatch.setattr(predictor, 'current_key', lambda table: pointer['key'])
+    monkeypatch.setattr(predictor, 'load_engine', lambda key, backend: DoublingEngine(key))
+    monkeypatch.setattr(predictor, 'ARTIFACT_CHECK_INTERVAL', 60.0)
+    predictor.clear_predictors()
+    yield pointer
+    predictor.clear_predictors()
+
+
+def test_predict_is_one_batch():
+    predictions = Predictor(DoublingEngine()).predict([1.0, 2.5])
+    assert predictions.shape == (2, len(OUTPUT_COLUMNS))
+    assert predictions[1].tolist() == [5.0] * len(OUTPUT_COLUMNS)
+    assert Predictor(DoublingEngine()).predict([]).shape == (0, len(OUTPUT_COLUMNS))
+
+
+def test_predict_ids_reports_missing_genes():
+    cursor = RowsCursor([('g1', 1.0), ('g3', 3.0)])
+    ids, predictions, missing = Predictor(DoublingEngine()).predict_ids(cursor, 'c57_6j_data', ['g1', 'g2', 'g3'])
+    assert ids == ['g1', 'g3']
+    assert predictions[:, 0].tolist() == [2.0, 6.0]
+    assert missing == ['g2']
+    assert cursor.params == (['g1', 'g2', 'g3'],)
+
+
+def test_predictor_is_loaded_once(served):
+    assert get_predictor('c57_6j', 'numpy') is get_predictor('c57_6j', 'numpy')
+
+
+def test_promoted_model_replaces_the_cached_one(served, monkeypatch):
+    first = get_predictor('c57_6j', 'numpy')
+    served['key'] = 'b'
+    assert get_predictor('c57_6j', 'numpy') is first  # not checked again yet
+
+    monkeypatch.setattr(predictor, 'ARTIFACT_CHECK_INTERVAL', 0.0)
+    second = get_predictor('c57_6j', 'numpy')
+    assert second is not first and second.engine.key == 'b'
+    assert get_predictor('c57_6j', 'numpy') is second
+
+
+def test_missing_model_tells_to_train(served):
+    served['key'] = None
+    with pytest.raises(FileNotFoundError, match='c57_6j_data; run `python cli.py train` first'):
+        get_predictor('c57_6j', 'numpy')
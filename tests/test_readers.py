@@ -0,0 +1,96 @@
+import pytest
+
+from database.readers import fetch_page, iter_batches, iter_pages, iter_rows
+from database.strains import STRAINS, VALUE_COLUMNS
+from preprocessing.bulk_loader import copy_rows
+
+IDS = ['ENSMUSG03', 'ENSMUSG01', 'ENSMUSG_X', 'ENSMUSG02', 'ensmusg04', 'ENSMUSG05']
+
+
+class KeysetCursor:
+    """Answers fetch_page() queries from IDS, comparing ids in byte order like COLLATE "C"."""
+
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, query, params):
+        self.queries.append(repr(query))
+        *after, limit = params
+        ids = sorted(i for i in IDS if not after or i > after[0])
+        self.rows = [(i,) for i in ids[:limit]]
+
+    def fetchall(self):
+        return self.rows
+
+
+class NamedCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.closed = False
+
+    def execute(self, query):
+        self.query = repr(query)
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        self.closed = True
+
+
+class StreamingConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.cursors = []
+
+    def cursor(self, name=None):
+        assert name, "iter_batches must use a server-side (named) cursor"
+        self.cursors.append(NamedCursor(self.rows))
+        return self.cursors[-1]
+
+
+def test_fetch_page_follows_the_keyset():
+    cursor = KeysetCursor()
+    rows, after = fetch_page(cursor, 'c57_6j_data', limit=4, columns=['ensembl_id'])
+    assert [row[0] for row in rows] == sorted(IDS)[:4] and after == sorted(IDS)[3]
+    rows, after = fetch_page(cursor, 'c57_6j_data', after=after, limit=4, columns=['ensembl_id'])
+    assert [row[0] for row in rows] == sorted(IDS)[4:] and after is None
+
+
+def test_iter_pages_reads_every_row_once():
+    pages = list(iter_pages(KeysetCursor(), 'c57_6j_data', page_size=2, columns=['ensembl_id']))
+    assert [len(page) for page in pages] == [2, 2, 2]
+    assert [row[0] for page in pages for row in page] == sorted(IDS)
+
+
+def test_paging_and_streaming_use_the_same_order():
+    cursor = KeysetCursor()
+    fetch_page(cursor, 'c57_6j_data', after='ENSMUSG01', limit=2)
+    connection = StreamingConnection([])
+    list(iter_batches(connection, 'c57_6j_data'))
+    assert 'COLLATE "C"' in connection.cursors[0].query
+    assert cursor.queries[0].count('COLLATE "C"') == 2
+
+
+def test_iter_batches_streams_in_batches_and_closes_the_cursor():
+    connection = StreamingConnection([(i,) for i in range(5)])
+    assert [len(batch) for batch in iter_batches(connection, 'c57_6j_data', itersize=2)] == [2, 2, 1]
+    assert connection.cursors[0].closed
+    assert [row[0] for row in iter_rows(StreamingConnection([(1,), (2,)]), 'c57_6j_data')] == [1, 2]
+
+
+def test_unknown_columns_are_rejected():
+    with pytest.raises(ValueError, match='Unknown columns'):
+        fetch_page(KeysetCursor(), 'c57_6j_data', columns=['password'])
+
+
+def test_pages_match_the_stream_in_postgres(pg_cursor):
+    config = STRAINS['c57_6j']
+    copy_rows(pg_cursor, 'main_data', ['ensembl_id'], [[i] for i in IDS])
+    copy_rows(pg_cursor, 'expression', ['study', 'strain', 'ensembl_id'] + VALUE_COLUMNS[:1],
+              [[config['study'], config['strain'], i, n] for n, i in enumerate(IDS)])
+
+    paged = [row[0] for page in iter_pages(pg_cursor, config['table'], page_size=2) for row in page]
+    streamed = [row[0] for row in iter_rows(pg_cursor.connection, config['table'], itersize=4)]
+    assert paged == streamed == sorted(IDS)
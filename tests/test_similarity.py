@@ -0,0 +1,139 @@
+import threading
+
+import numpy as np
+import pytest
+
+from analysis import similarity
+from analysis.differential import PSEUDOCOUNT
+from analysis.similarity import SimilarityIndex, get_index, invalidate_indexes, normalize_profiles
+
+
+class FakeSnapshot:
+    def __init__(self, ids, values, state=None, table='c57_6j_data'):
+        self.ids = np.array(ids)
+        self.values = np.array(values, dtype=np.float64)
+        self.meta = {'state': state or {'version': 1}}
+        self.table = table
+
+    def __len__(self):
+        return len(self.ids)
+
+
+@pytest.fixture
+def snapshot():
+    return FakeSnapshot(['g1', 'g2', 'g3', 'g4'], [[1.0, 2.0, 4.0], [2.0, 4.0, 8.0], [8.0, 4.0, 1.0],
+                                                   [3.0, 3.0, 3.0]])
+
+
+@pytest.fixture
+def indexes(monkeypatch):
+    """Empty process-wide index cache with ensure_index and load_saved_index stubbed per test."""
+    monkeypatch.setattr(similarity, '_indexes', {})
+    monkeypatch.setattr(similarity, '_build_locks', {})
+    monkeypatch.setattr(similarity, 'load_saved_index', lambda table_name, metric='pearson': None)
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return True
+        threading.Event().wait(0.01)
+    return False
+
+
+def test_normalize_profiles_pearson_dot_is_correlation():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(3, 1, (5, 7))
+    vectors = normalize_profiles(values, 'pearson')
+    assert vectors.dtype == np.float32 and vectors.flags['C_CONTIGUOUS']
+    expected = np.corrcoef(np.log2(values + PSEUDOCOUNT))
+    np.testing.assert_allclose(vectors @ vectors.T, expected, atol=1e-5)
+
+
+def test_normalize_profiles_cosine_rows_have_unit_length():
+    vectors = normalize_profiles(np.array([[1.0, 2.0, 3.0], [4.0, 4.0, 8.0]]), 'cosine')
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-6)
+
+
+def test_normalize_profiles_zeroes_rows_that_cannot_be_compared():
+    values = np.array([[2.0, 2.0, 2.0], [1.0, np.nan, 3.0], [1.0, 2.0, 4.0]])
+    vectors = normalize_profiles(values, 'pearson')
+    assert not vectors[:2].any()
+    assert vectors[2].any()
+
+
+def test_normalize_profiles_rejects_unknown_metric():
+    with pytest.raises(ValueError, match='Unknown metric'):
+        normalize_profiles(np.ones((1, 3)), 'euclidean')
+
+
+def test_similar_ranks_valid_genes_best_first(snapshot):
+    index = SimilarityIndex.build(snapshot)
+    assert 'g4' not in index and 'g5' not in index  # flat profile, absent gene
+    assert [gene['ensembl_id'] for gene in index.similar('g1', k=5)] == ['g2', 'g3']
+    with pytest.raises(KeyError):
+        index.similar('g4')
+
+
+def test_saved_index_is_only_loaded_for_the_same_snapshot_state(snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity, 'snapshot_path', lambda table_name: str(tmp_path))
+    SimilarityIndex.build(snapshot).save(snapshot.table)
+    loaded = SimilarityIndex.load(snapshot)
+    np.testing.assert_array_equal(loaded.vectors, SimilarityIndex.build(snapshot).vectors)
+    snapshot.meta['state'] = {'version': 2}
+    assert SimilarityIndex.load(snapshot) is None
+
+
+def test_first_index_is_built_in_the_background(snapshot, indexes, monkeypatch):
+    release = threading.Event()
+    built = SimilarityIndex.build(snapshot)
+
+    def slow_ensure_index(table_name, metric='pearson'):
+        release.wait(5)
+        return built
+
+    monkeypatch.setattr(similarity, 'ensure_index', slow_ensure_index)
+    assert get_index('c57_6j') is None  # answered without waiting for the build
+    assert get_index('c57_6j') is None
+    release.set()
+    assert wait_for(lambda: get_index('c57_6j') is built)
+
+
+def test_stale_index_is_served_while_refreshing_in_the_background(snapshot, indexes, monkeypatch):
+    old, new = SimilarityIndex.build(snapshot), SimilarityIndex.build(snapshot)
+    release = threading.Event()
+    calls = []
+
+    def slow_ensure_index(table_name, metric='pearson'):
+        calls.append(table_name)
+        release.wait(5)
+        return new
+
+    monkeypatch.setattr(similarity, '_indexes', {('c57_6j', 'pearson'): (old, 0.0)})
+    monkeypatch.setattr(similarity, 'ensure_index', slow_ensure_index)
+    assert get_index('c57_6j') is old
+    assert get_index('c57_6j') is old  # the first call claimed the refresh
+    release.set()
+    assert wait_for(lambda: get_index('c57_6j') is new)
+    assert calls == ['c57_6j_data']
+
+    invalidate_indexes(['c57_6j_data'])
+    assert get_index('c57_6j') is new
+    assert wait_for(lambda: len(calls) == 2)
+
+
+def test_a_slow_build_does_not_block_other_indexes(snapshot, indexes, monkeypatch):
+    release = threading.Event()
+    ready = SimilarityIndex.build(snapshot)
+
+    def ensure_index(table_name, metric='pearson'):
+        if metric == 'pearson':
+            release.wait(5)
+        return ready
+
+    monkeypatch.setattr(similarity, 'ensure_index', ensure_index)
+    assert get_index('c57_6j', 'pearson') is None
+    assert wait_for(lambda: get_index('c57_6j', 'cosine') is ready)
+    assert get_index('c57_6j', 'pearson') is None
+    release.set()
+    assert wait_for(lambda: get_index('c57_6j', 'pearson') is ready)
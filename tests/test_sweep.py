@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from training.sweep import grid_configs, random_configs, run_sweep
+
+torch = pytest.importorskip('torch')
+
+from models import artifacts, transfer_model  # noqa: E402
+from models.artifacts import artifact_key  # noqa: E402
+from models.transfer_model import prepare_data, split_data  # noqa: E402
+
+
+def test_grid_configs_covers_every_combination():
+    configs = grid_configs({'lr': [0.1, 0.01], 'batch_size': [32, 64, 128]})
+    assert len(configs) == 6
+    assert configs[0] == {'lr': 0.1, 'batch_size': 32}
+    assert {(c['lr'], c['batch_size']) for c in configs} == {(lr, b) for lr in (0.1, 0.01) for b in (32, 64, 128)}
+
+
+def test_grid_configs_needs_lists():
+    with pytest.raises(ValueError, match='lr'):
+        grid_configs({'lr': {'log_uniform': [0.0001, 0.01]}})
+
+
+def test_random_configs_are_seeded_and_in_range():
+    space = {'lr': {'log_uniform': [0.0001, 0.01]}, 'batch_size': [128, 256]}
+    configs = random_configs(space, 20, seed=3)
+    assert configs == random_configs(space, 20, seed=3)
+    assert configs != random_configs(space, 20, seed=4)
+    assert len(configs) == 20
+    assert all(0.0001 <= c['lr'] <= 0.01 and c['batch_size'] in (128, 256) for c in configs)
+
+
+@pytest.fixture
+def rows():
+    rng = np.random.default_rng(0)
+    bsl = rng.lognormal(3, 1, 60)
+    return [(f"g{i}", value, *(value * (1 + 0.1 * k) for k in range(6))) for i, value in enumerate(bsl)]
+
+
+@pytest.fixture
+def artifact_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, 'ARTIFACT_DIR', str(tmp_path / 'artifacts'))
+
+
+def sweep(rows, configs, tmp_path, **kwargs):
+    return run_sweep(rows, configs, processes=1, results_path=str(tmp_path / 'results.csv'), verbose=False,
+                     **kwargs)
+
+
+def test_random_state_cannot_be_swept(rows, tmp_path):
+    with pytest.raises(ValueError, match='random_state'):
+        sweep(rows, [{'random_state': 1}], tmp_path)
+
+
+def test_best_trial_is_keyed_with_the_split_it_was_trained_on(rows, tmp_path, artifact_dir, monkeypatch):
+    split_states = []
+
+    def recording_split_data(values, random_state=42):
+        split_states.append(random_state)
+        return split_data(values, random_state)
+
+    monkeypatch.setattr(transfer_model, 'split_data', recording_split_data)
+    results, metadata = sweep(rows, [{'epochs': 2, 'hidden_sizes': [4]}], tmp_path, random_state=7)
+    assert split_states == [7]
+    assert results[0]['hyperparams']['random_state'] == 7
+    ids, values = prepare_data(rows)
+    assert metadata['key'] == artifact_key(ids, values, results[0]['hyperparams'])
+
+
+def test_only_trials_stopped_before_their_last_epoch_are_pruned(rows, tmp_path, artifact_dir):
+    # With prune_ratio 0 every trial is worse than the best, so only the last-epoch rule keeps it
+    configs = [{'epochs': 1, 'hidden_sizes': [4]}, {'epochs': 3, 'hidden_sizes': [4]}]
+    results, metadata = sweep(rows, configs, tmp_path, prune_ratio=0.0, warmup=0)
+    assert [(result['status'], result['epochs_run']) for result in results] == [('complete', 1), ('pruned', 1)]
+    assert metadata['hyperparams']['epochs'] == 1
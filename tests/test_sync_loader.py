@@ -0,0 +1,78 @@
+import csv
+
+import numpy as np
+import pytest
+
+from database.strains import STRAINS, VALUE_COLUMNS
+from preprocessing import sync_loader
+from preprocessing.sync_loader import already_synced, diff_arrays, read_strain_arrays
+
+CONFIG = STRAINS['c57_6j']
+
+
+def write_strain_csv(path, rows):
+    header = [CONFIG['csv_id_column']] + [CONFIG['csv_prefix'] + column for column in VALUE_COLUMNS]
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def values(*first):
+    return [[value] + [1.0] * (len(VALUE_COLUMNS) - 1) for value in first]
+
+
+def test_diff_arrays_finds_new_changed_and_deleted_rows():
+    old_ids = np.array(['a', 'b', 'c'])
+    new_ids = np.array(['b', 'c', 'd'])
+    changed, deleted = diff_arrays(old_ids, np.array(values(1.0, 2.0, 3.0)), new_ids, np.array(values(2.0, 4.0, 5.0)))
+    assert changed.tolist() == [1, 2]
+    assert deleted.tolist() == ['a']
+
+
+def test_diff_arrays_treats_nan_as_equal():
+    ids = np.array(['a', 'b'])
+    old = np.array(values(np.nan, 2.0))
+    changed, deleted = diff_arrays(ids, old, ids, old.copy())
+    assert changed.tolist() == []
+    assert deleted.tolist() == []
+
+
+def test_diff_arrays_without_old_rows_sends_everything():
+    changed, deleted = diff_arrays(np.array([], dtype=str), np.empty((0, len(VALUE_COLUMNS))),
+                                   np.array(['a', 'b']), np.array(values(1.0, 2.0)))
+    assert changed.tolist() == [0, 1]
+    assert len(deleted) == 0
+
+
+def test_read_strain_arrays_sorts_and_keeps_last_repeat(tmp_path):
+    rows = [['c'] + values(3.0)[0], ['a', ''] + values(1.0)[0][1:], ['c'] + values(9.0)[0], ['b'] + values(2.0)[0]]
+    path = write_strain_csv(tmp_path / 'strain.csv', rows)
+    ids, array = read_strain_arrays(path, CONFIG, chunk_size=2)
+    assert ids.tolist() == ['a', 'b', 'c']
+    assert np.isnan(array[0, 0])
+    assert array[1:, 0].tolist() == [2.0, 9.0]
+    assert array.shape == (3, len(VALUE_COLUMNS))
+
+
+def test_read_strain_arrays_rejects_missing_columns(tmp_path):
+    path = tmp_path / 'strain.csv'
+    path.write_text('ensmbl_id,other\na,1\n')
+    with pytest.raises(ValueError, match='missing columns'):
+        read_strain_arrays(str(path), CONFIG)
+
+
+@pytest.mark.parametrize('last, delete_missing, version, expected', [
+    ({'file_digest': 'x', 'delete_missing': False, 'table_version': 3}, False, 3, True),
+    ({'file_digest': 'y', 'delete_missing': False, 'table_version': 3}, False, 3, False),
+    ({'file_digest': 'x', 'delete_missing': False, 'table_version': 3}, True, 3, False),
+    ({'file_digest': 'x', 'delete_missing': True, 'table_version': 3}, False, 3, True),
+    ({'file_digest': 'x', 'delete_missing': False, 'table_version': 3}, False, 4, False),
+    ({'file_digest': 'x', 'delete_missing': False, 'table_version': None}, False, None, False),
+    (None, False, 3, False),
+])
+def test_already_synced(monkeypatch, last, delete_missing, version, expected):
+    monkeypatch.setattr(sync_loader, 'last_load', lambda cursor, table: last)
+    monkeypatch.setattr(sync_loader, 'table_version', lambda cursor, table: version)
+    assert already_synced(None, CONFIG['table'], 'x', delete_missing) is expected
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import (REPLICATES, gene_ids, processed_arrays, raw_columns, write_processed,
+                                  write_raw)
+from database.strains import STRAINS, VALUE_COLUMNS
+
+
+def test_gene_ids_are_sorted_and_contiguous():
+    ids = gene_ids(5, 10)
+    assert ids.tolist() == sorted(ids.tolist())
+    assert ids[0] == 'ENSMUSG00000000005'
+    assert np.array_equal(np.concatenate([gene_ids(0, 5), ids]), gene_ids(0, 10))
+
+
+def test_same_seed_gives_same_data():
+    ids, values = processed_arrays(50, seed=1, chunk_size=20)
+    again_ids, again = processed_arrays(50, seed=1, chunk_size=20)
+    assert np.array_equal(ids, again_ids)
+    for strain in STRAINS:
+        np.testing.assert_array_equal(values[strain], again[strain])
+        assert values[strain].shape == (50, len(VALUE_COLUMNS))
+    assert not np.array_equal(values[next(iter(STRAINS))], processed_arrays(50, seed=2)[1][next(iter(STRAINS))])
+
+
+def test_written_files_have_the_expected_shape(tmp_path):
+    raw = pd.read_csv(write_raw(str(tmp_path / 'Mouse_data.csv'), 30, chunk_size=7))
+    assert list(raw.columns) == ['ENSEMBL'] + raw_columns()
+    assert len(raw) == 30
+    assert len(raw_columns()) == len(STRAINS) * len(VALUE_COLUMNS) * REPLICATES
+
+    _, values = processed_arrays(30, chunk_size=7)
+    for strain, path in write_processed(str(tmp_path), 30, chunk_size=7).items():
+        config = STRAINS[strain]
+        frame = pd.read_csv(path)
+        assert list(frame.columns) == [config['csv_id_column']] + [config['csv_prefix'] + c for c in VALUE_COLUMNS]
+        np.testing.assert_allclose(frame.iloc[:, 1:].to_numpy(), values[strain])
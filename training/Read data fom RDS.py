@@ -1,50 +1,44 @@
+''' This Python program reads the strain tables of the RDS PostgreSQL database.
+Rows are read through the streaming helpers in database/readers.py, so the tables are never
+materialized in memory: only a few rows are displayed per table, and id lists are streamed
+from a server-side cursor.
+ '''
 
-import psycopg2
-
-def connect():
-    # Attempting to establish a connection to the RDS PostgreSQL database
-    try:
-        conn = psycopg2.connect(host="model-zoo-space-apps.cqxs7dfl7szm.us-east-2.rds.amazonaws.com",
-                                port="5432",
-                                database="postgres",
-                                user="postgress_space",
-                                password="SpaceApps2023!")
-        cursor = conn.cursor()
-        print("Connected")
-    except Exception as e:
-        print("Connection failed: {}".format(e))  # Returns failure code
-        return None, None  # If there's a failure, return None values
+import os
+import sys
 
-    return conn, cursor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-def read_data_from_table(cursor, table_name):
-    """Read and display the first 5 columns for a given table."""
+from database.db_connector import connection
+from database.readers import fetch_page, iter_rows
 
-    # Execute the query
-    cursor.execute(f"SELECT * FROM {table_name};")  # Limit to 5 rows for demonstration
+def read_data_from_table(cursor, table_name, limit=5):
+    """Read and display the first `limit` rows for a given table."""
 
-    # Fetch column names (will fetch first 5)
-    colnames = [desc[0] for desc in cursor.description]
+    # Fetch the first page of rows, in ensembl_id order
+    rows, _ = fetch_page(cursor, table_name, limit=limit)
 
-    # Fetch rows
-    rows = cursor.fetchall()
+    # Fetch column names
+    colnames = [desc[0] for desc in cursor.description]
 
-    # Display the data
+    # Display the data, one line per row
     for row in rows:
-        for idx, col_name in enumerate(colnames):
-            print(f"{col_name}: {row[idx]}")
-        print("------")  # Separator for clarity
+        print(", ".join(f"{col_name}: {value}" for col_name, value in zip(colnames, row)))
 
-def fetch_all_ensembl_ids(cursor, table_name):
+def iter_ensembl_ids(conn, table_name):
+    """Stream every ensembl_id value of a specified table from a server-side cursor."""
+    for row in iter_rows(conn, table_name, columns=['ensembl_id']):
+        yield row[0]
+
+def fetch_all_ensembl_ids(conn, table_name):
     """Fetch and return all ensembl_id values from a specified table."""
-    cursor.execute(f"SELECT ensembl_id FROM {table_name};")
-    return [row[0] for row in cursor.fetchall()]
-
-conn, cursor = connect()
-if conn and cursor:
-    print("Data from c3h_hej_data:")
-    read_data_from_table(cursor, 'c3h_hej_data')
-    print("\nData from c57_6j_data:")
-    read_data_from_table(cursor, 'c57_6j_data')
-    cursor.close()
-    conn.close()
\ No newline at end of file
+    return list(iter_ensembl_ids(conn, table_name))
+
+if __name__ == '__main__':
+    with connection() as conn:
+        print("Connected")
+        with conn.cursor() as cursor:
+            print("Data from c3h_hej_data:")
+            read_data_from_table(cursor, 'c3h_hej_data')
+            print("\nData from c57_6j_data:")
+            read_data_from_table(cursor, 'c57_6j_data')
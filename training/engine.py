@@ -0,0 +1,102 @@
+'''
+Training loop shared by every model trained in this repository.
+
+fit() trains a model on tensors that are already scaled and split. It supports:
+- full-batch training (batch_size=None), which is how TransferModel was originally trained
+- DataLoader-based mini-batches of a configurable size, reshuffled every epoch
+- early stopping once the validation loss has not improved for `patience` epochs; the weights of
+  the best epoch are restored before returning
+- checkpointing the best weights to a file whenever the validation loss improves
+- an on_epoch callback that sees every epoch's losses and can stop training, e.g. to prune a
+  hyperparameter sweep trial (training/sweep.py)
+'''
+import copy
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+from instrumentation.metrics import count, timer
+
+
+def fit(model, X_train, y_train, X_val, y_val, epochs=100, lr=0.001, batch_size=None,
+        patience=None, min_delta=0.0, checkpoint_path=None, seed=42, verbose=True, on_epoch=None):
+    """Train model in place and return its loss history.
+
+    on_epoch, if given, is called as on_epoch(epoch, train_loss, val_loss) after every epoch;
+    returning True stops training. Returns a dict with train_losses, val_losses, best_epoch
+    (0-based), best_val_loss, stopped_early and stopped_by_callback.
+    """
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+
+    loader = None
+    if batch_size:
+        generator = torch.Generator().manual_seed(seed)
+        loader = DataLoader(TensorDataset(X_train, y_train), batch_size=batch_size, shuffle=True,
+                            generator=generator)
+
+    train_losses = []
+    val_losses = []
+    best_val_loss = float('inf')
+    best_epoch = -1
+    best_state = None
+    stopped_early = False
+    stopped_by_callback = False
+
+    for epoch in range(epochs):
+        with timer('sbm_stage_seconds', stage='train_epoch'):
+            # Training Phase
+            model.train()
+            if loader is None:
+                optimizer.zero_grad()  # Reset gradients from previous iteration
+                loss = criterion(model(X_train), y_train)
+                loss.backward()  # Backpropagate the loss
+                optimizer.step()  # Update the model weights
+                train_loss = loss.item()
+            else:
+                total = 0.0
+                for X_batch, y_batch in loader:
+                    optimizer.zero_grad()
+                    loss = criterion(model(X_batch), y_batch)
+                    loss.backward()
+                    optimizer.step()
+                    total += loss.item() * len(X_batch)
+                train_loss = total / len(X_train)
+
+            # Validation Phase
+            model.eval()
+            with torch.no_grad():
+                val_loss = criterion(model(X_val), y_val).item()
+        if verbose:
+            print(f"Epoch {epoch+1}/{epochs} - Training Loss: {train_loss} - Validation Loss: {val_loss}")
+        count('sbm_train_epochs_total')
+        train_losses.append(train_loss)
+        val_losses.append(val_loss)
+
+        if val_loss < best_val_loss - min_delta:
+            best_val_loss = val_loss
+            best_epoch = epoch
+            best_state = copy.deepcopy(model.state_dict())
+            if checkpoint_path:
+                torch.save({'epoch': epoch, 'val_loss': val_loss, 'state_dict': best_state}, checkpoint_path)
+        elif patience is not None and epoch - best_epoch >= patience:
+            stopped_early = True
+            if verbose:
+                print(f"Stopping early: no validation improvement for {patience} epochs")
+            break
+        if on_epoch is not None and on_epoch(epoch, train_loss, val_loss):
+            stopped_by_callback = True
+            break
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    model.eval()
+    return {
+        'train_losses': train_losses,
+        'val_losses': val_losses,
+        'best_epoch': best_epoch,
+        'best_val_loss': best_val_loss,
+        'stopped_early': stopped_early,
+        'stopped_by_callback': stopped_by_callback,
+    }
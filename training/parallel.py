@@ -0,0 +1,78 @@
+'''
+Train several strain/hyperparameter configurations at once across a process pool.
+
+Each job trains one TransferModel in its own worker process. torch parallelizes a single model
+across every core by default, so running several workers as-is would oversubscribe the CPU. Every
+worker therefore pins torch to `torch_threads` intra-op threads (default: the cores divided evenly
+between the workers) and a single inter-op thread before it trains anything.
+
+Workers are started with the spawn method so they never inherit the parent's OpenMP state or
+pooled database connections. The finished models are stored as artifacts; only their metadata is
+sent back to the parent.
+
+Jobs that name only a table read its local snapshot (database/snapshot.py), which every worker
+memory-maps from the same page-cached files instead of receiving a pickled copy of the rows.
+
+Usage:
+    jobs = [{'table': 'c3h_hej_data'},
+            {'table': 'c57_6j_data', 'hyperparams': {'lr': 0.0005}}]
+    results = train_parallel(jobs)
+'''
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation.profiling import profiled
+
+
+def default_thread_split(processes):
+    """Number of torch threads per worker so processes * threads matches the core count."""
+    return max(1, (os.cpu_count() or 1) // processes)
+
+
+def limit_torch_threads(threads):
+    """Pin torch (and the OpenMP/BLAS libraries below it) to `threads` threads in this process."""
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before the first parallel torch operation of the process
+        pass
+
+
+def _train_job(job):
+    from database.snapshot import load_snapshot
+    from models.transfer_model import train_artifact
+
+    # Without explicit rows the worker memory-maps the table's local snapshot
+    data = job['data'] if 'data' in job else load_snapshot(job['table'])
+    # PROFILE=1 is inherited by the workers, so each job writes its own profile
+    with profiled(f"train-{job.get('table') or 'rows'}"):
+        _, _, _, metadata = train_artifact(data, table_name=job.get('table'),
+                                           use_cache=job.get('use_cache', True),
+                                           checkpoint_path=job.get('checkpoint_path'),
+                                           verbose=False, **job.get('hyperparams', {}))
+    return metadata
+
+
+def train_parallel(jobs, processes=None, torch_threads=None):
+    """Train every job in a process pool and return the artifact metadata of each, in job order.
+
+    A job is a dict with 'table' and optionally 'data' (rows of ensembl_id, bsl_0days_avg, ...six
+    outputs; defaults to the table's local snapshot), 'hyperparams', 'use_cache' and 'checkpoint_path'.
+    """
+    if not jobs:
+        return []
+    processes = processes or min(len(jobs), os.cpu_count() or 1)
+    torch_threads = torch_threads or default_thread_split(processes)
+    if processes == 1:
+        limit_torch_threads(torch_threads)
+        return [_train_job(job) for job in jobs]
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=limit_torch_threads, initargs=(torch_threads,)) as executor:
+        return list(executor.map(_train_job, jobs))
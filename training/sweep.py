@@ -0,0 +1,238 @@
+'''
+Hyperparameter sweeps for TransferModel across a process pool.
+
+The data of a strain is loaded, scaled and split once in the parent. Its tensors are moved to
+shared memory and handed to every worker when the pool starts, so the trials read one copy of the
+data instead of each fetching and preprocessing it again. Each worker trains one trial at a time
+with a single torch thread, so a sweep keeps every core busy.
+
+A search space maps hyperparameter names to a list of choices, or for random search also to
+{"log_uniform": [low, high]}:
+    {"hidden_sizes": [[32, 64], [64, 128]], "lr": {"log_uniform": [0.0001, 0.01]}, "batch_size": [128, 256]}
+Grid search trains every combination of the lists; random search samples `trials` configurations.
+
+Trials are pruned once their validation loss is more than prune_ratio times the best validation
+loss any trial reached by the same epoch (after `warmup` epochs). The results are written as a CSV
+table to SWEEP_DIR (default: models/sweeps/) and the best complete trial is stored as a regular
+model artifact. It is only served by predictor.py once promoted, with --promote or through
+models.artifacts.promote_artifact().
+
+Usage:
+    python -m training.sweep c57_6j_data --search random --trials 40 --space space.json
+'''
+import argparse
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+SWEEP_DIR = os.getenv("SWEEP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'sweeps'))
+
+DEFAULT_SPACE = {
+    'hidden_sizes': [[32, 64], [64, 128], [128, 256], [64, 128, 64]],
+    'lr': [0.0003, 0.001, 0.003],
+    'batch_size': [128, 256, 1024],
+    'epochs': [100],
+}
+
+RESULT_COLUMNS = ['trial', 'status', 'hidden_sizes', 'lr', 'batch_size', 'epochs', 'patience', 'epochs_run',
+                  'best_epoch', 'best_val_loss', 'test_loss', 'seconds']
+
+# Set in each worker by _init_worker
+_shared = {}
+
+
+def grid_configs(space):
+    """Every combination of the choices in space."""
+    for name, choices in space.items():
+        if not isinstance(choices, list):
+            raise ValueError(f"Grid search needs a list of choices for {name}")
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, trials, seed=0):
+    """trials configurations sampled from space; {"log_uniform": [low, high]} is sampled on a log scale."""
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(trials):
+        config = {}
+        for name, choices in space.items():
+            if isinstance(choices, dict):
+                low, high = choices['log_uniform']
+                config[name] = math.exp(rng.uniform(math.log(low), math.log(high)))
+            else:
+                config[name] = rng.choice(choices)
+        configs.append(config)
+    return configs
+
+
+def _init_worker(tensors, best_at_epoch, prune_ratio, warmup, torch_threads):
+    from training.parallel import limit_torch_threads
+
+    limit_torch_threads(torch_threads)
+    _shared.update(tensors=tensors, best_at_epoch=best_at_epoch, prune_ratio=prune_ratio, warmup=warmup)
+
+
+def _run_trial(trial):
+    import torch
+
+    from models.transfer_model import TransferModel, evaluate
+    from training.engine import fit
+
+    X_train, y_train, X_val, y_val, X_test, y_test = _shared['tensors']
+    best_at_epoch = _shared['best_at_epoch']
+    hyperparams = trial['hyperparams']
+
+    def prune(epoch, train_loss, val_loss):
+        if epoch >= len(best_at_epoch):
+            return False
+        with best_at_epoch.get_lock():
+            best = best_at_epoch[epoch]
+            best_at_epoch[epoch] = min(best, val_loss)
+        # A trial in its last epoch has already trained in full, so it is never counted as pruned
+        last_epoch = epoch == hyperparams['epochs'] - 1
+        return epoch >= _shared['warmup'] and not last_epoch and val_loss > _shared['prune_ratio'] * best
+
+    started = time.perf_counter()
+    torch.manual_seed(hyperparams['random_state'])
+    model = TransferModel(hyperparams['hidden_sizes'])
+    history = fit(model, X_train, y_train, X_val, y_val, epochs=hyperparams['epochs'], lr=hyperparams['lr'],
+                  batch_size=hyperparams['batch_size'], patience=hyperparams['patience'],
+                  seed=hyperparams['random_state'], verbose=False, on_epoch=prune)
+    pruned = history['stopped_by_callback']
+    return {
+        'trial': trial['trial'],
+        'status': 'pruned' if pruned else 'complete',
+        'hyperparams': hyperparams,
+        'history': history,
+        'epochs_run': len(history['train_losses']),
+        'test_loss': None if pruned else evaluate(model, X_test, y_test),
+        'seconds': time.perf_counter() - started,
+        # numpy arrays travel back to the parent without holding shared memory open
+        'state_dict': None if pruned else {name: value.numpy().copy() for name, value in model.state_dict().items()},
+    }
+
+
+def write_results(results, path):
+    """Write the results table as CSV, best validation loss first."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(RESULT_COLUMNS)
+        for result in sorted(results, key=lambda r: r['history']['best_val_loss']):
+            hyperparams = result['hyperparams']
+            writer.writerow([result['trial'], result['status'], json.dumps(hyperparams['hidden_sizes']),
+                             hyperparams['lr'], hyperparams['batch_size'], hyperparams['epochs'],
+                             hyperparams['patience'], result['epochs_run'], result['history']['best_epoch'],
+                             result['history']['best_val_loss'], result['test_loss'], round(result['seconds'], 3)])
+
+
+def run_sweep(data, configs, table_name=None, processes=None, prune_ratio=1.5, warmup=5, results_path=None,
+              verbose=True, promote=False, random_state=None):
+    """Train one trial per configuration and store the best complete trial as a model artifact.
+
+    data is a Snapshot or rows of (ensembl_id, bsl_0days_avg, ...six outputs). Each configuration
+    overrides DEFAULT_HYPERPARAMS except random_state: the data is split once for every trial, with
+    random_state (default: DEFAULT_HYPERPARAMS['random_state']), which is also the seed of each trial
+    and part of its artifact key. With promote the best trial becomes the served model of
+    table_name. Returns (results, metadata of the stored artifact or None).
+    """
+    import torch
+
+    from models.artifacts import artifact_key, data_key, promote_artifact
+    from models.transfer_model import (DEFAULT_HYPERPARAMS, TransferModel, data_version, prepare_data, split_data,
+                                       store_artifact)
+
+    if any('random_state' in config for config in configs):
+        raise ValueError("random_state cannot be swept: every trial shares one split of the data; "
+                         "pass random_state to run_sweep() instead")
+    if random_state is None:
+        random_state = DEFAULT_HYPERPARAMS['random_state']
+
+    ids, values = prepare_data(data)
+    input_scaler, output_scaler, tensors = split_data(values, random_state)
+    for tensor in tensors:
+        tensor.share_memory_()
+    trials = [{'trial': i, 'hyperparams': dict(DEFAULT_HYPERPARAMS, **config, random_state=random_state)}
+              for i, config in enumerate(configs)]
+    max_epochs = max((trial['hyperparams']['epochs'] for trial in trials), default=0)
+
+    processes = processes or min(len(trials), os.cpu_count() or 1) or 1
+    context = multiprocessing.get_context('spawn')
+    best_at_epoch = context.Array('d', [math.inf] * max_epochs)
+    initargs = (tensors, best_at_epoch, prune_ratio, warmup, max(1, (os.cpu_count() or 1) // processes))
+    results = []
+    if processes == 1:
+        _init_worker(*initargs)
+        results = [_run_trial(trial) for trial in trials]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                 initializer=_init_worker, initargs=initargs) as executor:
+            for result in executor.map(_run_trial, trials):
+                results.append(result)
+                if verbose:
+                    print(f"Trial {result['trial']}: {result['status']} after {result['epochs_run']} epochs, "
+                          f"best validation loss {result['history']['best_val_loss']:.5f}")
+
+    results_path = results_path or os.path.join(SWEEP_DIR,
+                                                f"{table_name or 'rows'}-{time.strftime('%Y%m%d-%H%M%S')}.csv")
+    write_results(results, results_path)
+    if verbose:
+        print(f"Wrote {len(results)} trials to {results_path}")
+
+    complete = [result for result in results if result['status'] == 'complete']
+    if not complete:
+        return results, None
+    best = min(complete, key=lambda result: result['history']['best_val_loss'])
+    model = TransferModel(best['hyperparams']['hidden_sizes'])
+    model.load_state_dict({name: torch.from_numpy(value) for name, value in best['state_dict'].items()})
+    model.eval()
+    # Same key as train_artifact() would use, so the best trial is found like any other trained model
+    metadata = store_artifact(artifact_key(ids, values, best['hyperparams']), model, input_scaler, output_scaler,
+                              dict(best['history'], table=table_name, hyperparams=best['hyperparams'],
+                                   rows=len(ids), test_loss=best['test_loss'], sweep=results_path,
+                                   data_key=data_key(ids, values), data_version=data_version(data)))
+    if verbose:
+        print(f"Best trial {best['trial']} ({best['hyperparams']}) saved as artifact {metadata['key']}")
+    if promote and table_name:
+        promote_artifact(table_name, metadata['key'])
+        if verbose:
+            print(f"{table_name} now serves artifact {metadata['key']}")
+    return results, metadata
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search TransferModel hyperparameters for one strain table.")
+    parser.add_argument('table', help="strain table, e.g. c57_6j_data")
+    parser.add_argument('--search', choices=('grid', 'random'), default='grid')
+    parser.add_argument('--trials', type=int, default=20, help="configurations sampled by random search")
+    parser.add_argument('--space', help="JSON file with the search space (default: DEFAULT_SPACE)")
+    parser.add_argument('--processes', type=int, help="worker processes (default: one per core)")
+    parser.add_argument('--prune-ratio', type=float, default=1.5, help="prune trials this much worse than the best")
+    parser.add_argument('--warmup', type=int, default=5, help="epochs before a trial can be pruned")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random search")
+    parser.add_argument('--random-state', type=int, help="seed of the data split and of every trial")
+    parser.add_argument('--promote', action='store_true', help="serve the best trial's model for the table")
+    args = parser.parse_args(argv)
+
+    from database.snapshot import ensure_snapshot
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as file:
+            space = json.load(file)
+    configs = grid_configs(space) if args.search == 'grid' else random_configs(space, args.trials, args.seed)
+    print(f"Running {len(configs)} trials on {args.table}")
+    run_sweep(ensure_snapshot(args.table), configs, table_name=args.table, processes=args.processes,
+              prune_ratio=args.prune_ratio, warmup=args.warmup, promote=args.promote,
+              random_state=args.random_state)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+'''
+JSON API of the webapp.
+
+Gene profiles are served from an in-process GeneCache so hot genes do not go to RDS on every hit.
+Responses carry an ETag and Last-Modified derived from the dataset_versions stamps, so clients can
+revalidate with If-None-Match / If-Modified-Since and get a 304 without a body. Cache misses are
+fetched with one concurrent query per strain when asyncpg is installed (database/async_db.py), or
+else with a single query over every strain. Errors are answered as {"error": description} JSON with
+the HTTP status, never as HTML pages.
+
+Cache settings come from the environment: GENE_CACHE_SIZE, GENE_CACHE_TTL and
+GENE_CACHE_VERSION_CHECK (seconds between dataset_versions checks).
+'''
+import os
+
+from flask import Blueprint, abort, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from analysis.differential import CONTRASTS, DIRECTIONS, get_results, invalidate_results
+from analysis.similarity import SIMILARITY_METRICS, get_index, invalidate_indexes
+from database.async_db import available as async_db_available, get_async_db
+from database.db_connector import connection
+from database.genes import fetch_gene_profiles, fetch_gene_profiles_concurrently
+from database.readers import fetch_page
+from database.strains import STRAINS
+from database.versions import add_listener
+from instrumentation.metrics import count
+from webapp.gene_cache import GeneCache
+from webapp.ingest import jobs
+
+# Upper bound on ids accepted by the bulk lookup
+MAX_BULK_IDS = 500
+
+# Upper bound on values or ids accepted by one prediction request
+MAX_PREDICT_BATCH = 50000
+
+# Largest number of genes returned by one top-k analysis query
+MAX_TOP_GENES = 1000
+
+# Default and largest number of genes returned by one similarity query
+DEFAULT_SIMILAR_GENES = 10
+MAX_SIMILAR_GENES = 200
+
+# Default and largest page size of the table browser
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_MISSING = object()
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+gene_cache = GeneCache(maxsize=int(os.getenv("GENE_CACHE_SIZE", "4096")),
+                       ttl=float(os.getenv("GENE_CACHE_TTL", "300")),
+                       version_check_interval=float(os.getenv("GENE_CACHE_VERSION_CHECK", "5")))
+add_listener(gene_cache.invalidate)
+add_listener(invalidate_results)
+add_listener(invalidate_indexes)
+
+STRAIN_TABLES = [config['table'] for config in STRAINS.values()]
+
+
+@api.errorhandler(HTTPException)
+def json_error(e):
+    """Answer aborts and other HTTP errors of the API as JSON."""
+    return jsonify(error=e.description), e.code
+
+
+def lookup_genes(ensembl_ids):
+    """Return {ensembl_id: profile or None}, fetching the ids that are not cached.
+
+    Cached ids are answered without touching the database; a psycopg2 connection is only borrowed
+    when the dataset_versions check is due. Misses are fetched with one concurrent asyncpg query per
+    strain when asyncpg is available, otherwise with one psycopg2 query over every strain.
+    """
+    if gene_cache.version_check_due():
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                gene_cache.refresh_versions(cursor)
+    results = {}
+    misses = []
+    for ensembl_id in ensembl_ids:
+        profile = gene_cache.entries.get(ensembl_id, _MISSING)
+        if profile is _MISSING:
+            misses.append(ensembl_id)
+        else:
+            results[ensembl_id] = profile
+    count('sbm_gene_cache_lookups_total', len(results), result='hit')
+    if not misses:
+        return results
+
+    count('sbm_gene_cache_lookups_total', len(misses), result='miss')
+    if async_db_available():
+        # One query per strain, all in flight at once, on the asyncpg pool only
+        fetched = fetch_gene_profiles_concurrently(get_async_db(), misses)
+    else:
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                fetched = fetch_gene_profiles(cursor, misses)
+    for ensembl_id in misses:
+        # Unknown ids are cached as None so repeated misses stay cheap too
+        profile = fetched.get(ensembl_id)
+        gene_cache.entries.set(ensembl_id, profile)
+        results[ensembl_id] = profile
+    return results
+
+
+def conditional_json(payload, key):
+    """jsonify payload with validators, answering 304 when the client's copy is current."""
+    response = jsonify(payload)
+    response.set_etag(gene_cache.etag(key))
+    last_modified = gene_cache.last_modified(STRAIN_TABLES)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@api.route('/gene/<ensembl_id>')
+def gene(ensembl_id):
+    profile = lookup_genes([ensembl_id])[ensembl_id]
+    if profile is None:
+        abort(404, description=f"Unknown ensembl_id {ensembl_id}")
+    return conditional_json({'ensembl_id': ensembl_id, 'strains': profile}, ensembl_id)
+
+
+@api.route('/gene/<ensembl_id>/similar')
+def similar_genes(ensembl_id):
+    """Genes with the most similar expression profiles: ?k=10&strain=c57_6j&metric=pearson"""
+    strains = [request.args['strain']] if request.args.get('strain') else list(STRAINS)
+    if any(strain not in STRAINS for strain in strains):
+        abort(400, description=f"strain must be one of {', '.join(STRAINS)}")
+    metric = request.args.get('metric', SIMILARITY_METRICS[0])
+    if metric not in SIMILARITY_METRICS:
+        abort(400, description=f"metric must be one of {', '.join(SIMILARITY_METRICS)}")
+    try:
+        k = min(int(request.args.get('k', DEFAULT_SIMILAR_GENES)), MAX_SIMILAR_GENES)
+    except ValueError:
+        abort(400, description="k must be an integer")
+    if k < 1:
+        abort(400, description="k must be positive")
+
+    indexes = {strain: get_index(strain, metric) for strain in strains}
+    building = [strain for strain, index in indexes.items() if index is None]
+    if building:
+        abort(503, description=f"The {metric} similarity index of {', '.join(building)} is still being built")
+    results = {}
+    for strain, index in indexes.items():
+        if ensembl_id in index:
+            results[strain] = index.similar(ensembl_id, k)
+    if not results:
+        abort(404, description=f"No comparable expression profile for {ensembl_id}")
+    return jsonify({'ensembl_id': ensembl_id, 'metric': metric, 'k': k, 'strains': results})
+
+
+@api.route('/genes')
+def genes():
+    ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()]
+    if not ids:
+        abort(400, description="Pass a comma separated list of ensembl ids as ?ids=")
+    if len(ids) > MAX_BULK_IDS:
+        abort(400, description=f"At most {MAX_BULK_IDS} ids can be looked up at once")
+    ids = list(dict.fromkeys(ids))
+    profiles = lookup_genes(ids)
+    payload = {
+        'genes': [{'ensembl_id': i, 'strains': profiles[i]} for i in ids if profiles[i] is not None],
+        'missing': [i for i in ids if profiles[i] is None],
+    }
+    return conditional_json(payload, tuple(ids))
+
+
+@api.route('/tables/<strain>')
+def table_page(strain):
+    """One keyset-paginated page of a strain table: ?after=<ensembl_id>&limit=&columns=a,b"""
+    if strain not in STRAINS:
+        abort(404, description=f"Unknown strain {strain}")
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        abort(400, description="limit must be an integer")
+    if limit < 1:
+        abort(400, description="limit must be positive")
+    columns = [c for c in request.args.get('columns', '').split(',') if c] or None
+
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                rows, next_after = fetch_page(cursor, STRAINS[strain]['table'], request.args.get('after'),
+                                              limit, columns)
+            except ValueError as e:
+                abort(400, description=str(e))
+            names = [desc[0] for desc in cursor.description]
+    return jsonify({
+        'strain': strain,
+        'rows': [dict(zip(names, row)) for row in rows],
+        'next_after': next_after,
+    })
+
+
+@api.route('/predict', methods=['POST'])
+def predict():
+    """Batch prediction for {"strain": ..., "bsl_values": [...]} or {"strain": ..., "ensembl_ids": [...]}."""
+    # torch is only imported once a prediction is actually requested
+    from models.predictor import get_predictor
+    from models.transfer_model import OUTPUT_COLUMNS
+
+    body = request.get_json(silent=True) or {}
+    strain = body.get('strain')
+    if strain not in STRAINS:
+        abort(400, description=f"strain must be one of {', '.join(STRAINS)}")
+    bsl_values = body.get('bsl_values')
+    ensembl_ids = body.get('ensembl_ids')
+    if (bsl_values is None) == (ensembl_ids is None):
+        abort(400, description="Pass exactly one of bsl_values or ensembl_ids")
+    batch = bsl_values if bsl_values is not None else ensembl_ids
+    if not isinstance(batch, list) or len(batch) > MAX_PREDICT_BATCH:
+        abort(400, description=f"Pass a list of at most {MAX_PREDICT_BATCH} items")
+
+    try:
+        predictor = get_predictor(strain)
+    except FileNotFoundError as e:
+        abort(503, description=str(e))
+
+    if bsl_values is not None:
+        try:
+            predictions = predictor.predict(bsl_values)
+        except (TypeError, ValueError):
+            abort(400, description="bsl_values must be numbers")
+        return jsonify({'strain': strain, 'columns': OUTPUT_COLUMNS, 'predictions': predictions.tolist()})
+
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            ids, predictions, missing = predictor.predict_ids(cursor, STRAINS[strain]['table'], ensembl_ids)
+    return jsonify({
+        'strain': strain,
+        'columns': OUTPUT_COLUMNS,
+        'predictions': [{'ensembl_id': i, 'values': p} for i, p in zip(ids, predictions.tolist())],
+        'missing': missing,
+    })
+
+
+@api.route('/analysis/top')
+def analysis_top():
+    """Top up/down-regulated genes: ?group=c3h_hej&contrast=flt_vs_gc_25days&direction=up&n=20"""
+    try:
+        results = get_results()
+    except Exception as e:
+        print("Failed to load analysis results: {}".format(e))
+        abort(503, description="The analysis results are not available right now")
+    group = request.args.get('group', next(iter(STRAINS)))
+    contrast = request.args.get('contrast', next(iter(CONTRASTS)))
+    direction = request.args.get('direction', 'up')
+    if group not in results.groups:
+        abort(400, description=f"group must be one of {', '.join(results.groups)}")
+    if contrast not in CONTRASTS:
+        abort(400, description=f"contrast must be one of {', '.join(CONTRASTS)}")
+    if direction not in DIRECTIONS:
+        abort(400, description="direction must be up or down")
+    try:
+        n = min(int(request.args.get('n', 20)), MAX_TOP_GENES)
+    except ValueError:
+        abort(400, description="n must be an integer")
+    if n < 1:
+        abort(400, description="n must be positive")
+    return jsonify({
+        'group': group,
+        'contrast': contrast,
+        'direction': direction,
+        'genes': results.top(group, contrast, n, direction),
+    })
+
+
+@api.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.status(job_id)
+    if job is None:
+        abort(404, description=f"Unknown job {job_id}")
+    return jsonify(job)
@@ -1,54 +1,95 @@
 import os
-import psycopg2
-from flask import Flask, render_template
+import sys
+
+from flask import Flask, jsonify, render_template, request, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analysis.differential import CONTRASTS, get_results
+from database.db_connector import connection
+from database.strains import STRAINS
+from webapp.api import api, json_error
+from webapp.ingest import KINDS, UploadRequest, discard_unclaimed_uploads, discard_upload, jobs
+from webapp.monitoring import init_app as init_monitoring
 
 app = Flask(__name__)
+# Uploaded files are written to disk while the request body is parsed, never kept in memory
+app.request_class = UploadRequest
+app.teardown_request(discard_unclaimed_uploads)
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+app.register_blueprint(api)
+# Request latency metrics at /metrics (METRICS_ENABLED) and ?profile=1 profiling (PROFILE_REQUESTS)
+init_monitoring(app)
 
-def connect_to_database():
-    conn = None
-    cursor = None
-    try:
-        conn = psycopg2.connect(host=os.getenv("DB_HOST"),
-                                port=os.getenv("DB_PORT"),
-                                database=os.getenv("DB_NAME"),
-                                user=os.getenv("DB_USER"),
-                                password=os.getenv("DB_PASSWORD"))
-        cursor = conn.cursor()
-        print("Connected")
-    except Exception as e:
-        print("Connection failed: {}".format(e))
-        print("Exception message: {}".format(e))
-    return conn, cursor
+def upload_limit():
+    """MAX_CONTENT_LENGTH as shown to users, e.g. 2.0 GB."""
+    limit = app.config['MAX_CONTENT_LENGTH']
+    return f"{limit / 1024 ** 3:.1f} GB" if limit >= 1024 ** 3 else f"{limit / 1024 ** 2:.1f} MB"
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    # JSON like the API errors, so the upload form can show the limit
+    e.description = f"The file is larger than the upload limit of {upload_limit()}"
+    return json_error(e)
 
 @app.route('/database')
 def database():
-    conn, cursor = connect_to_database()
-    if cursor is not None:
-        try:
-            cursor.execute("SELECT * FROM c57_6j_data WHERE ensembl_id = 'ENSMUSG00000000031'")
-            rows = cursor.fetchall()
-        except Exception as e:
-            print("Failed to fetch data: {}".format(e))
-            rows = []
-        finally:
-            cursor.close()
-            conn.close()
-            print("Connection closed")
-        return str(rows)
-    else:
+    # Connections are borrowed from the shared pool and returned after the query
+    try:
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT * FROM c57_6j_data WHERE ensembl_id = 'ENSMUSG00000000031'")
+                rows = cursor.fetchall()
+    except Exception as e:
+        print("Failed to fetch data: {}".format(e))
         return "Failed to connect to the database"
+    return str(rows)
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/upload')
+@app.route('/upload', methods=['GET', 'POST'])
 def upload():
-    return render_template('upload.html')
+    if request.method == 'GET':
+        return render_template('upload.html', strains=list(STRAINS), upload_limit=upload_limit())
+
+    # The file is already on disk at this point; ingestion runs in the background
+    file = request.files.get('file')
+    kind = request.form.get('kind', 'raw')
+    strain = request.form.get('strain') or None
+    error = None
+    if file is None or not file.filename:
+        error = "Choose a CSV file to upload"
+    elif kind not in KINDS:
+        error = f"kind must be one of {', '.join(KINDS)}"
+    elif kind == 'processed' and strain not in STRAINS:
+        error = f"Processed uploads need a strain, one of {', '.join(STRAINS)}"
+    if error:
+        if file is not None:
+            discard_upload(file)
+        return jsonify({'error': error}), 400
+
+    job_id = jobs.submit(file, kind, strain)
+    return jsonify({'job_id': job_id, 'status_url': url_for('api.job_status', job_id=job_id)}), 202
 
 @app.route('/analysis')
 def analysis():
-    return render_template('analysis.html')
+    # The rankings are precomputed, so the page only slices the top genes of the chosen contrast
+    try:
+        results = get_results()
+    except Exception as e:
+        print("Failed to load analysis results: {}".format(e))
+        return render_template('analysis.html', error="The analysis results are not available right now.")
+    group = request.args.get('group', next(iter(results.groups)))
+    contrast = request.args.get('contrast', next(iter(CONTRASTS)))
+    if group not in results.groups or contrast not in CONTRASTS:
+        return render_template('analysis.html', error="Unknown group or contrast."), 400
+    return render_template('analysis.html', groups=list(results.groups), contrasts=list(CONTRASTS),
+                           group=group, contrast=contrast,
+                           up=results.top(group, contrast, 10, 'up'),
+                           down=results.top(group, contrast, 10, 'down'))
 
 @app.route('/about')
 def about():
@@ -0,0 +1,100 @@
+'''
+In-process cache for gene profile lookups.
+
+Entries live in an LRU cache with a time-to-live. On top of that, the cache remembers the
+dataset_versions stamps it was filled under; the stamps are re-read from the database at most once
+every version_check_interval seconds, and any change empties the cache. Loaders running inside the
+webapp process also clear it immediately through database.versions.data_changed().
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from database.versions import fetch_versions
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after they were stored."""
+
+    def __init__(self, maxsize=4096, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GeneCache:
+    """TTLCache of gene profiles that is emptied whenever the data tables change version."""
+
+    def __init__(self, maxsize=4096, ttl=300, version_check_interval=5):
+        self.entries = TTLCache(maxsize, ttl)
+        self.version_check_interval = version_check_interval
+        self._versions = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _check_due(self):
+        return self._versions is None or time.monotonic() - self._checked_at >= self.version_check_interval
+
+    def version_check_due(self):
+        """Whether the next lookup has to re-read dataset_versions before trusting the entries."""
+        with self._lock:
+            return self._check_due()
+
+    def refresh_versions(self, cursor):
+        """Re-read dataset_versions if the last check is too old, clearing the cache on change."""
+        with self._lock:
+            if not self._check_due():
+                return self._versions
+        versions = fetch_versions(cursor)
+        with self._lock:
+            if versions != self._versions:
+                self.entries.clear()
+                self._versions = versions
+            self._checked_at = time.monotonic()
+            return versions
+
+    def invalidate(self, tables=None):
+        """Drop every cached entry and force a version check on the next request."""
+        with self._lock:
+            self.entries.clear()
+            self._versions = None
+
+    def etag(self, key):
+        """Entity tag for key under the current data versions."""
+        stamp = repr((key, sorted((self._versions or {}).items())))
+        return hashlib.sha1(stamp.encode('utf-8')).hexdigest()
+
+    def last_modified(self, tables):
+        """Latest updated_at among tables, or None if none of them has a version yet."""
+        stamps = [self._versions[table][1] for table in tables if table in (self._versions or {})]
+        return max(stamps) if stamps else None
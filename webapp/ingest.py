@@ -0,0 +1,178 @@
+'''
+Large-file uploads and background ingestion jobs.
+
+UploadRequest makes the multipart parser write uploaded files straight into UPLOAD_DIR in small
+chunks, so an upload of any size is never held in memory and never copied a second time. The upload
+route then only queues a job and returns; a small worker pool runs the chunked preprocessing
+(preprocessing/pipeline.py) and the COPY-based load (preprocessing/bulk_loader.py) in the background.
+Request threads never wait for ingestion, and each job reports its stage and progress through
+/api/jobs/<job_id>.
+
+Settings come from the environment: UPLOAD_DIR, INGEST_WORKERS and INGEST_CHUNK_SIZE (rows per chunk).
+'''
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Request, request
+
+from database.db_connector import connection
+from database.strains import STRAINS
+from database.versions import data_changed
+from preprocessing.bulk_loader import load_strain_csv
+from preprocessing.pipeline import output_filename, preprocess
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'raw', 'uploads'))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))
+
+# Finished jobs kept for status queries
+MAX_FINISHED_JOBS = 100
+
+KINDS = ('raw', 'processed')
+
+
+class UploadRequest(Request):
+    """Request whose uploaded files are spooled directly into UPLOAD_DIR instead of memory.
+
+    Only the endpoints in SPOOL_ENDPOINTS spool to UPLOAD_DIR; other routes keep the default
+    in-memory/temporary file handling. Every spooled path is recorded in spooled_paths so
+    discard_unclaimed_uploads() can delete the ones the view did not keep.
+    """
+
+    SPOOL_ENDPOINTS = ('upload',)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in self.SPOOL_ENDPOINTS:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        stream = tempfile.NamedTemporaryFile('w+b', dir=UPLOAD_DIR, prefix='upload-', suffix='.part', delete=False)
+        self.__dict__.setdefault('spooled_paths', []).append(stream.name)
+        return stream
+
+
+def discard_unclaimed_uploads(exception=None):
+    """teardown_request hook deleting spooled files that were not moved into a job.
+
+    Covers rejected uploads, extra file fields and requests aborted while the body was parsed.
+    """
+    for path in getattr(request, 'spooled_paths', ()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # moved into its job directory by keep_upload() or deleted by discard_upload()
+
+
+def keep_upload(file_storage, job_dir):
+    """Move an uploaded file into job_dir without copying its contents when possible."""
+    os.makedirs(job_dir, exist_ok=True)
+    path = os.path.join(job_dir, 'upload.csv')
+    stream = file_storage.stream
+    spooled_path = getattr(stream, 'name', None)
+    if isinstance(spooled_path, str) and os.path.exists(spooled_path):
+        stream.close()
+        os.replace(spooled_path, path)
+    else:
+        file_storage.save(path, buffer_size=1024 * 1024)
+    return path
+
+
+def discard_upload(file_storage):
+    """Delete the spooled file of an upload that is not going to be ingested."""
+    stream = file_storage.stream
+    spooled_path = getattr(stream, 'name', None)
+    stream.close()
+    if isinstance(spooled_path, str) and os.path.exists(spooled_path):
+        os.remove(spooled_path)
+
+
+class JobManager:
+    """Runs ingestion jobs on a worker pool and keeps their status."""
+
+    def __init__(self, workers=INGEST_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def submit(self, file_storage, kind='raw', strain=None):
+        """Store the uploaded file and queue its ingestion. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(UPLOAD_DIR, job_id)
+        path = keep_upload(file_storage, job_dir)
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                'id': job_id,
+                'filename': file_storage.filename,
+                'kind': kind,
+                'status': 'queued',
+                'stage': None,
+                'rows': 0,
+                'message': None,
+                'results': [],
+                'created_at': time.time(),
+                'finished_at': None,
+            }
+        self._executor.submit(self._run, job_id, job_dir, path, kind, strain)
+        return job_id
+
+    def _prune(self):
+        finished = sorted((job['finished_at'], job_id) for job_id, job in self._jobs.items() if job['finished_at'])
+        for _, job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _run(self, job_id, job_dir, path, kind, strain):
+        self._update(job_id, status='running')
+        try:
+            if kind == 'raw':
+                self._update(job_id, stage='preprocessing', rows=0)
+                outputs = preprocess(path, job_dir, INGEST_CHUNK_SIZE,
+                                     progress=lambda rows: self._update(job_id, rows=rows))
+                files = {}
+                for strain_key, config in STRAINS.items():
+                    output = outputs.get(strain_key)
+                    if output and output_filename(strain_key) == config['filename']:
+                        files[strain_key] = output
+            else:
+                files = {strain: path}
+            if not files:
+                raise ValueError("The upload does not contain any strain hosted in the database")
+
+            tables = []
+            for strain_key, output in files.items():
+                config = STRAINS[strain_key]
+                self._update(job_id, stage=f"loading {config['table']}", rows=0)
+                with connection() as conn:
+                    with conn.cursor() as cursor:
+                        result = load_strain_csv(cursor, output, config, INGEST_CHUNK_SIZE,
+                                                 progress=lambda rows: self._update(job_id, rows=rows))
+                tables.append(config['table'])
+                with self._lock:
+                    self._jobs[job_id]['results'].append({
+                        'table': result['table'],
+                        'rows_read': result['rows_read'],
+                        'inserted': result['inserted'],
+                        'skipped': len(result['skipped_ids']),
+                    })
+            data_changed(tables)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            self._update(job_id, status='done', stage=None, finished_at=time.time())
+        except Exception as e:
+            # The uploaded file is kept in job_dir so a failed job can be inspected
+            self._update(job_id, status='failed', message=str(e), finished_at=time.time())
+
+
+jobs = JobManager()
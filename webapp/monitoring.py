@@ -0,0 +1,75 @@
+'''
+Request metrics and on-demand profiling for the webapp.
+
+init_app() times every request into sbm_http_request_seconds (labelled by route rule, method and
+status) and every template render into sbm_stage_seconds{stage="render"}, and serves all metrics at
+/metrics in the Prometheus text format. Metrics are only recorded with METRICS_ENABLED set.
+
+With PROFILE_REQUESTS set, adding ?profile=1 (or ?profile=pyinstrument) to any URL profiles that
+request and writes the report to PROFILE_DIR; the path is returned in the X-Profile-Path header.
+'''
+import os
+import time
+
+from flask import Response, current_app, g, request
+from jinja2 import Template
+
+from instrumentation import metrics
+from instrumentation.profiling import Profile
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class TimedTemplate(Template):
+    """Jinja template that records how long each render takes."""
+
+    def render(self, *args, **kwargs):
+        with metrics.timer('sbm_stage_seconds', stage='render'):
+            return super().render(*args, **kwargs)
+
+
+def _start_request():
+    if metrics.enabled():
+        g.request_started = time.perf_counter()
+    if current_app.config['PROFILE_REQUESTS'] and request.args.get('profile'):
+        profiler = 'pyinstrument' if request.args['profile'] == 'pyinstrument' else 'cprofile'
+        g.profile = Profile(profiler)
+        g.profile.start()
+
+
+def _finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        response.headers['X-Profile-Path'] = profile.save(request.endpoint or 'unmatched')
+    g.response_status = response.status_code
+    return response
+
+
+def _teardown_request(exception=None):
+    # Runs even when the view raised and after_request was skipped, so the profiler is always
+    # released and failed requests are timed too (as status 500)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        profile.save(request.endpoint or 'unmatched')
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The rule, not the URL, keeps label cardinality bounded (/api/gene/<ensembl_id>)
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('sbm_http_request_seconds', time.perf_counter() - started,
+                        route=route, method=request.method, status=g.pop('response_status', 500))
+
+
+def metrics_view():
+    return Response(metrics.render_prometheus(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+
+def init_app(app):
+    """Register the request hooks, template timing and the /metrics endpoint on app."""
+    app.config.setdefault('PROFILE_REQUESTS', os.getenv("PROFILE_REQUESTS", "").lower() in ('1', 'true', 'yes'))
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    app.jinja_env.template_class = TimedTemplate
+    app.add_url_rule('/metrics', 'metrics', metrics_view)